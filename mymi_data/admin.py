@@ -1,13 +1,31 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from django.conf import settings
-from django.db.models import Count
-import os
+from django.db.models import Count, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
 from .models import (
     OrganSystem, Species, Staining, Subject, Institution, 
     TileServer, Image, Exploration, Annotation, AnnotationGroup, 
-    Diagnosis, StructureSearch, Locale
+    Diagnosis, StructureSearch, Locale, ThumbnailFile, ThumbnailAtlasEntry
 )
+from .storage import thumbnail_storage
+
+
+def local_thumbnail_url(filename, stored_name=None):
+    """
+    URL of a thumbnail in media/thumbnails/ if the thumbnail manifest records it as stored there.
+
+    `stored_name` can be passed in when already known, e.g. from an
+    annotation, to save the manifest query; '' means not stored locally.
+    """
+    if not filename:
+        return None
+    if stored_name is None:
+        stored_name = ThumbnailFile.objects.filter(filename=filename, is_local=True).values_list(
+            'stored_name', flat=True
+        ).first() or ''
+    if stored_name:
+        return thumbnail_storage().url(stored_name)
+    return None
 
 
 @admin.register(OrganSystem)
@@ -100,20 +118,42 @@ class ImageAdmin(admin.ModelAdmin):
                       'staining', 'species', 'tile_server', 'tags', 'deleted_at')
     filter_horizontal = ('organ_systems',)
     
-    def get_local_thumbnail_path(self, filename):
+    def get_queryset(self, request):
+        """
+        Look up in the same query under which name the thumbnails are stored locally, '' if not.
+
+        The atlas positions of the small thumbnails are prefetched for the
+        whole page in one more query, page atlases first as they match the
+        default order.
+        """
+        queryset = super().get_queryset(request).prefetch_related(Prefetch(
+            'atlas_entries', queryset=ThumbnailAtlasEntry.objects.select_related('atlas').order_by('-atlas__kind')
+        ))
+        return queryset.annotate(**{
+            f'{field}_stored': Coalesce(Subquery(
+                ThumbnailFile.objects.filter(filename=OuterRef(field), is_local=True).values('stored_name')[:1]
+            ), Value(''))
+            for field in ('thumbnail_small', 'thumbnail_medium', 'thumbnail_large')
+        })
+    
+    def get_local_thumbnail_path(self, filename, stored_name=None):
         """Check if thumbnail exists locally in media/thumbnails/"""
-        if not filename:
-            return None
-        local_path = os.path.join(settings.MEDIA_ROOT, 'thumbnails', filename)
-        if os.path.exists(local_path):
-            return f"{settings.MEDIA_URL}thumbnails/{filename}"
-        return None
+        return local_thumbnail_url(filename, stored_name)
     
     def thumbnail_preview(self, obj):
-        """Small thumbnail for list view"""
+        """Small thumbnail for list view, cut out of a thumbnail atlas if one was built"""
+        atlas_entries = obj.atlas_entries.all()
+        if atlas_entries:
+            entry = atlas_entries[0]
+            return format_html(
+                '<span style="display: inline-block; width: {}px; height: {}px; '
+                'background: url({}) -{}px -{}px no-repeat;"></span>',
+                entry.width, entry.height, entry.atlas.url, entry.x, entry.y
+            )
+        
         local_url = None
         if obj.thumbnail_small:
-            local_url = self.get_local_thumbnail_path(obj.thumbnail_small)
+            local_url = self.get_local_thumbnail_path(obj.thumbnail_small, getattr(obj, 'thumbnail_small_stored', None))
         
         if local_url:
             return format_html('<img src="{}" style="max-height: 50px; max-width: 80px;" />', local_url)
@@ -126,7 +166,7 @@ class ImageAdmin(admin.ModelAdmin):
         """Small thumbnail for detail view"""
         local_url = None
         if obj.thumbnail_small:
-            local_url = self.get_local_thumbnail_path(obj.thumbnail_small)
+            local_url = self.get_local_thumbnail_path(obj.thumbnail_small, getattr(obj, 'thumbnail_small_stored', None))
         
         # Determine which image to show (prefer local)
         display_url = local_url if local_url else obj.thumbnail_small_url
@@ -152,7 +192,7 @@ class ImageAdmin(admin.ModelAdmin):
         """Medium thumbnail for detail view"""
         local_url = None
         if obj.thumbnail_medium:
-            local_url = self.get_local_thumbnail_path(obj.thumbnail_medium)
+            local_url = self.get_local_thumbnail_path(obj.thumbnail_medium, getattr(obj, 'thumbnail_medium_stored', None))
         
         # Determine which image to show (prefer local)
         display_url = local_url if local_url else obj.thumbnail_medium_url
@@ -178,7 +218,7 @@ class ImageAdmin(admin.ModelAdmin):
         """Large thumbnail for detail view"""
         local_url = None
         if obj.thumbnail_large:
-            local_url = self.get_local_thumbnail_path(obj.thumbnail_large)
+            local_url = self.get_local_thumbnail_path(obj.thumbnail_large, getattr(obj, 'thumbnail_large_stored', None))
         
         # Determine which image to show (prefer local)
         display_url = local_url if local_url else obj.thumbnail_large_url
@@ -307,16 +347,12 @@ class ExplorationAdmin(admin.ModelAdmin):
     search_fields = ('title', 'edu_id')
     readonly_fields = ('id', 'title', 'is_active', 'image', 'institution', 'annotation_group_count', 
                       'annotation_count', 'is_exam', 'edu_id', 'mymi_link_display', 'image_thumbnail_display', 
-                      'tags', 'deleted_at', 'type', 'annotations_by_groups_display')
+                      'tags', 'deleted_at', 'type', 'annotations_payload', 'annotation_groups_payload',
+                      'annotations_by_groups_display')
     
-    def get_local_thumbnail_path(self, filename):
+    def get_local_thumbnail_path(self, filename, stored_name=None):
         """Check if thumbnail exists locally in media/thumbnails/"""
-        if not filename:
-            return None
-        local_path = os.path.join(settings.MEDIA_ROOT, 'thumbnails', filename)
-        if os.path.exists(local_path):
-            return f"{settings.MEDIA_URL}thumbnails/{filename}"
-        return None
+        return local_thumbnail_url(filename, stored_name)
     
     def mymi_link_display(self, obj):
         """Display MyMi link as clickable link"""
@@ -503,14 +539,9 @@ class StructureSearchAdmin(admin.ModelAdmin):
               'annotation_group_count', 'annotation_count', 'solution_image', 'solution_image_display',
               'mymi_link_display', 'image_thumbnail_display', 'tags', 'deleted_at', 'type', 'subjects')
     
-    def get_local_thumbnail_path(self, filename):
+    def get_local_thumbnail_path(self, filename, stored_name=None):
         """Check if thumbnail exists locally in media/thumbnails/"""
-        if not filename:
-            return None
-        local_path = os.path.join(settings.MEDIA_ROOT, 'thumbnails', filename)
-        if os.path.exists(local_path):
-            return f"{settings.MEDIA_URL}thumbnails/{filename}"
-        return None
+        return local_thumbnail_url(filename, stored_name)
     
     def mymi_link_display(self, obj):
         """Display MyMi link as clickable link"""
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import tempfile
+import aiohttp
+
+
+MYMI_BASE_URL = 'https://mymi.uni-ulm.de'
+DEFAULT_CONCURRENCY = 8
+REQUEST_TIMEOUT = 60
+STREAM_CHUNK_SIZE = 64 * 1024
+# Response bodies larger than this are spooled to a temporary file instead of memory
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class FetchError(Exception):
+    """A MyMi API request returned an unusable response"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def annotation_urls(base_url, exploration_id):
+    """Return the (annotations, annotation groups) endpoint URLs of an exploration"""
+    return (
+        f'{base_url}/api/exploration/{exploration_id}/annotation/annotation',
+        f'{base_url}/api/exploration/{exploration_id}/annotation/annotation-group',
+    )
+
+
+def thumbnail_file_url(base_url, filename):
+    return f'{base_url}/assets/thumbnails/{filename}'
+
+
+def create_session(jwt_token, concurrency=DEFAULT_CONCURRENCY, cookies=None, headers=None):
+    """
+    Create an HTTP session authenticated with a MyMi JWT or other `cookies`.
+
+    All requests share one keep-alive connection pool of at most
+    `concurrency` connections.
+    """
+    cookies = dict(cookies or {})
+    if jwt_token:
+        cookies['mymi_jwt'] = jwt_token
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60)
+    return aiohttp.ClientSession(
+        connector=connector,
+        cookies=cookies,
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+    )
+
+
+def payload_digest(*digests):
+    """SHA-256 over the body digests of an exploration's responses"""
+    return hashlib.sha256(''.join(digests).encode()).hexdigest()
+
+
+class FetchResult:
+    """
+    Outcome of one conditional MyMi API request.
+
+    `body` is a binary file positioned at the start of the response body
+    while the body is needed, that is for changed responses, and None
+    otherwise. For 304 Not Modified the `digest` is taken from the cache
+    entry. `changed` tells whether the body differs from the cached one,
+    `cache_outdated` whether the cache entry needs to be written.
+    """
+
+    def __init__(self, url, status, body, digest, etag, last_modified, cached=None):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.changed = status != 304 and (cached is None or cached.body_digest != digest)
+        self.cache_outdated = status != 304 and (
+            self.changed or (etag, last_modified) != (cached.etag, cached.last_modified)
+        )
+
+    def close(self):
+        if self.body is not None:
+            self.body.close()
+            self.body = None
+
+
+async def fetch_body(session, limiter, url, label, cached=None):
+    """
+    GET `url` through `limiter`, raising FetchError on failure.
+
+    With a `cached` HttpCacheEntry the request is conditional. The body is
+    streamed into a spooled temporary file and hashed on the way, so large
+    responses never have to be held in memory as a whole.
+    """
+    headers = cached.conditional_headers() if cached else {}
+    async with limiter.get_async(session, url, headers=headers) as response:
+        if response.status == 304 and cached:
+            return FetchResult(url, 304, None, cached.body_digest, cached.etag, cached.last_modified, cached)
+        if response.status != 200:
+            raise FetchError(f'Failed to fetch {label}: HTTP {response.status}', response.status)
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        digest = hashlib.sha256()
+        try:
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                digest.update(chunk)
+                body.write(chunk)
+        except BaseException:
+            body.close()
+            raise
+        body.seek(0)
+        result = FetchResult(
+            url, 200, body, digest.hexdigest(),
+            response.headers.get('ETag', ''), response.headers.get('Last-Modified', ''), cached,
+        )
+    if not result.changed:
+        result.close()
+    return result
+
+
+async def fetch_exploration(session, limiter, base_url, exploration_id, cache=None):
+    """
+    Fetch the annotations and annotation groups of an exploration concurrently.
+
+    `cache` maps URLs to HttpCacheEntry objects used for conditional
+    requests. Returns the two FetchResults.
+    """
+    cache = cache or {}
+    annotations_url, groups_url = annotation_urls(base_url, exploration_id)
+    results = await asyncio.gather(
+        fetch_body(session, limiter, annotations_url, 'annotations', cache.get(annotations_url)),
+        fetch_body(session, limiter, groups_url, 'annotation groups', cache.get(groups_url)),
+        return_exceptions=True,
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        # Do not leave the spooled body of the other request behind
+        for result in results:
+            if isinstance(result, FetchResult):
+                result.close()
+        raise errors[0]
+    return results
+
+
+class CrawlItem:
+    """One exploration on its way from a fetcher to the database writer"""
+
+    def __init__(self, exploration):
+        self.exploration = exploration
+        self.attempted_at = None
+        self.duration_ms = None
+        self.annotations = None
+        self.groups = None
+        self.error = None
+        self.status = None
+
+    def changed(self):
+        """(payload field name, FetchResult) of the responses that changed, groups first"""
+        results = (('annotation_groups_payload', self.groups), ('annotations_payload', self.annotations))
+        return [(field, result) for field, result in results if result is not None and result.changed]
+
+    def close(self):
+        for result in (self.annotations, self.groups):
+            if result is not None:
+                result.close()
+
+    @property
+    def http_status(self):
+        if self.error:
+            return self.status
+        return 304 if self.annotations.status == self.groups.status == 304 else 200
+
+    @property
+    def payload_digest(self):
+        return payload_digest(self.annotations.digest, self.groups.digest)
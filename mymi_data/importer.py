@@ -0,0 +1,621 @@
+import hashlib
+import json
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from mymi_data.jsonstream import iter_object
+from mymi_data.models import (
+    OrganSystem, Species, Staining, Subject, Institution,
+    TileServer, Image, Exploration, Diagnosis, StructureSearch, Locale,
+    ImportSnapshot, ImportRecordDigest
+)
+
+
+DEFAULT_BATCH_SIZE = 500
+
+# Snapshot sections in dependency order, mapped to their SnapshotImporter method
+SECTIONS = (
+    ('organsystems', 'import_organ_systems'),
+    ('species', 'import_species'),
+    ('stainings', 'import_stainings'),
+    ('subjects', 'import_subjects'),
+    ('institutions', 'import_institutions'),
+    ('tileservers', 'import_tile_servers'),
+    ('images', 'import_images'),
+    ('explorations', 'import_explorations'),
+    ('diagnoses', 'import_diagnoses'),
+    ('structureSearches', 'import_structure_searches'),
+    ('locales', 'import_locales'),
+)
+
+# Table each snapshot section is written to
+SECTION_MODELS = {
+    'organsystems': OrganSystem,
+    'species': Species,
+    'stainings': Staining,
+    'subjects': Subject,
+    'institutions': Institution,
+    'tileservers': TileServer,
+    'images': Image,
+    'explorations': Exploration,
+    'diagnoses': Diagnosis,
+    'structureSearches': StructureSearch,
+    'locales': Locale,
+}
+
+# Sections each section references, which have to be imported before it
+SECTION_DEPENDENCIES = {
+    'organsystems': (),
+    'species': (),
+    'stainings': (),
+    'subjects': (),
+    'institutions': (),
+    'tileservers': ('institutions',),
+    'images': ('organsystems', 'species', 'stainings', 'tileservers'),
+    'explorations': ('images', 'institutions', 'subjects'),
+    'diagnoses': ('images', 'institutions'),
+    'structureSearches': ('images', 'institutions', 'subjects'),
+    'locales': (),
+}
+
+# Tables written by an import, in dependency order, and the many-to-many relations among them
+IMPORTED_MODELS = (
+    OrganSystem, Species, Staining, Subject, Institution, TileServer,
+    Image, Exploration, Diagnosis, StructureSearch, Locale, ImportRecordDigest,
+)
+IMPORTED_M2M_FIELDS = (
+    (Image, 'organ_systems'),
+    (Exploration, 'subjects'),
+    (StructureSearch, 'subjects'),
+)
+
+# Sections that can grow with the dataset and are parsed item by item in streaming mode
+STREAMED_SECTIONS = ('images', 'explorations', 'diagnoses', 'structureSearches')
+
+
+def chunked(items, size):
+    """Yield successive lists of at most `size` items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_dependency_graph(keys, dependencies, func, workers):
+    """
+    Call `func(key)` for every key, at most `workers` at a time.
+
+    A key is started as soon as all of its dependencies that are part of
+    `keys` have finished. The first exception stops scheduling new keys and
+    is re-raised once the running ones have finished.
+    """
+    keys = list(keys)
+    remaining = {key: {dep for dep in dependencies[key] if dep in keys} for key in keys}
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while remaining or running:
+            for key in [key for key, deps in remaining.items() if not deps]:
+                del remaining[key]
+                running[executor.submit(func, key)] = key
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = running.pop(future)
+                future.result()
+                for deps in remaining.values():
+                    deps.discard(key)
+
+
+def section_items(key, value):
+    """Return the records of a snapshot section as a list of dicts, or None if malformed"""
+    if key == 'locales':
+        if not isinstance(value, dict):
+            return None
+        return [{'key': k, 'value': v} for k, v in value.items()]
+    return value
+
+
+def record_key(key, item):
+    """Return the identifier of a snapshot record"""
+    return item['key'] if key == 'locales' else item['id']
+
+
+def record_digest(item):
+    """Return a stable content digest of a snapshot record"""
+    payload = json.dumps(item, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SnapshotImporter:
+    """
+    Bulk import engine for MyMi JSON snapshots.
+
+    Every referenced table is loaded once into an in-memory id map, and each
+    section is written with batched `bulk_create(update_conflicts=True)`
+    upserts, so the number of queries grows with the number of batches
+    instead of the number of rows.
+    """
+
+    def __init__(self, stdout, style, batch_size=DEFAULT_BATCH_SIZE):
+        self.stdout = stdout
+        self.style = style
+        self.batch_size = batch_size
+        self.id_maps = {}
+        # In streaming mode images are resolved per chunk instead of being loaded all at once
+        self.bounded = False
+        # When set, all writes go to this StagingArea instead of the live tables
+        self.staging = None
+
+    def known_ids(self, model):
+        """Return the set of primary keys of `model`, loading it on first use"""
+        if model not in self.id_maps:
+            ids = set(model.objects.values_list('pk', flat=True))
+            if self.staging:
+                ids |= self.staging.pks(model)
+            self.id_maps[model] = ids
+        return self.id_maps[model]
+
+    def preload(self, model, pks):
+        """In bounded mode, limit the id map of `model` to the rows matching `pks`"""
+        if self.bounded:
+            pks = set(pks)
+            self.id_maps[model] = set()
+            for batch in chunked(pks, self.batch_size):
+                self.id_maps[model].update(
+                    model.objects.filter(pk__in=batch).values_list('pk', flat=True)
+                )
+                if self.staging:
+                    self.id_maps[model] |= self.staging.pks(model, batch)
+
+    def resolve(self, model, pk):
+        """Return `pk` if a row of `model` with that key exists, else None"""
+        if pk and pk in self.known_ids(model):
+            return pk
+        return None
+
+    def resolve_all(self, model, pks):
+        """Return those of `pks` for which a row of `model` exists"""
+        return [pk for pk in pks or [] if self.resolve(model, pk)]
+
+    def bulk_upsert(self, model, objs, update_fields, unique_fields=('id',)):
+        """Insert or update `objs` in batches and register their keys in the id map"""
+        for batch in chunked(objs, self.batch_size):
+            if self.staging:
+                self.staging.upsert(model, batch, update_fields, unique_fields)
+            else:
+                model.objects.bulk_create(
+                    batch,
+                    batch_size=self.batch_size,
+                    update_conflicts=True,
+                    unique_fields=list(unique_fields),
+                    update_fields=list(update_fields),
+                )
+            if model in self.id_maps:
+                self.id_maps[model].update(obj.pk for obj in batch)
+
+    def sync_m2m(self, model, field_name, desired):
+        """
+        Make a many-to-many relation match `desired` for the given owners.
+
+        `desired` maps owner primary keys to their related primary keys. The
+        current through rows of those owners are read in batches and only the
+        difference is applied, with one bulk delete and one bulk insert.
+        """
+        if self.staging:
+            self.staging.stage_m2m(model, field_name, desired)
+            return
+
+        field = model._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = through._meta.get_field(field.m2m_field_name()).attname
+        target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+
+        existing = {}
+        for batch in chunked(desired, self.batch_size):
+            rows = through.objects.filter(**{f'{source}__in': batch}).values_list('pk', source, target)
+            for pk, owner, related in rows:
+                existing[(owner, related)] = pk
+        wanted = {(owner, related) for owner, related_pks in desired.items() for related in related_pks}
+
+        stale = [pk for key, pk in existing.items() if key not in wanted]
+        if stale:
+            through.objects.filter(pk__in=stale).delete()
+        missing = [through(**{source: owner, target: related}) for owner, related in wanted - existing.keys()]
+        if missing:
+            through.objects.bulk_create(missing, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def run(self, data, force=False):
+        """Import all sections present in `data` in dependency order"""
+        for key, handler in SECTIONS:
+            if key not in data:
+                continue
+            items = section_items(key, data[key])
+            if items is None:
+                continue
+            self.import_section(key, getattr(self, handler), items, force=force)
+
+    def run_parallel(self, data, workers, force=False):
+        """
+        Import the sections of `data` concurrently along their dependencies.
+
+        Every section runs in its own thread, database connection and
+        transaction, and starts as soon as the sections it references have
+        committed.
+        """
+        stages = {}
+        for key, handler in SECTIONS:
+            if key in data:
+                items = section_items(key, data[key])
+                if items is not None:
+                    stages[key] = (getattr(self, handler), items)
+
+        def run_stage(key):
+            handler, items = stages[key]
+            try:
+                with transaction.atomic():
+                    self.import_section(key, handler, items, force=force)
+            finally:
+                connection.close()
+
+        # The id maps need no locking: a section only reads the maps of the
+        # sections it depends on, and those have finished before it starts.
+        run_dependency_graph(stages, SECTION_DEPENDENCIES, run_stage, workers)
+
+    def import_section(self, key, handler, items, force=False):
+        """Run `handler` on the records of a section whose digest changed"""
+        digests = {record_key(key, item): record_digest(item) for item in items}
+        if not force:
+            # A digest only counts while its row exists, so rows deleted since are imported again
+            exists = Exists(SECTION_MODELS[key].objects.filter(pk=OuterRef('record_id')))
+            stored = {}
+            for batch in chunked(digests, self.batch_size):
+                stored.update(
+                    ImportRecordDigest.objects.filter(exists, section=key, record_id__in=batch)
+                    .values_list('record_id', 'digest')
+                )
+            unchanged = {pk for pk, digest in digests.items() if stored.get(pk) == digest}
+            if unchanged:
+                self.stdout.write(f'Skipping {len(unchanged)} unchanged {key}')
+                items = [item for item in items if record_key(key, item) not in unchanged]
+        if not items:
+            return []
+
+        written = handler(items)
+
+        # Handlers return only the records written with all their references resolved, so
+        # skipped records and records whose references are not imported yet are retried
+        self.bulk_upsert(
+            ImportRecordDigest,
+            [ImportRecordDigest(section=key, record_id=pk, digest=digests[pk]) for pk in written],
+            ['digest', 'updated_at'],
+            unique_fields=('section', 'record_id'),
+        )
+        return written
+
+    def run_stream(self, fp, chunk_size, force=False):
+        """
+        Import a snapshot from the text stream `fp` with bounded memory.
+
+        Large sections are parsed item by item and committed every
+        `chunk_size` records. Small sections are buffered until the
+        sections they reference are imported. A large section that shows
+        up before all of its dependencies is spilled to a temporary file
+        and replayed at the end.
+
+        Returns a (snapshot hash, imported) tuple. If the hash is read
+        before any record and matches the last import, nothing is imported.
+        """
+        self.bounded = True
+        snapshot_hash = None
+        pending = {}
+        spilled = {}
+        done = set()
+
+        def ready(key):
+            return all(dep in done for dep in SECTION_DEPENDENCIES[key])
+
+        def flush_pending(final=False):
+            for key, _handler in SECTIONS:
+                if key in pending and (final or ready(key)):
+                    items = pending.pop(key)
+                    if items is not None:
+                        self.import_chunks(key, items, chunk_size, force)
+                    done.add(key)
+
+        try:
+            for key, value in iter_object(fp, stream_keys=STREAMED_SECTIONS):
+                if key == 'hash':
+                    snapshot_hash = value
+                    if not force and not done and self.is_current(snapshot_hash):
+                        self.stdout.write(self.style.SUCCESS(
+                            f'Snapshot {snapshot_hash} is already imported, nothing to do'
+                        ))
+                        return snapshot_hash, False
+                    continue
+                if key not in SECTION_DEPENDENCIES:
+                    continue
+                if key in STREAMED_SECTIONS and not isinstance(value, list):
+                    if ready(key):
+                        flush_pending()
+                    if ready(key):
+                        self.import_chunks(key, value, chunk_size, force)
+                        done.add(key)
+                    else:
+                        spilled[key] = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+                        for item in value:
+                            spilled[key].write(json.dumps(item) + '\n')
+                else:
+                    pending[key] = section_items(key, value)
+                flush_pending()
+
+            flush_pending(final=True)
+            for key, _handler in SECTIONS:
+                if key in spilled:
+                    spilled[key].seek(0)
+                    self.import_chunks(key, (json.loads(line) for line in spilled[key]), chunk_size, force)
+        finally:
+            for spill in spilled.values():
+                spill.close()
+        return snapshot_hash, True
+
+    def import_chunks(self, key, items, chunk_size, force=False):
+        """Import a section in chunks of `chunk_size` records, one transaction each"""
+        handler = getattr(self, dict(SECTIONS)[key])
+        for chunk in chunked(items, chunk_size):
+            with transaction.atomic():
+                self.import_section(key, handler, chunk, force=force)
+
+    def is_current(self, snapshot_hash):
+        """Return True if `snapshot_hash` is the hash of the last imported snapshot"""
+        if not snapshot_hash:
+            return False
+        last = ImportSnapshot.objects.order_by('-imported_at').first()
+        return last is not None and last.hash == snapshot_hash
+
+    def record_snapshot(self, snapshot_hash, source=''):
+        """Remember `snapshot_hash` as the last imported snapshot"""
+        if snapshot_hash:
+            ImportSnapshot.objects.create(hash=snapshot_hash, source=source)
+
+    def import_titled(self, model, items, label):
+        """Import a simple id/title dimension table"""
+        self.stdout.write(f'Importing {len(items)} {label}...')
+        objs = [model(id=item['id'], title=item['title']) for item in items]
+        self.bulk_upsert(model, objs, ['title'])
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(objs)} {label}'))
+        return [obj.pk for obj in objs]
+
+    def import_organ_systems(self, items):
+        return self.import_titled(OrganSystem, items, 'organ systems')
+
+    def import_species(self, items):
+        return self.import_titled(Species, items, 'species')
+
+    def import_stainings(self, items):
+        return self.import_titled(Staining, items, 'stainings')
+
+    def import_subjects(self, items):
+        return self.import_titled(Subject, items, 'subjects')
+
+    def import_institutions(self, items):
+        self.stdout.write(f'Importing {len(items)} institutions...')
+        objs = [
+            Institution(
+                id=item['id'],
+                title=item['title'],
+                short_title=item.get('shortTitle', ''),
+                acronym=item.get('acronym', ''),
+                introduction=item.get('introduction', ''),
+                logo_url=item.get('logoUrl', ''),
+                small_logo_url=item.get('smallLogoUrl', ''),
+            )
+            for item in items
+        ]
+        self.bulk_upsert(Institution, objs, [
+            'title', 'short_title', 'acronym', 'introduction', 'logo_url', 'small_logo_url',
+        ])
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(objs)} institutions'))
+        return [obj.pk for obj in objs]
+
+    def import_tile_servers(self, items):
+        self.stdout.write(f'Importing {len(items)} tile servers...')
+        objs = []
+        for item in items:
+            institution_id = self.resolve(Institution, item['institutionId'])
+            if institution_id is None:
+                self.stdout.write(
+                    self.style.WARNING(f'Institution {item["institutionId"]} not found for tile server {item["id"]}')
+                )
+                continue
+            objs.append(TileServer(
+                id=item['id'],
+                title=item['title'],
+                institution_id=institution_id,
+                public_urls=item.get('publicUrls', []),
+            ))
+        self.bulk_upsert(TileServer, objs, ['title', 'institution', 'public_urls'])
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(objs)} tile servers'))
+        return [obj.pk for obj in objs]
+
+    def import_images(self, items):
+        self.stdout.write(f'Importing {len(items)} images...')
+        objs = []
+        organ_systems = {}
+        incomplete = set()
+        for item in items:
+            try:
+                image = Image(
+                    id=item['id'],
+                    title=item['title'],
+                    checksum=item['checksum'],
+                    size=int(item['size']),
+                    file_path=item['filePath'],
+                    thumbnail_small=item.get('thumbnailSmall', ''),
+                    thumbnail_medium=item.get('thumbnailMedium', ''),
+                    thumbnail_large=item.get('thumbnailLarge', ''),
+                    state=item.get('state', 'active'),
+                    imaging_diagnostic=item['imagingDiagnostic'],
+                    staining_id=self.resolve(Staining, item.get('stainingId')),
+                    species_id=self.resolve(Species, item.get('specieId')),
+                    tile_server_id=self.resolve(TileServer, item.get('tileserverId')),
+                    tags=item.get('tags', []),
+                    deleted_at=item.get('deletedAt'),
+                )
+                organ_systems[item['id']] = self.resolve_all(OrganSystem, item.get('organsystemIds'))
+                objs.append(image)
+            except Exception as e:
+                self.stdout.write(
+                    self.style.WARNING(f'Error importing image {item.get("id")}: {e}')
+                )
+                continue
+            if (
+                (item.get('stainingId') and image.staining_id is None)
+                or (item.get('specieId') and image.species_id is None)
+                or (item.get('tileserverId') and image.tile_server_id is None)
+                or len(organ_systems[image.pk]) < len(item.get('organsystemIds') or [])
+            ):
+                incomplete.add(image.pk)
+
+        self.bulk_upsert(Image, objs, [
+            'title', 'checksum', 'size', 'file_path', 'thumbnail_small', 'thumbnail_medium',
+            'thumbnail_large', 'state', 'imaging_diagnostic', 'staining', 'species',
+            'tile_server', 'tags', 'deleted_at',
+        ])
+
+        self.sync_m2m(Image, 'organ_systems', {obj.pk: organ_systems[obj.pk] for obj in objs})
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(objs)} images'))
+        self.warn_incomplete(incomplete, 'images')
+        return [obj.pk for obj in objs if obj.pk not in incomplete]
+
+    def warn_incomplete(self, pks, label):
+        """Report records imported with references to rows that do not exist yet"""
+        if pks:
+            self.stdout.write(self.style.WARNING(
+                f'{len(pks)} {label} reference missing rows and are imported again next time'
+            ))
+
+    def resolve_image_and_institution(self, item, label):
+        """Return the (image_id, institution_id) pair of `item`, or None with a warning"""
+        image_id = self.resolve(Image, item['imageId'])
+        institution_id = self.resolve(Institution, item['institutionId'])
+        if image_id is None or institution_id is None:
+            missing = 'Image' if image_id is None else 'Institution'
+            self.stdout.write(
+                self.style.WARNING(f'Error importing {label} {item["id"]}: {missing} matching query does not exist.')
+            )
+            return None
+        return image_id, institution_id
+
+    def import_explorations(self, items):
+        self.stdout.write(f'Importing {len(items)} explorations...')
+        objs = []
+        self.preload(Image, [item['imageId'] for item in items])
+        subjects = {}
+        incomplete = set()
+        for item in items:
+            refs = self.resolve_image_and_institution(item, 'exploration')
+            if refs is None:
+                continue
+            objs.append(Exploration(
+                id=item['id'],
+                title=item['title'],
+                is_active=item['isActive'],
+                image_id=refs[0],
+                institution_id=refs[1],
+                annotation_group_count=item.get('annotationGroupCount', 0),
+                annotation_count=item.get('annotationCount', 0),
+                is_exam=item['isExam'],
+                edu_id=item.get('eduId', ''),
+                tags=item.get('tags', []),
+                deleted_at=item.get('deletedAt'),
+                type=item.get('type', 'exploration'),
+            ))
+            subjects[item['id']] = self.resolve_all(Subject, item.get('subjectIds'))
+            if len(subjects[item['id']]) < len(item.get('subjectIds') or []):
+                incomplete.add(item['id'])
+
+        # annotations_payload/annotation_groups_payload belong to the crawler and are left untouched
+        self.bulk_upsert(Exploration, objs, [
+            'title', 'is_active', 'image', 'institution', 'annotation_group_count',
+            'annotation_count', 'is_exam', 'edu_id', 'tags', 'deleted_at', 'type',
+        ])
+
+        self.sync_m2m(Exploration, 'subjects', {obj.pk: subjects[obj.pk] for obj in objs})
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(objs)} explorations'))
+        self.warn_incomplete(incomplete, 'explorations')
+        return [obj.pk for obj in objs if obj.pk not in incomplete]
+
+    def import_diagnoses(self, items):
+        self.stdout.write(f'Importing {len(items)} diagnoses...')
+        objs = []
+        self.preload(Image, [item['imageId'] for item in items])
+        for item in items:
+            refs = self.resolve_image_and_institution(item, 'diagnosis')
+            if refs is None:
+                continue
+            objs.append(Diagnosis(
+                id=item['id'],
+                is_active=item['isActive'],
+                image_id=refs[0],
+                institution_id=refs[1],
+                is_exam=item['isExam'],
+                deleted_at=item.get('deletedAt'),
+                type=item.get('type', 'diagnosis'),
+            ))
+        self.bulk_upsert(Diagnosis, objs, [
+            'is_active', 'image', 'institution', 'is_exam', 'deleted_at', 'type',
+        ])
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(objs)} diagnoses'))
+        return [obj.pk for obj in objs]
+
+    def import_structure_searches(self, items):
+        self.stdout.write(f'Importing {len(items)} structure searches...')
+        objs = []
+        self.preload(Image, [item['imageId'] for item in items])
+        subjects = {}
+        incomplete = set()
+        for item in items:
+            refs = self.resolve_image_and_institution(item, 'structure search')
+            if refs is None:
+                continue
+            objs.append(StructureSearch(
+                id=item['id'],
+                title=item['title'],
+                is_active=item['isActive'],
+                image_id=refs[0],
+                institution_id=refs[1],
+                is_exam=item['isExam'],
+                annotation_group_count=item.get('annotationGroupCount', 0),
+                annotation_count=item.get('annotationCount', 0),
+                tags=item.get('tags', []),
+                deleted_at=item.get('deletedAt'),
+                type=item.get('type', 'structure-search'),
+            ))
+            subjects[item['id']] = self.resolve_all(Subject, item.get('subjectIds'))
+            if len(subjects[item['id']]) < len(item.get('subjectIds') or []):
+                incomplete.add(item['id'])
+
+        # solution_image is maintained in the admin and is never overwritten by an import
+        self.bulk_upsert(StructureSearch, objs, [
+            'title', 'is_active', 'image', 'institution', 'is_exam', 'annotation_group_count',
+            'annotation_count', 'tags', 'deleted_at', 'type',
+        ])
+
+        self.sync_m2m(StructureSearch, 'subjects', {obj.pk: subjects[obj.pk] for obj in objs})
+
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(objs)} structure searches'))
+        self.warn_incomplete(incomplete, 'structure searches')
+        return [obj.pk for obj in objs if obj.pk not in incomplete]
+
+    def import_locales(self, items):
+        self.stdout.write(f'Importing {len(items)} locales...')
+        objs = [Locale(key=item['key'], value=item['value']) for item in items]
+        self.bulk_upsert(Locale, objs, ['value'], unique_fields=('key',))
+        self.stdout.write(self.style.SUCCESS(f'Imported {len(objs)} locales'))
+        return [obj.pk for obj in objs]
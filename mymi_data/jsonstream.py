@@ -0,0 +1,246 @@
+import codecs
+import gzip
+import io
+import json
+
+
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+WHITESPACE = ' \t\n\r'
+NUMBER_START = '-0123456789'
+NUMBER_CHARS = '0123456789.eE+-'
+
+_decoder = json.JSONDecoder()
+
+
+def open_text(path, encoding='utf-8'):
+    """Open a JSON file for reading, transparently decompressing gzip and zstd input"""
+    raw = open(path, 'rb')
+    magic = raw.peek(4)[:4]
+    if magic.startswith(GZIP_MAGIC):
+        stream = gzip.GzipFile(fileobj=raw)
+    elif magic == ZSTD_MAGIC:
+        try:
+            import zstandard
+        except ImportError:
+            raw.close()
+            raise ImportError('Reading zstd-compressed files requires the zstandard package')
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    else:
+        stream = raw
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
+def skip_whitespace(text, pos):
+    """Return the index of the first non-whitespace character at or after `pos`"""
+    while pos < len(text) and text[pos] in WHITESPACE:
+        pos += 1
+    return pos
+
+
+def may_continue(text, start, end):
+    """Whether the value decoded from text[start:end] is a number that the text after `end` may extend"""
+    if text[start] not in NUMBER_START:
+        return False
+    return all(char in NUMBER_CHARS for char in text[end:])
+
+
+class ArrayItemDecoder:
+    """
+    Incrementally decode the items of a JSON array from text chunks.
+
+    Feed text with `feed()`; every call returns the items completed so far.
+    Only the item currently being decoded is kept in the buffer. After the
+    closing bracket, `done` is True and `buffer` holds the unconsumed rest.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.state = 'start'
+        self.retry_size = 0
+
+    @property
+    def done(self):
+        return self.state == 'done'
+
+    def feed(self, text, final=False):
+        buf = self.buffer + text
+        pos = 0
+        items = []
+        while not self.done:
+            pos = skip_whitespace(buf, pos)
+            if pos == len(buf):
+                break
+            char = buf[pos]
+            if self.state == 'start':
+                if char != '[':
+                    raise json.JSONDecodeError('Expecting array', buf, pos)
+                pos += 1
+                self.state = 'first'
+            elif self.state in ('first', 'separator') and char == ']':
+                pos += 1
+                self.state = 'done'
+            elif self.state == 'separator':
+                if char != ',':
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+                pos += 1
+                self.state = 'value'
+            else:
+                # Re-decode an incomplete item only after the buffer doubled, keeping this linear
+                if not final and len(buf) - pos < self.retry_size:
+                    break
+                try:
+                    item, end = _decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    self.retry_size = 2 * (len(buf) - pos)
+                    break
+                if not final and may_continue(buf, pos, end):
+                    # A number at the end of the buffer, e.g. `12.`, may continue in the next chunk
+                    break
+                items.append(item)
+                pos = end
+                self.retry_size = 0
+                self.state = 'separator'
+
+        self.buffer = buf[pos:]
+        if final and not self.done:
+            raise json.JSONDecodeError('Unterminated array', buf, len(buf))
+        return items
+
+
+class _Reader:
+    """Buffered text reader that grows its read size with the value being decoded"""
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def read_more(self):
+        if self.eof:
+            return False
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.fp.read(max(self.chunk_size, len(self.buffer)))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it, or '' at EOF"""
+        while True:
+            self.pos = skip_whitespace(self.buffer, self.pos)
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars or not char:
+            raise json.JSONDecodeError(f'Expecting one of {chars!r}', self.buffer, self.pos)
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Decode and consume one complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                if self.eof or not may_continue(self.buffer, self.pos, end):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.read_more()
+
+    def iter_array(self):
+        """Lazily decode the items of the array starting at the current position"""
+        decoder = ArrayItemDecoder()
+        text, self.buffer, self.pos = self.buffer[self.pos:], '', 0
+        while True:
+            yield from decoder.feed(text, final=self.eof)
+            if decoder.done:
+                break
+            text = self.fp.read(self.chunk_size)
+            if not text:
+                self.eof = True
+        self.buffer = decoder.buffer
+
+
+def iter_object(fp, stream_keys=(), chunk_size=CHUNK_SIZE):
+    """
+    Yield the (key, value) members of the top-level JSON object in `fp`.
+
+    Array values of `stream_keys` are yielded as lazy iterators over their
+    items instead of lists, so only one item at a time has to be in memory.
+    Such an iterator must be consumed before advancing to the next member;
+    any items left over are skipped.
+    """
+    reader = _Reader(fp, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(':')
+        if key in stream_keys and reader.peek() == '[':
+            items = reader.iter_array()
+            yield key, items
+            for _ in items:
+                pass
+        else:
+            yield key, reader.decode()
+        if reader.expect(',}') == '}':
+            return
+
+
+def _iter_array(fp, text_decoder, text, chunk_size):
+    decoder = ArrayItemDecoder()
+    final = False
+    while True:
+        yield from decoder.feed(text, final=final)
+        if decoder.done:
+            break
+        chunk = fp.read(chunk_size)
+        final = not chunk
+        text = text_decoder.decode(chunk, final=final)
+
+    rest = decoder.buffer
+    while not rest.strip(WHITESPACE) and not final:
+        chunk = fp.read(chunk_size)
+        final = not chunk
+        rest = text_decoder.decode(chunk, final=final)
+    if rest.strip(WHITESPACE):
+        raise json.JSONDecodeError('Extra data', rest, skip_whitespace(rest, 0))
+
+
+def load_lazy(fp, chunk_size=CHUNK_SIZE):
+    """
+    Decode the UTF-8 JSON document in the binary file `fp`.
+
+    A top-level array is returned as a lazy iterator over its items, which
+    reads `fp` chunk by chunk so that only the item being decoded has to be
+    in memory; decoding errors are raised while iterating. Any other value
+    is decoded at once.
+    """
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    head = ''
+    while not head.strip(WHITESPACE):
+        chunk = fp.read(chunk_size)
+        head += text_decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            break
+    if head[skip_whitespace(head, 0):].startswith('['):
+        return _iter_array(fp, text_decoder, head, chunk_size)
+    return json.loads(head + text_decoder.decode(fp.read(), final=True))
@@ -0,0 +1,94 @@
+import os
+import socket
+import uuid
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import DateTimeField, ExpressionWrapper, Q
+from django.db.models.functions import Now
+from mymi_data.models import CrawlState
+
+
+DEFAULT_LEASE_SECONDS = 300
+
+
+def default_owner():
+    """Identify this crawler process across hosts"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class CrawlLeases:
+    """
+    Split a crawl between several processes through leases on CrawlState rows.
+
+    Every process walks the same candidate explorations in the same order
+    and claims the next ones with SELECT ... FOR UPDATE SKIP LOCKED, so
+    concurrent claims never block each other or return the same rows. An
+    exploration can be claimed while nobody holds an unexpired lease on it
+    and its CrawlState was not updated since the candidates were selected:
+    each exploration must carry the `last_attempt_at` of its CrawlState as
+    seen then, and a different value means another process attempted it
+    meanwhile. Leases are renewed by `renew()` and released once the
+    outcome is recorded; the leases of a crashed process expire and are
+    picked up by a final sweep over the candidates or by a later crawl.
+    Expiry uses the database clock, so the hosts' clocks do not need to
+    agree.
+    """
+
+    def __init__(self, explorations, owner=None, seconds=DEFAULT_LEASE_SECONDS):
+        self.explorations = {exploration.id: exploration for exploration in explorations}
+        self.ids = list(self.explorations)
+        self.owner = owner or default_owner()
+        self.seconds = seconds
+        self.cursor = 0
+        self.swept = False
+
+    def expiry(self):
+        return ExpressionWrapper(Now() + timedelta(seconds=self.seconds), output_field=DateTimeField())
+
+    def claim(self, count):
+        """Lease up to `count` further candidates to this process; returns their explorations"""
+        claimed = []
+        while len(claimed) < count:
+            if self.cursor == len(self.ids):
+                # Once through the candidates, look again for leases that expired in the meantime
+                if self.swept or claimed:
+                    break
+                self.cursor, self.swept = 0, True
+            window = self.ids[self.cursor:self.cursor + count - len(claimed)]
+            self.cursor += len(window)
+            claimed += self.claim_window(window)
+        return [self.explorations[exploration_id] for exploration_id in claimed]
+
+    def claim_window(self, exploration_ids):
+        with transaction.atomic():
+            # Rows must exist to be locked
+            CrawlState.objects.bulk_create(
+                [CrawlState(exploration_id=exploration_id) for exploration_id in exploration_ids],
+                ignore_conflicts=True,
+            )
+            free = (
+                CrawlState.objects.select_for_update(skip_locked=True)
+                .filter(exploration_id__in=exploration_ids)
+                .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=Now()))
+                .values_list('exploration_id', 'last_attempt_at')
+            )
+            claimable = [
+                exploration_id for exploration_id, last_attempt_at in free
+                if last_attempt_at == self.explorations[exploration_id].last_attempt_at
+            ]
+            CrawlState.objects.filter(exploration_id__in=claimable).update(
+                lease_owner=self.owner, lease_expires_at=self.expiry()
+            )
+        order = {exploration_id: i for i, exploration_id in enumerate(exploration_ids)}
+        return sorted(claimable, key=order.get)
+
+    def renew(self):
+        """Extend all leases held by this process; returns their number"""
+        return CrawlState.objects.filter(lease_owner=self.owner).update(lease_expires_at=self.expiry())
+
+    def release(self, exploration_ids=None):
+        """Give up the leases on `exploration_ids`, or all leases of this process"""
+        leases = CrawlState.objects.filter(lease_owner=self.owner)
+        if exploration_ids is not None:
+            leases = leases.filter(exploration_id__in=exploration_ids)
+        return leases.update(lease_owner='', lease_expires_at=None)
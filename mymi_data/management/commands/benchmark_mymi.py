@@ -0,0 +1,219 @@
+import json
+import os
+import shlex
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from io import StringIO
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import OperationalError, connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from mymi_data.materialize import sync_annotation_groups, sync_annotations
+from mymi_data.models import Exploration
+from mymi_data.synthetic import annotation_payloads, scaled_counts, write_snapshot
+
+
+ADMIN_VIEWS = (
+    ('image_changelist', 'admin:mymi_data_image_changelist'),
+    ('exploration_changelist', 'admin:mymi_data_exploration_changelist'),
+    ('structuresearch_changelist', 'admin:mymi_data_structuresearch_changelist'),
+    ('annotation_changelist', 'admin:mymi_data_annotation_changelist'),
+)
+BENCHMARK_USERNAME = 'mymi-benchmark'
+
+
+@contextmanager
+def timed(timings, name):
+    """Store the wall-clock seconds spent in the block under timings[name]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = 'Benchmark import, annotation materialization and admin views on synthetic snapshots in the MYMI_BENCHMARK_DB database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales',
+            type=str,
+            default='1',
+            help='Comma-separated catalog sizes relative to data/import_data.json (default: 1)'
+        )
+        parser.add_argument(
+            '--results',
+            type=str,
+            default='data/benchmarks/results.jsonl',
+            help='File the results are appended to as JSON lines (default: data/benchmarks/results.jsonl)'
+        )
+        parser.add_argument(
+            '--import-options',
+            type=str,
+            default='',
+            help='Extra options for import_mymi_data, e.g. "--stream --chunk-size 5000"'
+        )
+        parser.add_argument(
+            '--materialize-limit',
+            type=int,
+            default=100,
+            help='Number of explorations whose synthetic annotations are materialized (default: 100)'
+        )
+        parser.add_argument(
+            '--annotations',
+            type=int,
+            default=20,
+            help='Mean number of annotations per exploration (default: 20)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed for the synthetic data (default: 0)'
+        )
+        parser.add_argument(
+            '--noinput',
+            action='store_true',
+            help='Do not ask for confirmation before replacing the MyMi data in the MYMI_BENCHMARK_DB database'
+        )
+
+    def handle(self, *args, **options):
+        scales = [float(scale) for scale in options['scales'].split(',') if scale.strip()]
+        database = settings.MYMI_BENCHMARK_DB
+
+        if not database:
+            self.stdout.write(self.style.ERROR(
+                '❌ Set MYMI_BENCHMARK_DB to the name of a separate database; the benchmark empties it on every run'
+            ))
+            return
+        if database == connection.settings_dict['NAME']:
+            self.stdout.write(self.style.ERROR(
+                f'❌ MYMI_BENCHMARK_DB must not be the application database "{database}"'
+            ))
+            return
+
+        if not options['noinput']:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️  This deletes all MyMi data in database "{database}" and replaces it with synthetic data.'
+            ))
+            if input('Type "yes" to continue: ').strip() != 'yes':
+                self.stdout.write('Aborted')
+                return
+
+        if not self.use_database(database):
+            return
+
+        revision = self.git_revision()
+        os.makedirs(os.path.dirname(options['results']) or '.', exist_ok=True)
+
+        for scale in scales:
+            self.stdout.write(self.style.HTTP_INFO(f'📏 Scale {scale:g}'))
+            result = self.benchmark_scale(scale, options)
+            result.update({
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'revision': revision,
+                'database': connection.vendor,
+                'scale': scale,
+                'import_options': options['import_options'],
+            })
+            with open(options['results'], 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result) + '\n')
+            for name, seconds in result['timings'].items():
+                queries = result['queries'].get(name)
+                suffix = f' ({queries} queries)' if queries is not None else ''
+                self.stdout.write(f'  {name}: {seconds:.3f}s{suffix}')
+
+        # The synthetic data of the last scale is kept for inspection
+        self.stdout.write(self.style.SUCCESS(f"Results appended to {options['results']}"))
+
+    def use_database(self, name):
+        """Point the default connection at the benchmark database `name` and migrate it"""
+        connection.close()
+        # As the test runner does for the test database
+        settings.DATABASES[connection.alias]['NAME'] = name
+        connection.settings_dict['NAME'] = name
+        try:
+            call_command('migrate', verbosity=0, interactive=False)
+        except OperationalError as e:
+            self.stdout.write(self.style.ERROR(f'❌ Could not use benchmark database "{name}": {e}'))
+            return False
+        return True
+
+    def benchmark_scale(self, scale, options):
+        timings = {}
+        queries = {}
+        self.flush_mymi_tables()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            snapshot = os.path.join(tmp, 'snapshot.json')
+            with open(snapshot, 'w', encoding='utf-8') as f:
+                write_snapshot(f, scale=scale, seed=options['seed'], mean_annotations=options['annotations'])
+
+            import_args = shlex.split(options['import_options'])
+            with timed(timings, 'import'):
+                call_command('import_mymi_data', *import_args, file=snapshot, stdout=StringIO())
+            with timed(timings, 'reimport_unchanged'):
+                call_command('import_mymi_data', *import_args, file=snapshot, stdout=StringIO())
+
+        explorations = list(Exploration.objects.order_by('id')[:options['materialize_limit']])
+        payloads = [
+            (exploration, *annotation_payloads(options['seed'], exploration.id, options['annotations']))
+            for exploration in explorations
+        ]
+        for name in ('materialize', 'rematerialize_unchanged'):
+            with timed(timings, name):
+                for exploration, annotations, groups in payloads:
+                    with transaction.atomic():
+                        sync_annotation_groups(exploration, groups)
+                        sync_annotations(exploration, annotations)
+
+        client = Client(HTTP_HOST='localhost')
+        user, _ = get_user_model().objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={'is_staff': True, 'is_superuser': True}
+        )
+        client.force_login(user)
+        views = [(name, reverse(url_name)) for name, url_name in ADMIN_VIEWS]
+        if explorations:
+            views.append(('exploration_change', reverse('admin:mymi_data_exploration_change', args=[explorations[0].pk])))
+        try:
+            for name, url in views:
+                with CaptureQueriesContext(connection) as captured, timed(timings, name):
+                    response = client.get(url)
+                if response.status_code != 200:
+                    self.stdout.write(self.style.WARNING(f'  {name} returned HTTP {response.status_code}'))
+                queries[name] = len(captured)
+        finally:
+            user.delete()
+
+        return {
+            'counts': scaled_counts(scale),
+            'materialized_explorations': len(payloads),
+            'timings': timings,
+            'queries': queries,
+        }
+
+    def flush_mymi_tables(self):
+        """Empty every table of the mymi_data app"""
+        models = apps.get_app_config('mymi_data').get_models(include_auto_created=True)
+        tables = [model._meta.db_table for model in models]
+        sql = connection.ops.sql_flush(no_style(), tables, allow_cascade=True)
+        connection.ops.execute_sql_flush(sql)
+
+    def git_revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ''
+
@@ -0,0 +1,184 @@
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from mymi_data.importer import chunked
+from mymi_data.models import Image, OrganSystem, ThumbnailAtlas, ThumbnailAtlasEntry, ThumbnailFile
+from mymi_data.storage import thumbnail_storage
+from mymi_data.thumbnails import ATLAS_TILE, THUMBNAIL_FORMATS, check_format, render_atlas
+
+
+# Rows per changelist page of the Django admin, which pages atlases follow by default
+ADMIN_PAGE_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = 'Pack the small thumbnails of each admin changelist page or organ system into one atlas image'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--group-by',
+            choices=['page', 'organ-system'],
+            default='page',
+            help='Build one atlas per changelist page in the default order, or per organ system (default: page)',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=ADMIN_PAGE_SIZE,
+            help=f'Images per page with --group-by page; must match the changelist (default: {ADMIN_PAGE_SIZE})',
+        )
+        parser.add_argument(
+            '--columns',
+            type=int,
+            default=10,
+            help='Thumbnails per atlas row (default: 10)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=list(THUMBNAIL_FORMATS),
+            default='jpeg',
+            help='Image format of the atlases (default: jpeg)',
+        )
+        parser.add_argument(
+            '--thumbnails-dir',
+            type=str,
+            help='Directory of the crawled thumbnails, where the atlases are stored as well (default: media/thumbnails)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes rendering atlases (default: number of CPUs)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild atlases whose thumbnails did not change',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['page_size'], options['columns'], options['workers']) < 1:
+            self.stdout.write(self.style.ERROR('--page-size, --columns and --workers must be at least 1'))
+            return
+        try:
+            check_format(options['format'])
+        except ImportError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+
+        directory = options['thumbnails_dir'] or thumbnail_storage().location
+        kind = options['group_by']
+        groups = self.page_groups(options['page_size']) if kind == 'page' else self.organ_system_groups()
+
+        # Only small thumbnails stored locally can be packed
+        small = dict(Image.objects.exclude(thumbnail_small='').values_list('id', 'thumbnail_small'))
+        stored = {
+            entry.filename: entry
+            for entry in ThumbnailFile.objects.filter(filename__in=set(small.values()), is_local=True).only(
+                'filename', 'stored_name', 'digest'
+            )
+        }
+        existing = {atlas.key: atlas for atlas in ThumbnailAtlas.objects.filter(kind=kind)}
+
+        tasks = []
+        keys = set()
+        skipped_count = 0
+        for key, image_ids in groups:
+            members = [(image_id, stored[small[image_id]]) for image_id in image_ids if small.get(image_id) in stored]
+            if not members:
+                continue
+            keys.add(key)
+            source_digest = hashlib.sha256('\n'.join(
+                [f'{options["format"]} {ATLAS_TILE} {options["columns"]}']
+                + [f'{image_id} {entry.digest}' for image_id, entry in members]
+            ).encode()).hexdigest()
+            atlas = existing.get(key)
+            if not options['force'] and atlas is not None and atlas.source_digest == source_digest:
+                skipped_count += 1
+                continue
+            tasks.append((key, source_digest, members))
+
+        self.stdout.write(
+            f'🧩 Building {len(tasks)} {kind} atlas(es) with {options["workers"]} worker(s), {skipped_count} unchanged'
+        )
+        start = time.perf_counter()
+        replaced = self.build(tasks, kind, directory, options)
+
+        # Groups that no longer exist or have no local thumbnails, e.g. pages beyond the last one
+        obsolete = [atlas for key, atlas in existing.items() if key not in keys]
+        if obsolete:
+            ThumbnailAtlas.objects.filter(id__in=[atlas.id for atlas in obsolete]).delete()
+            replaced |= {atlas.stored_name for atlas in obsolete}
+            self.stdout.write(f'🗑️  Removed {len(obsolete)} obsolete atlas(es)')
+        self.delete_unreferenced(directory, replaced)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Done in {time.perf_counter() - start:.1f}s'))
+
+    def page_groups(self, page_size):
+        """(key, image ids) per changelist page in the admin's default order"""
+        image_ids = Image.objects.order_by('-pk').values_list('id', flat=True)
+        return [(f'page:{number}', page) for number, page in enumerate(chunked(image_ids, page_size), 1)]
+
+    def organ_system_groups(self):
+        """(key, image ids) per organ system"""
+        members = {}
+        for organ_system_id, image_id in Image.organ_systems.through.objects.order_by('image_id').values_list(
+            'organsystem_id', 'image_id'
+        ):
+            members.setdefault(organ_system_id, []).append(image_id)
+        return [
+            (f'organ-system:{organ_system_id}', members[organ_system_id])
+            for organ_system_id in OrganSystem.objects.order_by('id').values_list('id', flat=True)
+            if organ_system_id in members
+        ]
+
+    def build(self, tasks, kind, directory, options):
+        """Render the atlases of `tasks` in worker processes and store their offsets; returns the replaced file names"""
+        replaced = set()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=multiprocessing.get_context('spawn')
+        ) as pool:
+            futures = {
+                pool.submit(
+                    render_atlas, [os.path.join(directory, entry.stored_name) for _, entry in members],
+                    ATLAS_TILE, options['columns'], options['format'], directory,
+                ): (key, source_digest, members)
+                for key, source_digest, members in tasks
+            }
+            for future in as_completed(futures):
+                key, source_digest, members = futures[future]
+                stored_name, width, height, offsets = future.result()
+                with transaction.atomic():
+                    atlas = ThumbnailAtlas.objects.filter(key=key).first()
+                    if atlas is not None and atlas.stored_name != stored_name:
+                        replaced.add(atlas.stored_name)
+                    atlas, _ = ThumbnailAtlas.objects.update_or_create(key=key, defaults={
+                        'kind': kind, 'stored_name': stored_name, 'width': width, 'height': height,
+                        'source_digest': source_digest,
+                    })
+                    atlas.entries.all().delete()
+                    entries = []
+                    for (image_id, _), offset in zip(members, offsets):
+                        if offset is not None:
+                            x, y, tile_width, tile_height = offset
+                            entries.append(ThumbnailAtlasEntry(
+                                atlas=atlas, image_id=image_id, x=x, y=y, width=tile_width, height=tile_height
+                            ))
+                    ThumbnailAtlasEntry.objects.bulk_create(entries)
+                self.stdout.write(f'  🖼️  {key}: {sum(offset is not None for offset in offsets)} thumbnails')
+        return replaced
+
+    def delete_unreferenced(self, directory, stored_names):
+        """Delete those of the atlas files `stored_names` that no atlas refers to anymore"""
+        referenced = set(
+            ThumbnailAtlas.objects.filter(stored_name__in=stored_names).values_list('stored_name', flat=True)
+        )
+        for stored_name in set(stored_names) - referenced:
+            try:
+                os.unlink(os.path.join(directory, stored_name))
+            except FileNotFoundError:
+                pass
@@ -1,9 +1,27 @@
+import asyncio
 import json
 import time
-import requests
+from collections import Counter, deque
+from datetime import timedelta
+import aiohttp
+from asgiref.sync import sync_to_async
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from mymi_data.models import Exploration, AnnotationGroup, Annotation
+from django.db.models import F, Q
+from django.utils import timezone
+from mymi_data.crawler import (
+    DEFAULT_CONCURRENCY, MYMI_BASE_URL, CrawlItem, FetchError, annotation_urls, create_session, fetch_exploration
+)
+from mymi_data.jsonstream import load_lazy
+from mymi_data.leases import DEFAULT_LEASE_SECONDS, CrawlLeases
+from mymi_data.materialize import sync_annotation_groups, sync_annotations
+from mymi_data.models import Exploration, CrawlState, HttpCacheEntry, Institution, PayloadBlob
+from mymi_data.ratelimit import DEFAULT_MAX_RATE, DEFAULT_RATE, RateLimiter
+from mymi_data.recrawl import REASONS, recrawl_queue
+
+
+# Payload items decoded and synced at a time; detailed polygons can make single items large
+SYNC_BATCH_SIZE = 100
 
 
 class Command(BaseCommand):
@@ -13,7 +31,7 @@ class Command(BaseCommand):
         parser.add_argument(
             '--limit',
             type=int,
-            help='Limit number of explorations to process (for testing)',
+            help='Limit number of explorations to process, most outdated first',
         )
         parser.add_argument(
             '--exploration-id',
@@ -25,14 +43,95 @@ class Command(BaseCommand):
             type=str,
             help='JWT token directly (mymi_jwt=...)',
         )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=DEFAULT_CONCURRENCY,
+            help=f'Maximum number of explorations fetched at the same time (default: {DEFAULT_CONCURRENCY})',
+        )
+        parser.add_argument(
+            '--base-url',
+            type=str,
+            default=MYMI_BASE_URL,
+            help=f'MyMi server to crawl (default: {MYMI_BASE_URL})',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=DEFAULT_RATE,
+            help=f'Initial requests per second; adapts to the server\'s responses (default: {DEFAULT_RATE:g})',
+        )
+        parser.add_argument(
+            '--max-rate',
+            type=float,
+            default=DEFAULT_MAX_RATE,
+            help=f'Upper bound for the adaptive request rate (default: {DEFAULT_MAX_RATE:g})',
+        )
+        parser.add_argument(
+            '--fresh-hours',
+            type=float,
+            default=24,
+            help='Skip explorations crawled successfully within this many hours (default: 24)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Crawl all explorations, including recently crawled ones, and ignore cached responses',
+        )
+        parser.add_argument(
+            '--write-batch',
+            type=int,
+            default=20,
+            help='Maximum number of explorations written in one transaction (default: 20)',
+        )
+        parser.add_argument(
+            '--targeted',
+            action='store_true',
+            help='Crawl only explorations that were never crawled or whose snapshot counts changed or do not match the stored rows',
+        )
+        parser.add_argument(
+            '--show-queue',
+            action='store_true',
+            help='Print the targeted recrawl queue and exit without crawling',
+        )
+        parser.add_argument(
+            '--institution',
+            action='append',
+            dest='institutions',
+            help='Crawl only explorations of this institution ID; may be given several times',
+        )
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            default=DEFAULT_LEASE_SECONDS,
+            help=f'Lease time after which explorations of a crashed crawler are crawled by others (default: {DEFAULT_LEASE_SECONDS})',
+        )
+        parser.add_argument(
+            '--worker-id',
+            type=str,
+            help='Name of this crawler in the leases it holds (default: host name, process ID and a random suffix)',
+        )
 
     def handle(self, *args, **options):
         limit = options.get('limit')
         exploration_id = options.get('exploration_id')
         jwt_token = options.get('cookies')
 
-        # Get JWT token if not provided
-        if not jwt_token:
+        if options['concurrency'] < 1:
+            self.stdout.write(self.style.ERROR('--concurrency must be at least 1'))
+            return
+        if options['write_batch'] < 1:
+            self.stdout.write(self.style.ERROR('--write-batch must be at least 1'))
+            return
+        if options['rate'] <= 0:
+            self.stdout.write(self.style.ERROR('--rate must be positive'))
+            return
+        if options['lease_seconds'] < 10:
+            self.stdout.write(self.style.ERROR('--lease-seconds must be at least 10'))
+            return
+
+        # Get JWT token if not provided; only printing the queue needs none
+        if not jwt_token and not options['show_queue']:
             self.stdout.write(self.style.HTTP_INFO('🔐 MyMi JWT Token Required'))
             self.stdout.write('1. Go to https://mymi.uni-ulm.de/ and login')
             self.stdout.write('2. Press F12 → Application → Cookies → mymi_jwt')
@@ -40,212 +139,291 @@ class Command(BaseCommand):
             jwt_token = input('JWT Token: ').strip()
 
         # Clean JWT token format
-        if jwt_token.startswith('mymi_jwt='):
+        if jwt_token and jwt_token.startswith('mymi_jwt='):
             jwt_token = jwt_token[9:]  # Remove prefix
 
-        # Setup session with cookies
-        session = requests.Session()
-        session.cookies.set('mymi_jwt', jwt_token, domain='mymi.uni-ulm.de')
-
         # Get explorations to process
+        # The leases tell by this value whether another crawler got to an exploration first
+        candidates = Exploration.objects.annotate(last_attempt_at=F('crawl_state__last_attempt_at'))
+        if options['institutions']:
+            candidates = candidates.filter(institution_id__in=options['institutions'])
+            missing = set(options['institutions']) - set(Institution.objects.values_list('id', flat=True))
+            for institution_id in sorted(missing):
+                self.stdout.write(self.style.WARNING(f'⚠️  Institution {institution_id} not found'))
         if exploration_id:
-            try:
-                explorations = Exploration.objects.filter(id=exploration_id)
-                if not explorations.exists():
-                    self.stdout.write(self.style.ERROR(f'Exploration {exploration_id} not found'))
-                    return
-            except Exploration.DoesNotExist:
+            explorations = candidates.filter(id=exploration_id)
+            if not explorations.exists():
                 self.stdout.write(self.style.ERROR(f'Exploration {exploration_id} not found'))
                 return
+        elif options['targeted'] or options['show_queue']:
+            # Rows that disagree with the snapshot are only retried once the last crawl is no longer fresh
+            mismatch_before = None
+            if not options['force'] and options['fresh_hours'] > 0:
+                mismatch_before = timezone.now() - timedelta(hours=options['fresh_hours'])
+            queue = recrawl_queue(candidates, mismatch_before)
+            reasons = Counter(reason for _, reason in queue)
+            self.stdout.write(
+                f'🎯 Recrawl queue: {len(queue)} of {candidates.count()} exploration(s) '
+                f'({", ".join(f"{reasons[reason]} {reason}" for reason in REASONS)})'
+            )
+            if options['show_queue']:
+                for exploration, reason in queue[:limit]:
+                    self.stdout.write(
+                        f'  {exploration.id}: {reason} (snapshot {exploration.annotation_count}/'
+                        f'{exploration.annotation_group_count}, stored {exploration.stored_annotations}/'
+                        f'{exploration.stored_groups} annotations/groups)'
+                    )
+                return
+            explorations = [exploration for exploration, _ in queue[:limit]]
         else:
-            explorations = Exploration.objects.all()
+            explorations = candidates
+            if not options['force'] and options['fresh_hours'] > 0:
+                cutoff = timezone.now() - timedelta(hours=options['fresh_hours'])
+                explorations = explorations.filter(
+                    Q(crawl_state__last_success_at__isnull=True) | Q(crawl_state__last_success_at__lt=cutoff)
+                )
+                fresh_count = candidates.count() - explorations.count()
+                if fresh_count:
+                    self.stdout.write(
+                        f'⏭️  Skipping {fresh_count} exploration(s) crawled within the last {options["fresh_hours"]:g} hours'
+                    )
+            # Explorations without a successful crawl first, then the longest unrefreshed ones
+            explorations = explorations.order_by(F('crawl_state__last_success_at').asc(nulls_first=True), 'id')
             if limit:
                 explorations = explorations[:limit]
 
-        total_count = explorations.count()
-        self.stdout.write(f'Processing {total_count} exploration(s)...')
-
-        success_count = 0
-        error_count = 0
-
-        for i, exploration in enumerate(explorations, 1):
-            try:
-                self.stdout.write(f'[{i}/{total_count}] Processing {exploration.id}: {exploration.title}')
-                
-                success = self.crawl_exploration_annotations(session, exploration)
-                if success:
-                    success_count += 1
-                    self.stdout.write(self.style.SUCCESS(f'  ✅ Successfully processed {exploration.id}'))
-                else:
-                    error_count += 1
-                    self.stdout.write(self.style.ERROR(f'  ❌ Failed to process {exploration.id}'))
+        explorations = list(explorations)
+        total_count = len(explorations)
+        self.leases = CrawlLeases(explorations, options['worker_id'], options['lease_seconds'])
+        self.stdout.write(
+            f'Processing up to {total_count} exploration(s) with concurrency {options["concurrency"]} '
+            f'as {self.leases.owner}...'
+        )
 
-                # Rate limiting - be nice to the server
-                time.sleep(0.5)
+        # Validators of earlier responses, for conditional requests
+        base_url = options['base_url'].rstrip('/')
+        cache = {}
+        if not options['force']:
+            urls = [url for exploration in explorations for url in annotation_urls(base_url, exploration.id)]
+            cache = {entry.url: entry for entry in HttpCacheEntry.objects.filter(url__in=urls)}
 
-            except Exception as e:
-                error_count += 1
-                self.stdout.write(self.style.ERROR(f'  ❌ Error processing {exploration.id}: {str(e)}'))
+        limiter = RateLimiter(rate=options['rate'], max_rate=options['max_rate'])
+        start = time.perf_counter()
+        try:
+            success_count, error_count = asyncio.run(
+                self.crawl(total_count, jwt_token, options['concurrency'], base_url, limiter, cache, options['write_batch'])
+            )
+        finally:
+            # Leave claimed but unprocessed explorations to other crawlers right away
+            self.leases.release()
 
         # Summary
         self.stdout.write('\n' + '='*50)
-        self.stdout.write(f'Processed: {total_count} explorations')
+        self.stdout.write(f'Processed: {success_count + error_count} explorations in {time.perf_counter() - start:.1f}s')
+        if success_count + error_count < total_count:
+            self.stdout.write(f'🤝 {total_count - success_count - error_count} exploration(s) were taken by other crawlers')
         self.stdout.write(self.style.SUCCESS(f'Success: {success_count}'))
+        for host, rate in limiter.rates().items():
+            self.stdout.write(f'🚦 {host}: {rate:.1f} requests/s, {limiter.throttled_count} throttled, {limiter.retry_count} retried')
         if error_count > 0:
             self.stdout.write(self.style.ERROR(f'Errors: {error_count}'))
 
-    def crawl_exploration_annotations(self, session, exploration):
-        """Crawl annotations and annotation groups for a single exploration"""
+    async def crawl(self, total_count, jwt_token, concurrency, base_url, limiter, cache, write_batch):
+        """
+        Crawl the explorations leased to this process in a fetch/write pipeline.
+
+        `concurrency` fetchers claim explorations from `self.leases` a few
+        at a time, so that concurrent crawlers interleave, download their
+        payloads, paced by `limiter` and conditional on the validators in
+        `cache`, and put them into a bounded queue. A single writer drains the queue and
+        stores up to `write_batch` explorations per transaction in Django's
+        thread-sensitive executor. When the database falls behind, the
+        queue fills up and fetchers wait, so memory stays bounded; batches
+        grow with the backlog. Every outcome is recorded in CrawlState
+        and its lease released when its batch commits, so an interrupted
+        crawl resumes where it stopped; leases are renewed in the
+        background meanwhile. Returns (success count, error count).
+        """
+        queue = asyncio.Queue(maxsize=2 * write_batch)
+        claimed = deque()
+        claim_lock = asyncio.Lock()
+        claim = sync_to_async(self.leases.claim)
+        write = sync_to_async(self.write_batch)
+        counts = {'done': 0, 'success': 0, 'error': 0}
+
+        async def next_exploration():
+            async with claim_lock:
+                if not claimed:
+                    claimed.extend(await claim(concurrency))
+                return claimed.popleft() if claimed else None
+
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(self.leases.seconds / 3)
+                await sync_to_async(self.leases.renew)()
+
+        async def fetchers(session):
+            async def fetcher():
+                while (exploration := await next_exploration()) is not None:
+                    await queue.put(await self.fetch(session, limiter, base_url, cache, exploration))
+
+            await asyncio.gather(*[fetcher() for _ in range(concurrency)])
+            await queue.put(None)
+
+        async def writer():
+            finished = False
+            while not finished:
+                batch = [await queue.get()]
+                while len(batch) < write_batch and not queue.empty():
+                    batch.append(queue.get_nowait())
+                if batch[-1] is None:
+                    finished = True
+                    batch.pop()
+                if batch:
+                    self.report(await write(batch), counts, total_count)
+
+        renewal = asyncio.create_task(heartbeat())
         try:
-            with transaction.atomic():
-                # URLs for API endpoints
-                annotations_url = f"https://mymi.uni-ulm.de/api/exploration/{exploration.id}/annotation/annotation"
-                groups_url = f"https://mymi.uni-ulm.de/api/exploration/{exploration.id}/annotation/annotation-group"
-
-                # Fetch annotations
-                annotations_response = session.get(annotations_url)
-                if annotations_response.status_code != 200:
-                    self.stdout.write(f'    ⚠️ Failed to fetch annotations: HTTP {annotations_response.status_code}')
-                    return False
-
-                # Fetch annotation groups
-                groups_response = session.get(groups_url)
-                if groups_response.status_code != 200:
-                    self.stdout.write(f'    ⚠️ Failed to fetch annotation groups: HTTP {groups_response.status_code}')
-                    return False
-
-                # Parse JSON responses
-                try:
-                    annotations_data = annotations_response.json()
-                    groups_data = groups_response.json()
-                except json.JSONDecodeError as e:
-                    self.stdout.write(f'    ⚠️ Failed to parse JSON: {str(e)}')
-                    return False
-
-                # Store raw API responses in exploration
-                exploration.annotations_raw = annotations_data
-                exploration.annotation_groups_raw = groups_data
-                exploration.save()
-
-                # Process annotation groups first (needed for foreign key relationships)
-                self.process_annotation_groups(exploration, groups_data)
-                
-                # Process annotations
-                self.process_annotations(exploration, annotations_data)
-
-                self.stdout.write(f'    📊 Saved {len(groups_data)} groups, {len(annotations_data)} annotations')
-                return True
-
-        except Exception as e:
-            self.stdout.write(f'    ❌ Database error: {str(e)}')
-            return False
-
-    def process_annotation_groups(self, exploration, groups_data):
-        """Process and save annotation groups"""
-        if not isinstance(groups_data, list):
-            return
-
-        # Clear existing groups for this exploration
-        AnnotationGroup.objects.filter(exploration=exploration).delete()
-
-        for group_data in groups_data:
-            try:
-                # Helper function to safely convert to int
-                def safe_int(value, default=0):
-                    if value == '' or value is None:
-                        return default
-                    try:
-                        return int(value)
-                    except (ValueError, TypeError):
-                        return default
-
-                # Use get_or_create to handle shared annotation groups across explorations
-                group, created = AnnotationGroup.objects.get_or_create(
-                    external_id=safe_int(group_data.get('id')),
-                    exploration=exploration,
-                    defaults={
-                        'tagid': safe_int(group_data.get('tagid', group_data.get('id'))),
-                        'tagname': group_data.get('tagname', ''),
-                        'revision': group_data.get('revision', ''),
-                        'taggroup': group_data.get('taggroup', ''),
-                        'taglabel': group_data.get('taglabel', ''),
-                        'tagdescription': group_data.get('tagdescription', ''),
-                        'creator_id': safe_int(group_data.get('creator_id'), 0),
-                        'displaystyle': group_data.get('displaystyle'),
-                    }
-                )
-                if created:
-                    self.stdout.write(f'    ➕ Created new annotation group {group.external_id}')
+            async with create_session(jwt_token, concurrency) as session:
+                # If the writer fails, gather() raises at once instead of leaving fetchers blocked on the queue
+                await asyncio.gather(fetchers(session), writer())
+        finally:
+            renewal.cancel()
+
+        return counts['success'], counts['error']
+
+    async def fetch(self, session, limiter, base_url, cache, exploration):
+        """Fetch the payloads of one exploration into a CrawlItem; they are decoded by the writer"""
+        item = CrawlItem(exploration)
+        item.attempted_at = timezone.now()
+        started = time.perf_counter()
+        try:
+            item.annotations, item.groups = await fetch_exploration(session, limiter, base_url, exploration.id, cache)
+        except FetchError as e:
+            item.error, item.status = str(e), e.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            item.error = f'Request failed: {str(e) or type(e).__name__}'
+        item.duration_ms = round((time.perf_counter() - started) * 1000)
+        return item
+
+    def report(self, results, counts, total_count):
+        for item, messages in results:
+            counts['done'] += 1
+            exploration = item.exploration
+            self.stdout.write(f'[{counts["done"]}/{total_count}] Processed {exploration.id}: {exploration.title}')
+            for message in messages:
+                self.stdout.write(message)
+            if item.error:
+                counts['error'] += 1
+                self.stdout.write(self.style.ERROR(f'  ❌ Failed to process {exploration.id}'))
+            else:
+                counts['success'] += 1
+                self.stdout.write(self.style.SUCCESS(f'  ✅ Successfully processed {exploration.id}'))
+
+    def write_batch(self, items):
+        """
+        Store a batch of CrawlItems in one transaction.
+
+        Each exploration is written in its own savepoint, so a failing one
+        does not roll back the others. Returns (item, messages) pairs.
+        """
+        results = []
+        with transaction.atomic():
+            for item in items:
+                messages = []
+                if item.error:
+                    messages.append(f'    ⚠️ {item.error}')
                 else:
-                    self.stdout.write(f'    ♻️  Reused existing annotation group {group.external_id}')
-            except Exception as e:
-                self.stdout.write(f'    ⚠️ Failed to save annotation group {group_data.get("id")}: {str(e)}')
-
-    def process_annotations(self, exploration, annotations_data):
-        """Process and save annotations"""
-        if not isinstance(annotations_data, list):
-            return
-
-        # Clear existing annotations for this exploration
-        Annotation.objects.filter(exploration=exploration).delete()
-
-        for annotation_data in annotations_data:
-            try:
-                # Helper function to safely convert to int
-                def safe_int(value, default=0):
-                    if value == '' or value is None:
-                        return default
-                    try:
-                        return int(value)
-                    except (ValueError, TypeError):
-                        return default
-
-                # Helper function to safely convert to int or None
-                def safe_int_or_none(value):
-                    if value == '' or value is None:
-                        return None
-                    try:
-                        return int(value)
-                    except (ValueError, TypeError):
-                        return None
-
-                # Helper function to safely convert to float
-                def safe_float(value, default=0.0):
-                    if value == '' or value is None:
-                        return default
                     try:
-                        return float(value)
-                    except (ValueError, TypeError):
-                        return default
-
-                Annotation.objects.create(
-                    external_id=safe_int_or_none(annotation_data.get('id')),
-                    annotationid=annotation_data.get('annotationid', annotation_data.get('id')),
-                    annotationname=annotation_data.get('annotationname', ''),
-                    annotationdescription=annotation_data.get('annotationdescription', ''),
-                    show=annotation_data.get('show', True),
-                    version=safe_int(annotation_data.get('version'), 1),
-                    revision=annotation_data.get('revision', ''),
-                    type=safe_int(annotation_data.get('type'), 0),
-                    coord_xmin=safe_int(annotation_data.get('xmin'), 0),
-                    coord_xmax=safe_int(annotation_data.get('xmax'), 0),
-                    coord_ymin=safe_int(annotation_data.get('ymin'), 0),
-                    coord_ymax=safe_int(annotation_data.get('ymax'), 0),
-                    coord_zmin=safe_int(annotation_data.get('zmin'), 0),
-                    coord_zmax=safe_int(annotation_data.get('zmax'), 0),
-                    coord_tmin=safe_int(annotation_data.get('tmin'), 0),
-                    coord_tmax=safe_int(annotation_data.get('tmax'), 0),
-                    geometry=annotation_data.get('geometry', []),
-                    rotation=safe_float(annotation_data.get('rotation'), 0),
-                    displaystyle=annotation_data.get('displaystyle'),
-                    tag_ids=annotation_data.get('tag_ids', []),
-                    channels=annotation_data.get('channels', []),
-                    scope_id=safe_int_or_none(annotation_data.get('scope_id')),
-                    creator_id=safe_int(annotation_data.get('creator_id'), 0),
-                    mousebinded=annotation_data.get('mousebinded', False),
-                    tagdescription=annotation_data.get('tagdescription', ''),
-                    typespecificflags=annotation_data.get('typespecificflags', ''),
-                    exploration=exploration
+                        with transaction.atomic():
+                            self.store_exploration(item, messages)
+                    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                        item.error, item.status = f'Failed to parse JSON: {e}', 200
+                        messages.append(f'    ⚠️ {item.error}')
+                    except Exception as e:
+                        item.error, item.status = f'Database error: {e}', 200
+                        messages.append(f'    ❌ Database error: {str(e)}')
+                    finally:
+                        item.close()
+                results.append((item, messages))
+
+            stored = [item for item in items if not item.error]
+            HttpCacheEntry.objects.bulk_create(
+                [
+                    HttpCacheEntry(
+                        url=result.url, etag=result.etag, last_modified=result.last_modified,
+                        body_digest=result.digest,
+                    )
+                    for item in stored
+                    for result in (item.annotations, item.groups)
+                    if result.cache_outdated
+                ],
+                update_conflicts=True,
+                unique_fields=['url'],
+                update_fields=['etag', 'last_modified', 'body_digest', 'updated_at'],
+            )
+            self.record_states(stored, [
+                'last_success_at', 'payload_digest', 'crawled_annotation_count', 'crawled_annotation_group_count',
+            ])
+            # Failed attempts keep the time and digest of the last success
+            self.record_states([item for item in items if item.error], [])
+            self.leases.release([item.exploration.id for item in items])
+        return results
+
+    def store_exploration(self, item, messages):
+        """
+        Sync the changed payloads of one exploration; unchanged payloads are not written at all.
+
+        Payload items are decoded from the spooled response body one at a
+        time and synced in batches. The body itself is kept as a compressed
+        PayloadBlob keyed by its digest; blobs that no exploration refers
+        to anymore are deleted.
+        """
+        exploration = item.exploration
+        changed = dict(item.changed())
+        summary = []
+        payloads = (
+            ('annotation_groups_payload', sync_annotation_groups, 'Groups'),
+            ('annotations_payload', sync_annotations, 'annotations'),
+        )
+        for field, sync, label in payloads:
+            if field not in changed:
+                summary.append(f'{label} unchanged')
+                continue
+            rows = sync(exploration, load_lazy(changed[field].body), messages, batch_size=SYNC_BATCH_SIZE)
+            summary.append(f'{label}: {rows}')
+        if changed:
+            # Store raw API responses for the exploration
+            replaced = set()
+            for field, result in changed.items():
+                result.body.seek(0)
+                replaced.add(getattr(exploration, f'{field}_id'))
+                setattr(exploration, f'{field}_id', PayloadBlob.store(result.body, result.digest))
+            exploration.save(update_fields=list(changed))
+            PayloadBlob.delete_unreferenced(replaced - {None})
+            messages.append(f'    📊 {"; ".join(summary)}')
+        else:
+            messages.append('    💤 Not modified since the last crawl')
+
+    def record_states(self, items, success_fields):
+        """Upsert the CrawlState of `items`; `success_fields` are only written for successful attempts"""
+        now = timezone.now()
+        CrawlState.objects.bulk_create(
+            [
+                CrawlState(
+                    exploration=item.exploration,
+                    last_attempt_at=item.attempted_at,
+                    last_success_at=None if item.error else now,
+                    http_status=item.http_status,
+                    payload_digest='' if item.error else item.payload_digest,
+                    duration_ms=item.duration_ms,
+                    error=item.error or '',
+                    crawled_annotation_count=item.exploration.annotation_count,
+                    crawled_annotation_group_count=item.exploration.annotation_group_count,
                 )
-            except Exception as e:
-                self.stdout.write(f'    ⚠️ Failed to save annotation {annotation_data.get("id")}: {str(e)}')
\ No newline at end of file
+                for item in items
+            ],
+            update_conflicts=True,
+            unique_fields=['exploration'],
+            update_fields=['last_attempt_at', 'http_status', 'duration_ms', 'error', *success_fields],
+        )
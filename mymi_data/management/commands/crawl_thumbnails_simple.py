@@ -1,7 +1,28 @@
+import asyncio
+import multiprocessing
 import os
-import requests
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+import aiohttp
+from asgiref.sync import sync_to_async
 from django.core.management.base import BaseCommand
-from mymi_data.models import Image
+from django.utils import timezone
+from mymi_data.crawler import DEFAULT_CONCURRENCY, MYMI_BASE_URL, FetchError, create_session, thumbnail_file_url
+from mymi_data.models import Image, ThumbnailFile
+from mymi_data.ratelimit import DEFAULT_MAX_RATE, DEFAULT_RATE, RateLimiter
+from mymi_data.thumbnails import (
+    DERIVED_SIZES, THUMBNAIL_FORMATS, check_format, download_file, file_digest, remove_partial_files,
+    render_derivatives, scan_directory,
+)
+from mymi_data.storage import place_file
+
+
+# Manifest entries written at a time while downloading
+MANIFEST_BATCH_SIZE = 100
+MANIFEST_FIELDS = [
+    'is_local', 'stored_name', 'derived_from', 'source_digest', 'size', 'digest', 'etag', 'last_modified',
+    'fetched_at', 'http_status', 'error',
+]
 
 
 class Command(BaseCommand):
@@ -25,74 +46,325 @@ class Command(BaseCommand):
             help='Session cookies as string (optional - will prompt if not provided)',
             required=False
         )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=DEFAULT_RATE,
+            help=f'Initial requests per second; adapts to the server\'s responses (default: {DEFAULT_RATE:g})'
+        )
+        parser.add_argument(
+            '--max-rate',
+            type=float,
+            default=DEFAULT_MAX_RATE,
+            help=f'Upper bound for the adaptive request rate (default: {DEFAULT_MAX_RATE:g})'
+        )
+        parser.add_argument(
+            '--base-url',
+            type=str,
+            default=MYMI_BASE_URL,
+            help=f'MyMi server to download from (default: {MYMI_BASE_URL})'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=DEFAULT_CONCURRENCY,
+            help=f'Maximum number of thumbnails downloaded at the same time (default: {DEFAULT_CONCURRENCY})'
+        )
+        parser.add_argument(
+            '--fresh-hours',
+            type=float,
+            default=168,
+            help='Skip stored thumbnails fetched or revalidated within this many hours; older ones are revalidated with conditional requests (default: 168)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Download all thumbnails again, ignoring the manifest'
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Check the SHA-256 of stored thumbnails against the manifest instead of only their size'
+        )
+        parser.add_argument(
+            '--derive',
+            action='store_true',
+            help='Download only the large thumbnails and generate the small and medium ones locally'
+        )
+        parser.add_argument(
+            '--format',
+            choices=list(THUMBNAIL_FORMATS),
+            default='jpeg',
+            help='Image format of the generated thumbnails with --derive (default: jpeg)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes generating thumbnails with --derive (default: number of CPUs)'
+        )
 
-    def download_thumbnails(self, session, image_obj, output_dir):
-        """Download all thumbnails for a single image"""
-        # Use the calculated thumbnail URLs from the model
-        thumbnail_urls = [
-            ('large', image_obj.thumbnail_large_url),
-            ('medium', image_obj.thumbnail_medium_url),
-            ('small', image_obj.thumbnail_small_url)
+    async def download_thumbnails(self, session, limiter, image_obj, output_dir, base_url=MYMI_BASE_URL):
+        """Download all thumbnails for a single image concurrently"""
+        thumbnail_files = [
+            ('large', image_obj.thumbnail_large),
+            ('medium', image_obj.thumbnail_medium),
+            ('small', image_obj.thumbnail_small)
         ]
         
-        # Filter out None values
-        thumbnail_urls = [(size, url) for size, url in thumbnail_urls if url]
+        # Skip sizes without a file name and files the manifest says are current
+        thumbnail_urls = [
+            (size, thumbnail_file_url(base_url, filename)) for size, filename in thumbnail_files
+            if filename in self.requests
+        ]
         
-        if not thumbnail_urls:
+        if not thumbnail_urls and not self.derive:
             self.stdout.write(f"⚠️  No thumbnail URLs found for image {image_obj.id}")
             return 0
         
-        self.stdout.write(f"🔍 Found {len(thumbnail_urls)} thumbnail URLs for {image_obj.id}")
-        
         downloaded_count = 0
+        if thumbnail_urls:
+            self.stdout.write(f"🔍 Found {len(thumbnail_urls)} thumbnail URLs for {image_obj.id}")
+            
+            results = await asyncio.gather(*[
+                self.download_thumbnail(session, limiter, size, thumbnail_url, output_dir)
+                for size, thumbnail_url in thumbnail_urls
+            ])
+            downloaded_count = sum(results)
+            
+            if downloaded_count == 0:
+                self.stdout.write(f"❌ No thumbnails downloaded for image {image_obj.id}")
+            else:
+                self.stdout.write(f"🎉 Downloaded {downloaded_count}/{len(thumbnail_urls)} thumbnails for {image_obj.id}")
         
-        for size, thumbnail_url in thumbnail_urls:
-            try:
-                self.stdout.write(f"📥 Downloading {size}: {thumbnail_url}")
-                response = session.get(thumbnail_url, timeout=30)
-                
-                if response.status_code == 200:
-                    content_type = response.headers.get('content-type', '')
-                    
-                    # If we get HTML instead of image, it's probably a login/error page
-                    if 'text/html' in content_type:
-                        self.stdout.write(f"⚠️  Got HTML response for {size} - check authentication")
-                        continue
-                        
-                    if 'image' in content_type or thumbnail_url.endswith(('.jpg', '.jpeg', '.png')):
-                        # Extract filename from URL (e.g., 53lN9wqU33OC20fO.jpg from /assets/thumbnails/53lN9wqU33OC20fO.jpg)
-                        filename = thumbnail_url.split('/')[-1]
-                        filepath = os.path.join(output_dir, filename)
-                        
-                        # Save thumbnail
-                        with open(filepath, 'wb') as f:
-                            f.write(response.content)
-                        
-                        self.stdout.write(f"✅ Downloaded {size}: {filename}")
-                        downloaded_count += 1
-                    else:
-                        self.stdout.write(f"⚠️  Invalid content type for {size}: {content_type}")
-                else:
-                    self.stdout.write(f"❌ HTTP {response.status_code} for {size} thumbnail")
-                        
-            except Exception as e:
-                self.stdout.write(f"⚠️  Failed {size} thumbnail: {str(e)}")
+        if self.derive:
+            downloaded_count += await self.derive_thumbnails(image_obj, output_dir)
+        
+        return downloaded_count
+
+    def stale_derivatives(self, image_obj):
+        """(size, file name) of the thumbnails to generate from the stored large thumbnail of `image_obj`"""
+        large = self.manifest.get(image_obj.thumbnail_large)
+        if large is None or not large.is_local:
+            return []
+        stale = []
+        for size, filename in (('medium', image_obj.thumbnail_medium), ('small', image_obj.thumbnail_small)):
+            if not filename or filename == large.filename:
                 continue
+            entry = self.manifest.get(filename)
+            current = (
+                not self.force and entry is not None and entry.is_local
+                and os.path.splitext(entry.stored_name)[1] == THUMBNAIL_FORMATS[self.image_format][1]
+                and (entry.derived_from, entry.source_digest) == (large.filename, large.digest)
+                and self.files.get(entry.stored_name, (None,))[0] == entry.size
+            )
+            if not current:
+                stale.append((size, filename))
+        return stale
+
+    async def derive_thumbnails(self, image_obj, output_dir):
+        """Generate the outdated small and medium thumbnails of `image_obj` in the process pool; returns their number"""
+        stale = self.stale_derivatives(image_obj)
+        if not stale:
+            return 0
+        large = self.manifest[image_obj.thumbnail_large]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.pool, render_derivatives, os.path.join(output_dir, large.stored_name),
+                [DERIVED_SIZES[size] for size, _ in stale], self.image_format, output_dir,
+            )
+        except (OSError, ValueError) as e:
+            error = f'Failed to generate from {large.filename}: {str(e) or type(e).__name__}'
+            self.stdout.write(f"⚠️  {error}")
+            for _, filename in stale:
+                await self.record(filename, error=error)
+            return 0
+        
+        for (_, filename), (stored_name, file_size, digest) in zip(stale, results):
+            self.discard_replaced(filename, stored_name)
+            await self.record(
+                filename, is_local=True, stored_name=stored_name, derived_from=large.filename,
+                source_digest=large.digest, size=file_size, digest=digest, etag='', last_modified='',
+                fetched_at=timezone.now(), http_status=None, error='',
+            )
+        self.totals['derived'] += len(stale)
+        self.stdout.write(f"🖼️  Generated {', '.join(size for size, _ in stale)} from {large.filename}")
+        return len(stale)
+
+    def discard_replaced(self, filename, stored_name):
+        """Remember the file previously stored for `filename` for deletion if it is replaced by another one"""
+        entry = self.manifest.get(filename)
+        if entry is not None and entry.is_local and entry.stored_name and entry.stored_name != stored_name:
+            self.replaced.add(entry.stored_name)
+
+    async def download_thumbnail(self, session, limiter, size, thumbnail_url, output_dir):
+        """Download or revalidate one thumbnail file; returns 1 if it is stored and current, else 0"""
+        # Extract filename from URL (e.g., 53lN9wqU33OC20fO.jpg from /assets/thumbnails/53lN9wqU33OC20fO.jpg)
+        filename = thumbnail_url.split('/')[-1]
+        headers = self.requests[filename]
+        try:
+            self.stdout.write(f"📥 {'Revalidating' if headers else 'Downloading'} {size}: {thumbnail_url}")
+            download = await download_file(session, limiter, thumbnail_url, output_dir, headers)
+        except FetchError as e:
+            self.stdout.write(f"❌ {e} for {size} thumbnail {filename}")
+            fields = {'http_status': e.status, 'error': str(e)}
+            # Only a missing file counts as fetched; other failures are retried on the next run
+            if e.status == 404:
+                fields['fetched_at'] = timezone.now()
+            await self.record(filename, **fields)
+            return 0
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            error = str(e) or type(e).__name__
+            self.stdout.write(f"⚠️  Failed {size} thumbnail {filename}: {error}")
+            await self.record(filename, http_status=None, error=error)
+            return 0
         
-        if downloaded_count == 0:
-            self.stdout.write(f"❌ No thumbnails downloaded for image {image_obj.id}")
+        fields = {'fetched_at': timezone.now(), 'http_status': download.status, 'error': ''}
+        if download.etag or download.last_modified:
+            fields.update(etag=download.etag, last_modified=download.last_modified)
+        if download.status == 304:
+            self.stdout.write(f"♻️  Unchanged {size}: {filename}")
+            self.totals['revalidated'] += 1
         else:
-            self.stdout.write(f"🎉 Downloaded {downloaded_count}/{len(thumbnail_urls)} thumbnails for {image_obj.id}")
+            self.stdout.write(f"✅ Downloaded {size}: {filename}")
+            self.discard_replaced(filename, download.name)
+            fields.update(
+                is_local=True, stored_name=download.name, derived_from='', source_digest='',
+                size=download.size, digest=download.digest,
+            )
+            self.totals['downloaded'] += 1
+        await self.record(filename, **fields)
+        return 1
+
+    def plan_requests(self, filenames, output_dir, fresh_hours, verify):
+        """
+        Decide from the thumbnail manifest which of `filenames` have to be requested.
+
+        A stored file is verified if the manifest records it with the size it
+        has on disk, or with `verify` also its SHA-256. Verified files fetched
+        within `fresh_hours` are skipped, older ones are revalidated with
+        conditional requests; files that are missing, differ from the
+        manifest or were never fetched are downloaded. Files found on disk
+        without a manifest entry are adopted into the manifest and moved to
+        their content-addressed names. Returns a dict mapping the file names
+        to request to their request headers.
+        """
+        fresh_after = timezone.now() - timedelta(hours=fresh_hours)
+        requests = {}
+        force = self.force
         
-        return downloaded_count
+        for filename in filenames:
+            entry = self.manifest.get(filename)
+            stored_name = entry.stored_name if entry is not None and entry.stored_name else filename
+            on_disk = self.files.get(stored_name)
+            
+            if entry is None and on_disk:
+                # Move it into the content-addressed layout on the way
+                size, mtime = on_disk
+                digest = file_digest(os.path.join(output_dir, filename))
+                stored_name = place_file(
+                    output_dir, os.path.join(output_dir, filename), digest, os.path.splitext(filename)[1]
+                )
+                self.files[stored_name] = on_disk
+                entry = self.stage(
+                    filename, is_local=True, stored_name=stored_name, size=size, digest=digest,
+                    fetched_at=datetime.fromtimestamp(mtime, dt_timezone.utc),
+                )
+                self.totals['adopted'] += 1
+            
+            verified = bool(
+                entry and entry.is_local and on_disk and on_disk[0] == entry.size
+                and (not verify or file_digest(os.path.join(output_dir, stored_name)) == entry.digest)
+            )
+            if entry and entry.is_local and not verified:
+                # Deleted or modified on disk since it was recorded
+                self.stage(filename, is_local=False)
+                self.totals['invalid'] += 1
+            
+            fresh = entry is not None and entry.fetched_at is not None and entry.fetched_at > fresh_after
+            if not force and fresh and (verified or entry.http_status == 404):
+                self.totals['skipped'] += 1
+            elif verified and not force:
+                requests[filename] = entry.conditional_headers()
+            else:
+                requests[filename] = {}
+        
+        self.flush_manifest()
+        return requests
+
+    def stage(self, filename, **fields):
+        """Update the manifest entry of `filename` in memory and queue it for writing"""
+        entry = self.manifest.get(filename) or ThumbnailFile(filename=filename)
+        for field, value in fields.items():
+            setattr(entry, field, value)
+        self.manifest[filename] = self.pending[filename] = entry
+        return entry
+
+    async def record(self, filename, **fields):
+        self.stage(filename, **fields)
+        if len(self.pending) >= MANIFEST_BATCH_SIZE:
+            await sync_to_async(self.flush_manifest)()
+
+    def flush_manifest(self):
+        """Write the queued manifest entries in one statement"""
+        entries, self.pending = list(self.pending.values()), {}
+        ThumbnailFile.objects.bulk_create(
+            [
+                ThumbnailFile(filename=entry.filename, **{field: getattr(entry, field) for field in MANIFEST_FIELDS})
+                for entry in entries
+            ],
+            update_conflicts=True,
+            unique_fields=['filename'],
+            update_fields=MANIFEST_FIELDS,
+        )
+
+    async def crawl(self, images, cookies, concurrency, limiter, output_dir, base_url):
+        """
+        Download the thumbnails of `images` over one keep-alive connection pool.
+
+        Up to `concurrency` images are processed at a time, each with all of
+        its sizes in parallel. Returns the number of failed images.
+        """
+        pending = iter(enumerate(images, 1))
+        totals = {'failed': 0}
+        headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'}
+
+        async def worker(session):
+            for i, image_obj in pending:
+                self.stdout.write(f"📸 Processing {i}/{len(images)}: {image_obj.title}")
+                downloaded_count = await self.download_thumbnails(session, limiter, image_obj, output_dir, base_url)
+                if downloaded_count == 0:
+                    totals['failed'] += 1
+
+        async with create_session(None, concurrency, cookies=cookies, headers=headers) as session:
+            await asyncio.gather(*[worker(session) for _ in range(concurrency)])
+        return totals['failed']
 
     def handle(self, *args, **options):
         output_dir = options['output_dir']
         limit = options.get('limit')
         cookies_string = options.get('cookies')
         
+        if options['concurrency'] < 1:
+            self.stdout.write(self.style.ERROR('--concurrency must be at least 1'))
+            return
+        
+        if options['workers'] < 1:
+            self.stdout.write(self.style.ERROR('--workers must be at least 1'))
+            return
+        
+        if options['derive']:
+            try:
+                check_format(options['format'])
+            except ImportError as e:
+                self.stdout.write(self.style.ERROR(str(e)))
+                return
+        
         # Create output directory
         os.makedirs(output_dir, exist_ok=True)
+        removed_count = remove_partial_files(output_dir)
+        if removed_count:
+            self.stdout.write(f"🧹 Removed {removed_count} partial file(s) of interrupted downloads")
         
         self.stdout.write(self.style.SUCCESS(f"🚀 Starting thumbnail crawler..."))
         self.stdout.write(f"📁 Output directory: {output_dir}")
@@ -117,13 +389,6 @@ class Command(BaseCommand):
         
         self.stdout.write(f"🍪 Using {len(cookies)} cookies for authentication")
         
-        # Create authenticated session
-        session = requests.Session()
-        session.cookies.update(cookies)
-        session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-        })
-        
         # Get images to process
         images_query = Image.objects.all()
         if limit:
@@ -134,22 +399,61 @@ class Command(BaseCommand):
         
         self.stdout.write(f"🎯 Found {total_images} images to process")
         
-        total_downloaded = 0
-        total_failed = 0
+        self.totals = {'skipped': 0, 'adopted': 0, 'invalid': 0, 'revalidated': 0, 'downloaded': 0, 'derived': 0}
+        self.force = options['force']
+        self.derive = options['derive']
+        self.image_format = options['format']
+        filenames = list(dict.fromkeys(
+            filename for image in images
+            for filename in (image.thumbnail_large, image.thumbnail_medium, image.thumbnail_small) if filename
+        ))
+        self.files = scan_directory(output_dir)
+        self.manifest = ThumbnailFile.objects.in_bulk(filenames, field_name='filename')
+        self.pending = {}
+        self.replaced = set()
+        if self.derive:
+            # Small and medium thumbnails are generated from the large ones instead of being requested
+            self.stdout.write(f"🖼️  Deriving small and medium thumbnails as {self.image_format.upper()} in {options['workers']} process(es)")
+            filenames = list(dict.fromkeys(image.thumbnail_large for image in images if image.thumbnail_large))
+        self.requests = self.plan_requests(filenames, output_dir, options['fresh_hours'], options['verify'])
+        if self.totals['adopted']:
+            self.stdout.write(f"📋 Added {self.totals['adopted']} existing file(s) to the thumbnail manifest")
+        if self.totals['invalid']:
+            self.stdout.write(f"⚠️  {self.totals['invalid']} stored file(s) are missing or differ from the manifest")
+        if self.totals['skipped']:
+            self.stdout.write(
+                f"⏭️  Skipping {self.totals['skipped']} thumbnail(s) fetched within the last {options['fresh_hours']:g} hours"
+            )
         
-        for i, image_obj in enumerate(images, 1):
-            self.stdout.write(f"📸 Processing {i}/{total_images}: {image_obj.title}")
-            
-            downloaded_count = self.download_thumbnails(session, image_obj, output_dir)
-            if downloaded_count > 0:
-                total_downloaded += downloaded_count
-            else:
-                total_failed += 1
-            
-            # Rate limiting between images
-            import time
-            time.sleep(0.5)
+        # Images whose thumbnails are all current need no request
+        images = [
+            image for image in images
+            if {image.thumbnail_large, image.thumbnail_medium, image.thumbnail_small} & self.requests.keys()
+            or (self.derive and self.stale_derivatives(image))
+        ]
+        self.stdout.write(f"📡 Requesting {len(self.requests)} thumbnail(s) of {len(images)} images")
+        
+        limiter = RateLimiter(rate=options['rate'], max_rate=options['max_rate'])
+        # Spawned rather than forked, as the event loop runs database calls in threads
+        self.pool = ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=multiprocessing.get_context('spawn')
+        ) if self.derive else None
+        try:
+            total_failed = asyncio.run(self.crawl(
+                images, cookies, options['concurrency'], limiter, output_dir, options['base_url'].rstrip('/')
+            ))
+        finally:
+            # Keep the outcomes of an interrupted run
+            self.flush_manifest()
+            ThumbnailFile.delete_unreferenced_files(output_dir, self.replaced)
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
         
         self.stdout.write(self.style.SUCCESS(
-            f"🎉 Download complete! Downloaded: {total_downloaded} thumbnails, Failed images: {total_failed}"
-        ))
\ No newline at end of file
+            f"🎉 Download complete! Downloaded: {self.totals['downloaded']} thumbnails, "
+            f"Unchanged: {self.totals['revalidated']}, Skipped: {self.totals['skipped']}, Failed images: {total_failed}"
+        ))
+        if self.derive:
+            self.stdout.write(f"🖼️  Generated {self.totals['derived']} small and medium thumbnails locally")
+        for host, rate in limiter.rates().items():
+            self.stdout.write(f"🚦 {host}: {rate:.1f} requests/s, {limiter.throttled_count} throttled, {limiter.retry_count} retried")
\ No newline at end of file
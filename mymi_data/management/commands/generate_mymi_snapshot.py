@@ -0,0 +1,68 @@
+import gzip
+import os
+from django.core.management.base import BaseCommand
+from mymi_data.synthetic import scaled_counts, write_payloads, write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic MyMi snapshot (and annotation payloads) for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=1.0,
+            help='Size relative to data/import_data.json, e.g. 10 or 1000 (default: 1)'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Snapshot file to write; a .gz suffix compresses it (default: data/synthetic/snapshot_x<scale>.json)'
+        )
+        parser.add_argument(
+            '--payload-dir',
+            type=str,
+            help='Also write annotation/annotation-group payloads per exploration into this directory'
+        )
+        parser.add_argument(
+            '--annotations',
+            type=int,
+            default=20,
+            help='Mean number of annotations per exploration (default: 20)'
+        )
+        parser.add_argument(
+            '--points',
+            type=int,
+            default=40,
+            help='Mean number of polygon vertices per annotation (default: 40)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed; the same seed always produces the same data (default: 0)'
+        )
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        output = options['output'] or f'data/synthetic/snapshot_x{scale:g}.json'
+        counts = scaled_counts(scale)
+
+        self.stdout.write(
+            f"Generating {counts['images']} images, {counts['explorations']} explorations, "
+            f"{counts['structureSearches']} structure searches into {output}..."
+        )
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        opener = gzip.open if output.endswith('.gz') else open
+        with opener(output, 'wt', encoding='utf-8') as f:
+            write_snapshot(f, scale=scale, seed=options['seed'], mean_annotations=options['annotations'])
+
+        if options['payload_dir']:
+            self.stdout.write(f"Writing annotation payloads into {options['payload_dir']}...")
+            written = write_payloads(
+                options['payload_dir'], scale=scale, seed=options['seed'],
+                mean_annotations=options['annotations'], mean_points=options['points'],
+            )
+            self.stdout.write(f'Wrote payloads for {written} explorations')
+
+        self.stdout.write(self.style.SUCCESS(f'Generated {output}'))
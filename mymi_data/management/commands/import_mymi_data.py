@@ -1,10 +1,9 @@
 import json
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from mymi_data.models import (
-    OrganSystem, Species, Staining, Subject, Institution, 
-    TileServer, Image, Exploration, Diagnosis, StructureSearch, Locale
-)
+from mymi_data.importer import DEFAULT_BATCH_SIZE, IMPORTED_M2M_FIELDS, IMPORTED_MODELS, SnapshotImporter
+from mymi_data.jsonstream import open_text
+from mymi_data.staging import StagingArea
 
 
 class Command(BaseCommand):
@@ -17,14 +16,74 @@ class Command(BaseCommand):
             default='data/import_data.json',
             help='Path to JSON file to import (default: data/import_data.json)'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Number of rows per bulk upsert (default: {DEFAULT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Import every record even if the snapshot hash or record digests are unchanged'
+        )
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Parse the file incrementally and commit in chunks to keep memory usage flat'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Number of records per transaction in streaming mode (default: 5000)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Import independent sections concurrently on this many connections (default: 1)'
+        )
+        parser.add_argument(
+            '--staging',
+            action='store_true',
+            help='Load into staging tables first and publish them in one short merge (PostgreSQL only)'
+        )
 
     def handle(self, *args, **options):
         file_path = options['file']
         
         self.stdout.write(f'Importing data from {file_path}...')
+        importer = SnapshotImporter(self.stdout, self.style, batch_size=options['batch_size'])
+        if not options['staging']:
+            self.run_import(importer, file_path, options)
+            return
+
+        importer.staging = StagingArea(IMPORTED_MODELS, IMPORTED_M2M_FIELDS)
+        if not importer.staging.lock():
+            self.stdout.write(
+                self.style.ERROR('Another import is using the staging tables, try again once it has finished')
+            )
+            return
+        try:
+            importer.staging.prepare()
+            self.run_import(importer, file_path, options)
+        finally:
+            importer.staging.unlock()
+
+    def run_import(self, importer, file_path, options):
+        """Import the file in the mode selected by the options"""
+        if options['stream']:
+            if options['workers'] > 1:
+                self.stdout.write(
+                    self.style.ERROR('--workers cannot be combined with --stream')
+                )
+                return
+            self.import_stream(importer, file_path, options)
+            return
         
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
+            with open_text(file_path) as f:
                 data = json.load(f)
         except FileNotFoundError:
             self.stdout.write(
@@ -36,281 +95,84 @@ class Command(BaseCommand):
                 self.style.ERROR(f'Invalid JSON: {e}')
             )
             return
+        except (ImportError, OSError) as e:
+            self.stdout.write(
+                self.style.ERROR(f'Could not read {file_path}: {e}')
+            )
+            return
 
-        with transaction.atomic():
-            # Import organ systems
-            if 'organsystems' in data:
-                self.import_organ_systems(data['organsystems'])
-            
-            # Import species
-            if 'species' in data:
-                self.import_species(data['species'])
-            
-            # Import stainings
-            if 'stainings' in data:
-                self.import_stainings(data['stainings'])
-            
-            # Import subjects
-            if 'subjects' in data:
-                self.import_subjects(data['subjects'])
-            
-            # Import institutions
-            if 'institutions' in data:
-                self.import_institutions(data['institutions'])
-            
-            # Import tile servers
-            if 'tileservers' in data:
-                self.import_tile_servers(data['tileservers'])
-            
-            # Import images
-            if 'images' in data:
-                self.import_images(data['images'])
-            
-            # Import explorations
-            if 'explorations' in data:
-                self.import_explorations(data['explorations'])
-            
-            # Import diagnoses
-            if 'diagnoses' in data:
-                self.import_diagnoses(data['diagnoses'])
-            
-            # Import structure searches
-            if 'structureSearches' in data:
-                self.import_structure_searches(data['structureSearches'])
-            
-            # Import locales
-            if 'locales' in data and isinstance(data['locales'], dict):
-                self.import_locales(data['locales'])
+        snapshot_hash = data.get('hash')
+        if not options['force'] and importer.is_current(snapshot_hash):
+            self.stdout.write(
+                self.style.SUCCESS(f'Snapshot {snapshot_hash} is already imported, nothing to do')
+            )
+            return
+
+        if options['workers'] > 1:
+            # Each section commits on its own; the snapshot is only recorded once all succeeded
+            importer.run_parallel(data, options['workers'], force=options['force'])
+            if not self.finish(importer, snapshot_hash, file_path):
+                return
+        else:
+            with transaction.atomic():
+                importer.run(data, force=options['force'])
+                if not self.finish(importer, snapshot_hash, file_path):
+                    return
 
         self.stdout.write(
             self.style.SUCCESS('Successfully imported all data')
         )
 
-    def import_organ_systems(self, items):
-        self.stdout.write(f'Importing {len(items)} organ systems...')
-        for item in items:
-            OrganSystem.objects.update_or_create(
-                id=item['id'],
-                defaults={'title': item['title']}
-            )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} organ systems'))
-
-    def import_species(self, items):
-        self.stdout.write(f'Importing {len(items)} species...')
-        for item in items:
-            Species.objects.update_or_create(
-                id=item['id'],
-                defaults={'title': item['title']}
-            )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} species'))
-
-    def import_stainings(self, items):
-        self.stdout.write(f'Importing {len(items)} stainings...')
-        for item in items:
-            Staining.objects.update_or_create(
-                id=item['id'],
-                defaults={'title': item['title']}
+    def import_stream(self, importer, file_path, options):
+        """Import the file incrementally, committing every --chunk-size records"""
+        try:
+            with open_text(file_path) as f:
+                snapshot_hash, imported = importer.run_stream(f, options['chunk_size'], force=options['force'])
+        except FileNotFoundError:
+            self.stdout.write(
+                self.style.ERROR(f'File {file_path} not found')
             )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} stainings'))
-
-    def import_subjects(self, items):
-        self.stdout.write(f'Importing {len(items)} subjects...')
-        for item in items:
-            Subject.objects.update_or_create(
-                id=item['id'],
-                defaults={'title': item['title']}
+            return
+        except json.JSONDecodeError as e:
+            self.stdout.write(
+                self.style.ERROR(f'Invalid JSON: {e}')
             )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} subjects'))
-
-    def import_institutions(self, items):
-        self.stdout.write(f'Importing {len(items)} institutions...')
-        for item in items:
-            Institution.objects.update_or_create(
-                id=item['id'],
-                defaults={
-                    'title': item['title'],
-                    'short_title': item.get('shortTitle', ''),
-                    'acronym': item.get('acronym', ''),
-                    'introduction': item.get('introduction', ''),
-                    'logo_url': item.get('logoUrl', ''),
-                    'small_logo_url': item.get('smallLogoUrl', ''),
-                }
+            return
+        except (ImportError, OSError) as e:
+            self.stdout.write(
+                self.style.ERROR(f'Could not read {file_path}: {e}')
             )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} institutions'))
-
-    def import_tile_servers(self, items):
-        self.stdout.write(f'Importing {len(items)} tile servers...')
-        for item in items:
-            try:
-                institution = Institution.objects.get(id=item['institutionId'])
-                TileServer.objects.update_or_create(
-                    id=item['id'],
-                    defaults={
-                        'title': item['title'],
-                        'institution': institution,
-                        'public_urls': item.get('publicUrls', []),
-                    }
-                )
-            except Institution.DoesNotExist:
-                self.stdout.write(
-                    self.style.WARNING(f'Institution {item["institutionId"]} not found for tile server {item["id"]}')
-                )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} tile servers'))
-
-    def import_images(self, items):
-        self.stdout.write(f'Importing {len(items)} images...')
-        for item in items:
-            try:
-                staining = None
-                if item.get('stainingId'):
-                    try:
-                        staining = Staining.objects.get(id=item['stainingId'])
-                    except Staining.DoesNotExist:
-                        pass
-
-                species = None
-                if item.get('specieId'):
-                    try:
-                        species = Species.objects.get(id=item['specieId'])
-                    except Species.DoesNotExist:
-                        pass
-
-                tile_server = None
-                if item.get('tileserverId'):
-                    try:
-                        tile_server = TileServer.objects.get(id=item['tileserverId'])
-                    except TileServer.DoesNotExist:
-                        pass
-
-                image, created = Image.objects.update_or_create(
-                    id=item['id'],
-                    defaults={
-                        'title': item['title'],
-                        'checksum': item['checksum'],
-                        'size': int(item['size']),
-                        'file_path': item['filePath'],
-                        'thumbnail_small': item.get('thumbnailSmall', ''),
-                        'thumbnail_medium': item.get('thumbnailMedium', ''),
-                        'thumbnail_large': item.get('thumbnailLarge', ''),
-                        'state': item.get('state', 'active'),
-                        'imaging_diagnostic': item['imagingDiagnostic'],
-                        'staining': staining,
-                        'species': species,
-                        'tile_server': tile_server,
-                        'tags': item.get('tags', []),
-                        'deleted_at': None if item.get('deletedAt') is None else item['deletedAt'],
-                    }
-                )
-
-                # Add organ systems (many-to-many)
-                if item.get('organsystemIds'):
-                    organ_systems = OrganSystem.objects.filter(id__in=item['organsystemIds'])
-                    image.organ_systems.set(organ_systems)
-
-            except Exception as e:
-                self.stdout.write(
-                    self.style.WARNING(f'Error importing image {item["id"]}: {e}')
-                )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} images'))
-
-    def import_explorations(self, items):
-        self.stdout.write(f'Importing {len(items)} explorations...')
-        for item in items:
-            try:
-                image = Image.objects.get(id=item['imageId'])
-                institution = Institution.objects.get(id=item['institutionId'])
-                
-                exploration, created = Exploration.objects.update_or_create(
-                    id=item['id'],
-                    defaults={
-                        'title': item['title'],
-                        'is_active': item['isActive'],
-                        'image': image,
-                        'institution': institution,
-                        'annotation_group_count': item.get('annotationGroupCount', 0),
-                        'annotation_count': item.get('annotationCount', 0),
-                        'is_exam': item['isExam'],
-                        'edu_id': item.get('eduId', ''),
-                        'tags': item.get('tags', []),
-                        'deleted_at': None if item.get('deletedAt') is None else item['deletedAt'],
-                        'type': item.get('type', 'exploration'),
-                    }
-                )
-
-                # Add subjects (many-to-many)
-                if item.get('subjectIds'):
-                    subjects = Subject.objects.filter(id__in=item['subjectIds'])
-                    exploration.subjects.set(subjects)
-
-            except (Image.DoesNotExist, Institution.DoesNotExist) as e:
-                self.stdout.write(
-                    self.style.WARNING(f'Error importing exploration {item["id"]}: {e}')
-                )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} explorations'))
-
-    def import_diagnoses(self, items):
-        self.stdout.write(f'Importing {len(items)} diagnoses...')
-        for item in items:
-            try:
-                image = Image.objects.get(id=item['imageId'])
-                institution = Institution.objects.get(id=item['institutionId'])
-                
-                Diagnosis.objects.update_or_create(
-                    id=item['id'],
-                    defaults={
-                        'is_active': item['isActive'],
-                        'image': image,
-                        'institution': institution,
-                        'is_exam': item['isExam'],
-                        'deleted_at': None if item.get('deletedAt') is None else item['deletedAt'],
-                        'type': item.get('type', 'diagnosis'),
-                    }
-                )
-            except (Image.DoesNotExist, Institution.DoesNotExist) as e:
-                self.stdout.write(
-                    self.style.WARNING(f'Error importing diagnosis {item["id"]}: {e}')
-                )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} diagnoses'))
+            return
 
-    def import_structure_searches(self, items):
-        self.stdout.write(f'Importing {len(items)} structure searches...')
-        for item in items:
-            try:
-                image = Image.objects.get(id=item['imageId'])
-                institution = Institution.objects.get(id=item['institutionId'])
-                
-                structure_search, created = StructureSearch.objects.update_or_create(
-                    id=item['id'],
-                    defaults={
-                        'title': item['title'],
-                        'is_active': item['isActive'],
-                        'image': image,
-                        'institution': institution,
-                        'is_exam': item['isExam'],
-                        'annotation_group_count': item.get('annotationGroupCount', 0),
-                        'annotation_count': item.get('annotationCount', 0),
-                        'tags': item.get('tags', []),
-                        'deleted_at': None if item.get('deletedAt') is None else item['deletedAt'],
-                        'type': item.get('type', 'structure-search'),
-                    }
-                )
+        if not imported:
+            return
+        if not options['force'] and importer.is_current(snapshot_hash):
+            snapshot_hash = None
+        if not self.finish(importer, snapshot_hash, file_path):
+            return
 
-                # Add subjects (many-to-many)
-                if item.get('subjectIds'):
-                    subjects = Subject.objects.filter(id__in=item['subjectIds'])
-                    structure_search.subjects.set(subjects)
+        self.stdout.write(
+            self.style.SUCCESS('Successfully imported all data')
+        )
 
-            except (Image.DoesNotExist, Institution.DoesNotExist) as e:
-                self.stdout.write(
-                    self.style.WARNING(f'Error importing structure search {item["id"]}: {e}')
-                )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(items)} structure searches'))
+    def finish(self, importer, snapshot_hash, file_path):
+        """Publish the staging tables, if used, and record the imported snapshot"""
+        if importer.staging is None:
+            importer.record_snapshot(snapshot_hash, source=file_path)
+            return True
 
-    def import_locales(self, locales_dict):
-        self.stdout.write(f'Importing {len(locales_dict)} locales...')
-        for key, value in locales_dict.items():
-            Locale.objects.update_or_create(
-                key=key,
-                defaults={'value': value}
+        problems = importer.staging.validate()
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(problem))
+            self.stdout.write(
+                self.style.ERROR('Staged data was not published; the staging tables are kept for inspection')
             )
-        self.stdout.write(self.style.SUCCESS(f'Imported {len(locales_dict)} locales'))
\ No newline at end of file
+            return False
+
+        with transaction.atomic():
+            counts = importer.staging.publish()
+            importer.record_snapshot(snapshot_hash, source=file_path)
+        for table, count in counts.items():
+            self.stdout.write(f'Published {count} changed row(s) to {table}')
+        return True
@@ -0,0 +1,148 @@
+import os
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from mymi_data.importer import chunked
+from mymi_data.models import StructureSearch, ThumbnailFile
+from mymi_data.storage import is_sharded_name, link_file, thumbnail_storage
+from mymi_data.thumbnails import file_digest
+
+
+def link_sharded(root, name):
+    """
+    Give the file `name` below `root` its content-addressed name; returns (new name, SHA-256).
+
+    The file keeps its old name as well until the references are rewritten.
+    Runs in a worker thread; hashing releases the GIL.
+    """
+    path = os.path.join(root, *name.split('/'))
+    digest = file_digest(path)
+    directory, filename = posixpath.split(name)
+    return link_file(root, path, digest, os.path.splitext(filename)[1], directory), digest
+
+
+class Command(BaseCommand):
+    help = 'Move stored thumbnails and solution images into the content-addressed, hash-prefix-sharded layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--thumbnails-dir',
+            type=str,
+            help='Directory of the crawled thumbnails (default: media/thumbnails)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Files hashed and linked at the same time (default: 8)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Files whose references are rewritten in one transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the files that would be moved',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            self.stdout.write(self.style.ERROR('--workers and --batch-size must be at least 1'))
+            return
+
+        thumbnails_dir = options['thumbnails_dir'] or thumbnail_storage().location
+        thumbnails = [
+            entry for entry in ThumbnailFile.objects.filter(is_local=True).exclude(stored_name='').only(
+                'id', 'filename', 'stored_name', 'digest'
+            )
+            if not is_sharded_name(entry.stored_name)
+        ]
+        solutions = [
+            structure_search
+            for structure_search in StructureSearch.objects.exclude(solution_image='').exclude(
+                solution_image__isnull=True
+            ).only('id', 'solution_image')
+            if not is_sharded_name(structure_search.solution_image.name)
+        ]
+        self.stdout.write(f'📦 {len(thumbnails)} thumbnail(s) and {len(solutions)} solution image(s) to relocate')
+        if options['dry_run']:
+            return
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            moved, missing = self.relocate_thumbnails(pool, thumbnails_dir, thumbnails, options['batch_size'])
+            self.stdout.write(f'🖼️  Thumbnails: {moved} relocated, {missing} missing or modified on disk')
+            moved, missing = self.relocate_solutions(pool, solutions, options['batch_size'])
+            self.stdout.write(f'🧩 Solution images: {moved} relocated, {missing} missing on disk')
+        self.stdout.write(self.style.SUCCESS(f'✅ Done in {time.perf_counter() - start:.1f}s'))
+
+    def link_all(self, pool, root, names):
+        """Map each of `names` to (new name, digest), or to None if the file is missing"""
+        def link(name):
+            try:
+                return link_sharded(root, name)
+            except FileNotFoundError:
+                return None
+
+        return dict(zip(names, pool.map(link, names)))
+
+    def relocate_thumbnails(self, pool, root, entries, batch_size):
+        """
+        Rewrite the manifest to the content-addressed names, one batch at a time.
+
+        A batch is linked under its new names first, then committed, and
+        only then are the old names removed, so an interrupted run leaves
+        every reference pointing at an existing file. Files that vanished
+        or no longer match the recorded digest are marked as not local, so
+        the crawler fetches them again.
+        """
+        moved = missing = 0
+        for batch in chunked(entries, batch_size):
+            linked = self.link_all(pool, root, list({entry.stored_name for entry in batch}))
+            old_names = []
+            for entry in batch:
+                result = linked[entry.stored_name]
+                old_names.append(entry.stored_name)
+                if result is None or (entry.digest and result[1] != entry.digest):
+                    entry.is_local = False
+                    missing += 1
+                else:
+                    entry.stored_name = result[0]
+                    moved += 1
+            with transaction.atomic():
+                ThumbnailFile.objects.bulk_update(batch, ['stored_name', 'is_local'])
+            ThumbnailFile.delete_unreferenced_files(root, old_names)
+        return moved, missing
+
+    def relocate_solutions(self, pool, structure_searches, batch_size):
+        """Rewrite StructureSearch.solution_image to the content-addressed names, like relocate_thumbnails()"""
+        storage = StructureSearch._meta.get_field('solution_image').storage
+        moved = missing = 0
+        for batch in chunked(structure_searches, batch_size):
+            linked = self.link_all(pool, storage.location, list({obj.solution_image.name for obj in batch}))
+            updated, old_names = [], set()
+            for structure_search in batch:
+                result = linked[structure_search.solution_image.name]
+                if result is None:
+                    self.stdout.write(self.style.WARNING(
+                        f'⚠️  Solution image of {structure_search.id} not found: {structure_search.solution_image.name}'
+                    ))
+                    missing += 1
+                    continue
+                old_names.add(structure_search.solution_image.name)
+                structure_search.solution_image.name = result[0]
+                updated.append(structure_search)
+                moved += 1
+            with transaction.atomic():
+                StructureSearch.objects.bulk_update(updated, ['solution_image'])
+            referenced = set(
+                StructureSearch.objects.filter(solution_image__in=old_names).values_list('solution_image', flat=True)
+            )
+            for name in old_names - referenced:
+                storage.delete(name)
+        return moved, missing
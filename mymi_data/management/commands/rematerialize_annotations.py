@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import time
+import zstandard
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+from mymi_data.importer import chunked
+from mymi_data.jsonstream import load_lazy
+from mymi_data.materialize import DEFAULT_BATCH_SIZE, sync_annotation_groups, sync_annotations
+from mymi_data.models import Exploration
+
+
+COUNTERS = ('created', 'updated', 'deleted', 'unchanged')
+
+
+def rematerialize_explorations(exploration_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Rebuild the annotations and groups of the given explorations from their stored payload blobs.
+
+    Runs in a worker process. Every exploration is synced in its own
+    transaction. Returns a list of (exploration id, error, group counts,
+    annotation counts) tuples.
+    """
+    results = []
+    explorations = Exploration.objects.filter(id__in=exploration_ids).only(
+        'id', 'annotations_payload', 'annotation_groups_payload'
+    )
+    for exploration in explorations:
+        # ValueError also covers json.JSONDecodeError, UnicodeDecodeError and values of the wrong type
+        try:
+            with transaction.atomic():
+                # Blobs are fetched one at a time and their items decoded as they are synced
+                with exploration.annotation_groups_payload.open() as payload:
+                    groups = sync_annotation_groups(exploration, load_lazy(payload), batch_size=batch_size)
+                with exploration.annotations_payload.open() as payload:
+                    annotations = sync_annotations(exploration, load_lazy(payload), batch_size=batch_size)
+        except (DatabaseError, ValueError, zstandard.ZstdError) as e:
+            results.append((exploration.id, str(e), None, None))
+            continue
+        results.append((
+            exploration.id,
+            None,
+            {name: getattr(groups, name) for name in COUNTERS},
+            {name: getattr(annotations, name) for name in COUNTERS},
+        ))
+    return results
+
+
+class Command(BaseCommand):
+    help = 'Rebuild annotations and annotation groups from the stored raw API payloads, without network access'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--exploration-id',
+            action='append',
+            dest='exploration_ids',
+            help='Process only this exploration; may be given several times',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: number of CPUs)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=20,
+            help='Explorations handed to a worker at a time (default: 20)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Rows per INSERT statement (default: {DEFAULT_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            self.stdout.write(self.style.ERROR('--workers and --chunk-size must be at least 1'))
+            return
+
+        explorations = Exploration.objects.filter(
+            annotations_payload__isnull=False, annotation_groups_payload__isnull=False
+        )
+        if options['exploration_ids']:
+            explorations = explorations.filter(id__in=options['exploration_ids'])
+            missing = set(options['exploration_ids']) - set(explorations.values_list('id', flat=True))
+            for exploration_id in sorted(missing):
+                self.stdout.write(self.style.WARNING(f'⚠️  Exploration {exploration_id} not found or never crawled'))
+        exploration_ids = list(explorations.order_by('id').values_list('id', flat=True))
+
+        total_count = len(exploration_ids)
+        self.stdout.write(f'Rematerializing {total_count} exploration(s) with {options["workers"]} worker(s)...')
+        start = time.perf_counter()
+
+        chunks = list(chunked(exploration_ids, options['chunk_size']))
+        totals = {'groups': dict.fromkeys(COUNTERS, 0), 'annotations': dict.fromkeys(COUNTERS, 0)}
+        done = 0
+        error_count = 0
+        for results in self.run_chunks(chunks, options['workers'], options['batch_size']):
+            for exploration_id, error, groups, annotations in results:
+                done += 1
+                if error:
+                    error_count += 1
+                    self.stdout.write(self.style.ERROR(f'  ❌ {exploration_id}: {error}'))
+                    continue
+                for name in COUNTERS:
+                    totals['groups'][name] += groups[name]
+                    totals['annotations'][name] += annotations[name]
+            self.stdout.write(f'[{done}/{total_count}] explorations done')
+
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write(f'Rematerialized {done} explorations in {time.perf_counter() - start:.1f}s')
+        for label, counts in totals.items():
+            self.stdout.write(
+                f'📊 {label.capitalize()}: {counts["created"]} new, {counts["updated"]} changed, '
+                f'{counts["deleted"]} removed, {counts["unchanged"]} unchanged'
+            )
+        if error_count:
+            self.stdout.write(self.style.ERROR(f'Errors: {error_count}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Done'))
+
+    def run_chunks(self, chunks, workers, batch_size):
+        """Yield the results of rematerialize_explorations for every chunk, in completion order"""
+        if workers == 1:
+            for chunk in chunks:
+                yield rematerialize_explorations(chunk, batch_size)
+            return
+
+        # Forked workers must not share the parent's database sockets; each opens its own connection
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+            futures = [pool.submit(rematerialize_explorations, chunk, batch_size) for chunk in chunks]
+            for future in as_completed(futures):
+                yield future.result()
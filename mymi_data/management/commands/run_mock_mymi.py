@@ -0,0 +1,110 @@
+from aiohttp import web
+from django.core.management.base import BaseCommand
+from mymi_data.mock_server import DatabasePayloads, DirectoryPayloads, MockMyMi, SyntheticPayloads, Thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the MyMi API and thumbnail server, with injectable latency and errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to listen on (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+        parser.add_argument(
+            '--payload-dir',
+            type=str,
+            help='Serve recorded payloads from <dir>/<exploration id>/annotation[-group].json, '
+                 'e.g. written by generate_mymi_snapshot --payload-dir',
+        )
+        parser.add_argument(
+            '--from-db',
+            action='store_true',
+            help='Serve the payloads stored in the database by earlier crawls',
+        )
+        parser.add_argument(
+            '--annotations',
+            type=int,
+            default=20,
+            help='Mean number of annotations per exploration of synthetic payloads (default: 20)',
+        )
+        parser.add_argument(
+            '--points',
+            type=int,
+            default=40,
+            help='Mean number of polygon points per annotation of synthetic payloads (default: 40)',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for synthetic payloads (default: 0)')
+        parser.add_argument(
+            '--thumbnail-dir',
+            type=str,
+            help='Serve thumbnails from this directory; missing ones are generated',
+        )
+        parser.add_argument(
+            '--thumbnail-size',
+            type=int,
+            default=512,
+            help='Width of generated thumbnails in pixels (default: 512)',
+        )
+        parser.add_argument('--latency-ms', type=float, default=0, help='Delay added to every response (default: 0)')
+        parser.add_argument('--jitter-ms', type=float, default=0, help='Random extra delay of up to this much (default: 0)')
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0,
+            help='Share of requests answered with HTTP 500 (default: 0)',
+        )
+        parser.add_argument(
+            '--throttle-rate',
+            type=float,
+            default=0,
+            help='Share of requests answered with HTTP 429 (default: 0)',
+        )
+        parser.add_argument(
+            '--max-rps',
+            type=float,
+            help='Answer requests beyond this many per second with HTTP 429',
+        )
+        parser.add_argument(
+            '--retry-after',
+            type=int,
+            default=1,
+            help='Retry-After seconds sent with 429 responses (default: 1)',
+        )
+        parser.add_argument(
+            '--no-etag',
+            action='store_true',
+            help='Do not send ETags or answer conditional requests with 304',
+        )
+
+    def handle(self, *args, **options):
+        if options['payload_dir'] and options['from_db']:
+            self.stdout.write(self.style.ERROR('--payload-dir and --from-db cannot be combined'))
+            return
+
+        if options['payload_dir']:
+            payloads = DirectoryPayloads(options['payload_dir'])
+            source = f'payloads from {options["payload_dir"]}'
+        elif options['from_db']:
+            payloads = DatabasePayloads()
+            source = 'payloads from the database'
+        else:
+            payloads = SyntheticPayloads(options['seed'], options['annotations'], options['points'])
+            source = f'synthetic payloads (seed {options["seed"]})'
+
+        server = MockMyMi(
+            payloads,
+            Thumbnails(options['thumbnail_dir'], size=options['thumbnail_size']),
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            max_rps=options['max_rps'],
+            retry_after=options['retry_after'],
+            etags=not options['no_etag'],
+        )
+
+        base_url = f'http://{options["host"]}:{options["port"]}'
+        self.stdout.write(self.style.SUCCESS(f'🧪 Mock MyMi serving {source} on {base_url}'))
+        self.stdout.write(f'   Crawl it with --base-url {base_url}; request counters at {base_url}/__stats')
+        web.run_app(server.application(), host=options['host'], port=options['port'], print=None)
+
+        self.stdout.write('\n📊 ' + ', '.join(f'{key}: {value}' for key, value in sorted(server.stats.items())))
@@ -0,0 +1,207 @@
+from collections.abc import Iterator
+from mymi_data.importer import chunked
+from mymi_data.models import Annotation, AnnotationGroup
+
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def safe_int(value, default=0):
+    """Convert an API value to int, using `default` for empty or invalid values"""
+    if value == '' or value is None:
+        return default
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def safe_int_or_none(value):
+    """Convert an API value to int, or None for empty or invalid values"""
+    return safe_int(value, None)
+
+
+def safe_float(value, default=0.0):
+    """Convert an API value to float, using `default` for empty or invalid values"""
+    if value == '' or value is None:
+        return default
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def build_annotation_group(exploration, data):
+    """Unsaved AnnotationGroup for one item of the annotation-group endpoint"""
+    return AnnotationGroup(
+        external_id=safe_int(data.get('id')),
+        tagid=safe_int(data.get('tagid', data.get('id'))),
+        tagname=data.get('tagname', ''),
+        revision=data.get('revision', ''),
+        taggroup=data.get('taggroup', ''),
+        taglabel=data.get('taglabel', ''),
+        tagdescription=data.get('tagdescription', ''),
+        creator_id=safe_int(data.get('creator_id'), 0),
+        displaystyle=data.get('displaystyle'),
+        exploration=exploration,
+    )
+
+
+def build_annotation(exploration, data):
+    """Unsaved Annotation for one item of the annotation endpoint, or None if it has no valid annotationid"""
+    annotationid = safe_int_or_none(data.get('annotationid', data.get('id')))
+    if annotationid is None:
+        return None
+    return Annotation(
+        external_id=safe_int_or_none(data.get('id')),
+        annotationid=annotationid,
+        annotationname=data.get('annotationname', ''),
+        annotationdescription=data.get('annotationdescription', ''),
+        show=data.get('show', True),
+        version=safe_int(data.get('version'), 1),
+        revision=data.get('revision', ''),
+        type=safe_int(data.get('type'), 0),
+        coord_xmin=safe_int(data.get('xmin'), 0),
+        coord_xmax=safe_int(data.get('xmax'), 0),
+        coord_ymin=safe_int(data.get('ymin'), 0),
+        coord_ymax=safe_int(data.get('ymax'), 0),
+        coord_zmin=safe_int(data.get('zmin'), 0),
+        coord_zmax=safe_int(data.get('zmax'), 0),
+        coord_tmin=safe_int(data.get('tmin'), 0),
+        coord_tmax=safe_int(data.get('tmax'), 0),
+        geometry=data.get('geometry', []),
+        rotation=safe_float(data.get('rotation'), 0),
+        displaystyle=data.get('displaystyle'),
+        tag_ids=data.get('tag_ids', []),
+        channels=data.get('channels', []),
+        scope_id=safe_int_or_none(data.get('scope_id')),
+        creator_id=safe_int(data.get('creator_id'), 0),
+        mousebinded=data.get('mousebinded', False),
+        tagdescription=data.get('tagdescription', ''),
+        typespecificflags=data.get('typespecificflags', ''),
+        exploration=exploration,
+    )
+
+
+def build_rows(build, exploration, items, label, messages=None):
+    """Build unsaved rows for `items`, skipping (and reporting) items that are not objects or lack a valid id"""
+    rows = []
+    for item in items:
+        if not isinstance(item, dict):
+            if messages is not None:
+                messages.append(f'    ⚠️ Skipped {label} that is not an object: {item!r:.60}')
+            continue
+        row = build(exploration, item)
+        if row is None:
+            if messages is not None:
+                messages.append(f'    ⚠️ Skipped {label} without a valid id: {item!r:.60}')
+            continue
+        rows.append(row)
+    return rows
+
+
+class RowSync:
+    """
+    Bring the annotations or groups of one exploration in line with a payload.
+
+    Rows are matched by (exploration, external_id). Pass the payload's rows
+    to `add()`, in one or several chunks, then call `finish()`. Only new and
+    changed rows are written, with a single upsert per batch; rows missing
+    from the payload are deleted in `finish()`. Rows without an external_id
+    cannot be matched and are replaced on every sync.
+    """
+
+    def __init__(self, model, exploration, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.exploration = exploration
+        self.batch_size = batch_size
+        self.fields = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key and field.name not in ('exploration', 'external_id')
+        ]
+        self.seen = set()
+        self.unkeyed = []
+        self.created = self.updated = self.unchanged = self.deleted = 0
+
+    def __str__(self):
+        return f'{self.created} new, {self.updated} changed, {self.deleted} removed, {self.unchanged} unchanged'
+
+    def values(self, row):
+        # Normalized the way the database returns them, e.g. str ids of CharFields
+        return tuple(field.to_python(getattr(row, field.attname)) for field in self.fields)
+
+    def add(self, rows):
+        """Upsert the new and changed rows among `rows`"""
+        keyed = {}
+        for row in rows:
+            if row.external_id is None:
+                self.unkeyed.append(row)
+            elif row.external_id not in self.seen and row.external_id not in keyed:
+                # A row listed twice is stored once
+                keyed[row.external_id] = row
+        if not keyed:
+            return
+        self.seen.update(keyed)
+
+        existing = {
+            values[0]: values[1:]
+            for values in self.model.objects.filter(
+                exploration=self.exploration, external_id__in=list(keyed)
+            ).values_list('external_id', *[field.attname for field in self.fields])
+        }
+        changed = []
+        for external_id, row in keyed.items():
+            current = existing.get(external_id)
+            if current is None:
+                self.created += 1
+            elif current != self.values(row):
+                self.updated += 1
+            else:
+                self.unchanged += 1
+                continue
+            changed.append(row)
+
+        if changed:
+            self.model.objects.bulk_create(
+                changed,
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=['exploration', 'external_id'],
+                update_fields=[field.name for field in self.fields],
+            )
+
+    def finish(self):
+        """Delete rows that were not in the payload and store rows without external_id"""
+        stale = self.model.objects.filter(exploration=self.exploration).exclude(external_id__in=self.seen)
+        self.deleted = stale.delete()[0]
+        self.model.objects.bulk_create(self.unkeyed, batch_size=self.batch_size)
+        self.created += len(self.unkeyed)
+        return self
+
+
+def feed(sync, build, items, label, messages=None):
+    """
+    Build rows from `items` and pass them to `sync` in batches, then finish it.
+
+    `items` may be a lazy iterator, e.g. from jsonstream.load_lazy(); only
+    one batch of items and rows is held in memory at a time.
+    """
+    for chunk in chunked(items, sync.batch_size):
+        sync.add(build_rows(build, sync.exploration, chunk, label, messages))
+    return sync.finish()
+
+
+def sync_annotation_groups(exploration, groups_data, messages=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Sync the annotation groups of `exploration` with `groups_data`, a list or an iterator of items; returns the finished RowSync"""
+    sync = RowSync(AnnotationGroup, exploration, batch_size)
+    if isinstance(groups_data, (list, Iterator)):
+        feed(sync, build_annotation_group, groups_data, 'annotation group', messages)
+    return sync
+
+
+def sync_annotations(exploration, annotations_data, messages=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Sync the annotations of `exploration` with `annotations_data`, a list or an iterator of items; returns the finished RowSync"""
+    sync = RowSync(Annotation, exploration, batch_size)
+    if isinstance(annotations_data, (list, Iterator)):
+        feed(sync, build_annotation, annotations_data, 'annotation', messages)
+    return sync
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-17 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0006_structuresearch_solution_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(help_text='Top-level hash field of the imported JSON snapshot', max_length=64)),
+                ('source', models.CharField(blank=True, max_length=500)),
+                ('imported_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Import Snapshot',
+                'verbose_name_plural': 'Import Snapshots',
+                'get_latest_by': 'imported_at',
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportRecordDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('section', models.CharField(help_text='Snapshot section, e.g. images or explorations', max_length=30)),
+                ('record_id', models.CharField(max_length=100)),
+                ('digest', models.CharField(help_text="SHA-256 of the record's canonical JSON", max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Import Record Digest',
+                'verbose_name_plural': 'Import Record Digests',
+                'unique_together': {('section', 'record_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0007_import_snapshot_import_record_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlState',
+            fields=[
+                ('exploration', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='crawl_state', serialize=False, to='mymi_data.exploration')),
+                ('last_attempt_at', models.DateTimeField(blank=True, null=True)),
+                ('last_success_at', models.DateTimeField(blank=True, null=True)),
+                ('http_status', models.IntegerField(blank=True, help_text='HTTP status of the last attempt', null=True)),
+                ('payload_digest', models.CharField(blank=True, help_text='SHA-256 of the last stored payloads', max_length=64)),
+                ('duration_ms', models.IntegerField(blank=True, help_text='Duration of the last attempt', null=True)),
+                ('error', models.TextField(blank=True, help_text='Error of the last attempt, empty if it succeeded')),
+            ],
+            options={
+                'verbose_name': 'Crawl State',
+                'verbose_name_plural': 'Crawl States',
+            },
+        ),
+    ]
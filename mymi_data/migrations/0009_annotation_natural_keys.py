@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:19
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    """Keep only the oldest row per (exploration, external_id) so the unique constraint can be added"""
+    for model_name in ('Annotation', 'AnnotationGroup'):
+        model = apps.get_model('mymi_data', model_name)
+        duplicates = (
+            model.objects.filter(external_id__isnull=False)
+            .values('exploration_id', 'external_id')
+            .annotate(rows=Count('id'), keep=Min('id'))
+            .filter(rows__gt=1)
+        )
+        for duplicate in duplicates:
+            model.objects.filter(
+                exploration_id=duplicate['exploration_id'], external_id=duplicate['external_id']
+            ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0008_crawl_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='annotation',
+            unique_together={('exploration', 'external_id')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='annotationgroup',
+            unique_together={('exploration', 'external_id')},
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0009_annotation_natural_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HttpCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=500, unique=True)),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, help_text='Last-Modified header as sent by the server', max_length=64)),
+                ('body_digest', models.CharField(help_text='SHA-256 of the last stored response body', max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'HTTP Cache Entry',
+                'verbose_name_plural': 'HTTP Cache Entries',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0010_http_cache_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawlstate',
+            name='crawled_annotation_count',
+            field=models.IntegerField(blank=True, help_text='Snapshot annotation_count at the last successful crawl', null=True),
+        ),
+        migrations.AddField(
+            model_name='crawlstate',
+            name='crawled_annotation_group_count',
+            field=models.IntegerField(blank=True, help_text='Snapshot annotation_group_count at the last successful crawl', null=True),
+        ),
+    ]
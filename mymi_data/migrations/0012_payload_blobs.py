@@ -0,0 +1,96 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:40
+
+import hashlib
+import json
+from django.db import migrations, models
+import django.db.models.deletion
+import zstandard
+
+
+# (raw JSON field, blob foreign key) of Exploration
+PAYLOAD_FIELDS = [
+    ('annotations_raw', 'annotations_payload'),
+    ('annotation_groups_raw', 'annotation_groups_payload'),
+]
+
+
+def move_payloads_to_blobs(apps, schema_editor):
+    """Store every raw payload as a compressed blob keyed by the SHA-256 of its JSON text"""
+    Exploration = apps.get_model('mymi_data', 'Exploration')
+    PayloadBlob = apps.get_model('mymi_data', 'PayloadBlob')
+    compressor = zstandard.ZstdCompressor(level=9)
+    stored = set()
+    explorations = Exploration.objects.only('id', *[raw for raw, _ in PAYLOAD_FIELDS])
+    for exploration in explorations.iterator(chunk_size=100):
+        updates = {}
+        for raw, payload in PAYLOAD_FIELDS:
+            value = getattr(exploration, raw)
+            if value is None:
+                continue
+            body = json.dumps(value).encode()
+            digest = hashlib.sha256(body).hexdigest()
+            if digest not in stored:
+                PayloadBlob.objects.bulk_create(
+                    [PayloadBlob(digest=digest, size=len(body), data=compressor.compress(body))],
+                    ignore_conflicts=True,
+                )
+                stored.add(digest)
+            updates[f'{payload}_id'] = digest
+        if updates:
+            Exploration.objects.filter(pk=exploration.pk).update(**updates)
+
+
+def restore_payloads(apps, schema_editor):
+    Exploration = apps.get_model('mymi_data', 'Exploration')
+    decompressor = zstandard.ZstdDecompressor()
+    explorations = Exploration.objects.select_related(*[payload for _, payload in PAYLOAD_FIELDS])
+    for exploration in explorations.iterator(chunk_size=100):
+        updates = {}
+        for raw, payload in PAYLOAD_FIELDS:
+            blob = getattr(exploration, payload)
+            if blob is not None:
+                updates[raw] = json.loads(decompressor.stream_reader(blob.data).read())
+        if updates:
+            Exploration.objects.filter(pk=exploration.pk).update(**updates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0011_crawl_state_snapshot_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayloadBlob',
+            fields=[
+                ('digest', models.CharField(help_text='SHA-256 of the uncompressed payload', max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField(help_text='Uncompressed size in bytes')),
+                ('data', models.BinaryField(help_text='zstd-compressed payload')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Payload Blob',
+                'verbose_name_plural': 'Payload Blobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='exploration',
+            name='annotation_groups_payload',
+            field=models.ForeignKey(blank=True, help_text='Raw API response from /annotation/annotation-group endpoint', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='annotation_group_explorations', to='mymi_data.payloadblob'),
+        ),
+        migrations.AddField(
+            model_name='exploration',
+            name='annotations_payload',
+            field=models.ForeignKey(blank=True, help_text='Raw API response from /annotation/annotation endpoint', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='annotation_explorations', to='mymi_data.payloadblob'),
+        ),
+        migrations.RunPython(move_payloads_to_blobs, restore_payloads),
+        migrations.RemoveField(
+            model_name='exploration',
+            name='annotation_groups_raw',
+        ),
+        migrations.RemoveField(
+            model_name='exploration',
+            name='annotations_raw',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0012_payload_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawlstate',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, help_text='When the lease may be claimed by another crawler unless renewed', null=True),
+        ),
+        migrations.AddField(
+            model_name='crawlstate',
+            name='lease_owner',
+            field=models.CharField(blank=True, help_text='Crawler process working on this exploration', max_length=100),
+        ),
+    ]
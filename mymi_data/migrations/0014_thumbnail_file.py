@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0013_crawl_leases'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(help_text='File name in media/thumbnails/ and on MyMi', max_length=100, unique=True)),
+                ('is_local', models.BooleanField(default=False, help_text='The file is stored in media/thumbnails/')),
+                ('size', models.BigIntegerField(blank=True, help_text='Size of the stored file in bytes', null=True)),
+                ('digest', models.CharField(blank=True, help_text='SHA-256 of the stored file', max_length=64)),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, help_text='Last-Modified header as sent by the server', max_length=64)),
+                ('fetched_at', models.DateTimeField(blank=True, help_text='Last download or revalidation attempt', null=True)),
+                ('http_status', models.IntegerField(blank=True, help_text='HTTP status of the last attempt', null=True)),
+                ('error', models.TextField(blank=True, help_text='Error of the last attempt, empty if it succeeded')),
+            ],
+            options={
+                'verbose_name': 'Thumbnail File',
+                'verbose_name_plural': 'Thumbnail Files',
+            },
+        ),
+    ]
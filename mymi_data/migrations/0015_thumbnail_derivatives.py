@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:54
+
+from django.db import migrations, models
+
+
+def fill_stored_names(apps, schema_editor):
+    """Files recorded so far were stored under their own name"""
+    ThumbnailFile = apps.get_model('mymi_data', 'ThumbnailFile')
+    ThumbnailFile.objects.filter(is_local=True).update(stored_name=models.F('filename'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0014_thumbnail_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnailfile',
+            name='derived_from',
+            field=models.CharField(blank=True, help_text='Large thumbnail this file was generated from; empty if it was downloaded', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='thumbnailfile',
+            name='source_digest',
+            field=models.CharField(blank=True, help_text='SHA-256 of the large thumbnail this file was generated from', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='thumbnailfile',
+            name='stored_name',
+            field=models.CharField(blank=True, help_text='Name of the stored file in media/thumbnails/; differs from the file name if it was derived in another format', max_length=100),
+        ),
+        migrations.RunPython(fill_stored_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 14:59
+
+from django.db import migrations, models
+import mymi_data.models.structure_search
+import mymi_data.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0015_thumbnail_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='structuresearch',
+            name='solution_image',
+            field=models.ImageField(blank=True, help_text='Upload solution image for this structure search', max_length=255, null=True, storage=mymi_data.storage.ShardedStorage(), upload_to=mymi_data.models.structure_search.structure_search_solution_upload_path),
+        ),
+        migrations.AlterField(
+            model_name='thumbnailfile',
+            name='stored_name',
+            field=models.CharField(blank=True, help_text='Path of the stored file below media/thumbnails/, named after its SHA-256', max_length=100),
+        ),
+    ]
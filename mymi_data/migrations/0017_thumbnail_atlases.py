@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mymi_data', '0016_sharded_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailAtlas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Group of images packed into the atlas, e.g. page:3 or organ-system:12', max_length=100, unique=True)),
+                ('kind', models.CharField(help_text='page or organ-system', max_length=20)),
+                ('stored_name', models.CharField(help_text='Path of the atlas image below media/thumbnails/, named after its SHA-256', max_length=255)),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('source_digest', models.CharField(help_text='SHA-256 over the images and thumbnails packed into the atlas', max_length=64)),
+                ('built_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Thumbnail Atlas',
+                'verbose_name_plural': 'Thumbnail Atlases',
+            },
+        ),
+        migrations.CreateModel(
+            name='ThumbnailAtlasEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('x', models.IntegerField(help_text='Offset of the small thumbnail from the left edge of the atlas')),
+                ('y', models.IntegerField(help_text='Offset of the small thumbnail from the top edge of the atlas')),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('atlas', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='mymi_data.thumbnailatlas')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='atlas_entries', to='mymi_data.image')),
+            ],
+            options={
+                'verbose_name': 'Thumbnail Atlas Entry',
+                'verbose_name_plural': 'Thumbnail Atlas Entries',
+                'unique_together': {('atlas', 'image')},
+            },
+        ),
+    ]
@@ -0,0 +1,207 @@
+"""
+Local stand-in for the MyMi endpoints used by the crawlers.
+
+Serves /api/exploration/<id>/annotation/annotation, .../annotation-group
+and /assets/thumbnails/<file> from synthetic, recorded (payload directory
+or database) data, and can inject latency, server errors and 429s so the
+crawlers' throughput and backoff behaviour can be measured offline.
+GET /__stats returns the request counters.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import time
+from collections import Counter, deque
+from functools import lru_cache
+from aiohttp import web
+from asgiref.sync import sync_to_async
+from PIL import Image, ImageDraw
+from mymi_data.models import PayloadBlob
+from mymi_data.synthetic import annotation_payloads
+
+
+PAYLOAD_KINDS = ('annotation', 'annotation-group')
+
+
+class SyntheticPayloads:
+    """Payloads generated from the seed, identical to generate_mymi_snapshot --payload-dir"""
+
+    def __init__(self, seed=0, mean_annotations=20, mean_points=40):
+        self.seed = seed
+        self.mean_annotations = mean_annotations
+        self.mean_points = mean_points
+        self.generate = lru_cache(maxsize=1024)(self._generate)
+
+    def _generate(self, exploration_id):
+        annotations, groups = annotation_payloads(self.seed, exploration_id, self.mean_annotations, self.mean_points)
+        return json.dumps(annotations).encode(), json.dumps(groups).encode()
+
+    async def get(self, exploration_id, kind):
+        return self.generate(exploration_id)[PAYLOAD_KINDS.index(kind)]
+
+
+class DirectoryPayloads:
+    """Payloads recorded as <root>/<exploration id>/annotation.json and annotation-group.json"""
+
+    def __init__(self, root):
+        self.root = root
+
+    async def get(self, exploration_id, kind):
+        if exploration_id in ('.', '..'):
+            return None
+        try:
+            with open(os.path.join(self.root, exploration_id, f'{kind}.json'), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+class DatabasePayloads:
+    """Payloads recorded by earlier crawls, as stored in the PayloadBlobs of the explorations"""
+
+    # Reverse relation from PayloadBlob to the explorations using it, per payload kind
+    RELATIONS = {'annotation': 'annotation_explorations', 'annotation-group': 'annotation_group_explorations'}
+
+    async def get(self, exploration_id, kind):
+        return await sync_to_async(self.load)(exploration_id, self.RELATIONS[kind])
+
+    @staticmethod
+    def load(exploration_id, relation):
+        for blob in PayloadBlob.objects.filter(**{relation: exploration_id}):
+            with blob.open() as f:
+                return f.read()
+        return None
+
+
+class Thumbnails:
+    """Thumbnail files from `directory`; names not found there are rendered on the fly if `generate` is set"""
+
+    def __init__(self, directory=None, generate=True, size=512):
+        self.directory = directory
+        self.generate = generate
+        self.size = size
+        self.render = lru_cache(maxsize=256)(self._render)
+
+    def get(self, filename):
+        if self.directory and filename not in ('.', '..'):
+            try:
+                with open(os.path.join(self.directory, filename), 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+        if self.generate and filename.lower().endswith(('.jpg', '.jpeg')):
+            return self.render(filename)
+        return None
+
+    def _render(self, filename):
+        digest = hashlib.sha256(filename.encode()).digest()
+        width, height = self.size, self.size * 3 // 4
+        image = Image.new('RGB', (width, height), tuple(digest[:3]))
+        draw = ImageDraw.Draw(image)
+        for i in range(8):
+            x, y = digest[3 + i] * width // 256, digest[11 + i] * height // 256
+            radius = max(4, digest[19 + i] * width // 1024)
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=tuple(digest[i:i + 3]))
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=80)
+        return output.getvalue()
+
+
+class MockMyMi:
+    """
+    aiohttp application imitating the MyMi server.
+
+    Faults are applied per request in this order: requests above
+    `max_rps` get 429, then a `throttle_rate` share gets 429 and an
+    `error_rate` share gets 500; the rest are answered after `latency`
+    plus up to `jitter` seconds. 429 responses carry Retry-After.
+    """
+
+    def __init__(self, payloads, thumbnails, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 max_rps=None, retry_after=1, etags=True, seed=None):
+        self.payloads = payloads
+        self.thumbnails = thumbnails
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_rps = max_rps
+        self.retry_after = retry_after
+        self.etags = etags
+        self.random = random.Random(seed)
+        self.recent = deque()
+        self.stats = Counter()
+
+    def application(self):
+        app = web.Application(middlewares=[self.faults])
+        app.router.add_get('/api/exploration/{exploration_id}/annotation/{kind}', self.annotation_view)
+        app.router.add_get('/assets/thumbnails/{filename}', self.thumbnail_view)
+        app.router.add_get('/__stats', self.stats_view)
+        return app
+
+    def over_limit(self):
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] >= 1.0:
+            self.recent.popleft()
+        if len(self.recent) >= self.max_rps:
+            return True
+        self.recent.append(now)
+        return False
+
+    def throttled(self):
+        self.stats['throttled'] += 1
+        return web.Response(status=429, headers={'Retry-After': str(self.retry_after)})
+
+    @web.middleware
+    async def faults(self, request, handler):
+        if request.path == '/__stats':
+            return await handler(request)
+        self.stats['requests'] += 1
+        if self.max_rps and self.over_limit():
+            return self.throttled()
+        if self.random.random() < self.throttle_rate:
+            return self.throttled()
+        if self.random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=500, text='Injected error')
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            response = await handler(request)
+        except web.HTTPException as e:
+            self.stats[f'http_{e.status}'] += 1
+            raise
+        self.stats[f'http_{response.status}'] += 1
+        self.stats['bytes'] += response.content_length or 0
+        return response
+
+    def respond(self, request, body, content_type):
+        headers = {}
+        if self.etags:
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            headers['ETag'] = etag
+            if request.headers.get('If-None-Match') == etag:
+                return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type=content_type, headers=headers)
+
+    async def annotation_view(self, request):
+        kind = request.match_info['kind']
+        if kind not in PAYLOAD_KINDS:
+            raise web.HTTPNotFound()
+        body = await self.payloads.get(request.match_info['exploration_id'], kind)
+        if body is None:
+            raise web.HTTPNotFound()
+        return self.respond(request, body, 'application/json')
+
+    async def thumbnail_view(self, request):
+        body = self.thumbnails.get(request.match_info['filename'])
+        if body is None:
+            raise web.HTTPNotFound()
+        return self.respond(request, body, 'image/jpeg')
+
+    async def stats_view(self, request):
+        return web.json_response(dict(self.stats))
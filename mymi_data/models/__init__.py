@@ -11,6 +11,14 @@ from .annotation import Annotation
 from .diagnosis import Diagnosis
 from .structure_search import StructureSearch
 from .locale import Locale
+from .import_snapshot import ImportSnapshot
+from .import_record_digest import ImportRecordDigest
+from .crawl_state import CrawlState
+from .http_cache_entry import HttpCacheEntry
+from .payload_blob import PayloadBlob
+from .thumbnail_file import ThumbnailFile
+from .thumbnail_atlas import ThumbnailAtlas
+from .thumbnail_atlas_entry import ThumbnailAtlasEntry
 
 __all__ = [
     'OrganSystem',
@@ -25,5 +33,13 @@ __all__ = [
     'Annotation', 
     'Diagnosis', 
     'StructureSearch',
-    'Locale'
+    'Locale',
+    'ImportSnapshot',
+    'ImportRecordDigest',
+    'CrawlState',
+    'HttpCacheEntry',
+    'PayloadBlob',
+    'ThumbnailFile',
+    'ThumbnailAtlas',
+    'ThumbnailAtlasEntry'
 ]
\ No newline at end of file
@@ -73,4 +73,4 @@ class Annotation(models.Model):
     class Meta:
         verbose_name = "Annotation"
         verbose_name_plural = "Annotations"
-        # unique_together = ['external_id', 'exploration']  # Will be re-added after data migration
\ No newline at end of file
+        unique_together = ['exploration', 'external_id']
\ No newline at end of file
@@ -31,4 +31,4 @@ class AnnotationGroup(models.Model):
     class Meta:
         verbose_name = "Annotation Group"
         verbose_name_plural = "Annotation Groups"
-        # unique_together = ['external_id', 'exploration']  # Will be re-added after data migration
\ No newline at end of file
+        unique_together = ['exploration', 'external_id']
\ No newline at end of file
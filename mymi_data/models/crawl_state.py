@@ -0,0 +1,30 @@
+from django.db import models
+
+
+class CrawlState(models.Model):
+    exploration = models.OneToOneField(
+        'Exploration', on_delete=models.CASCADE, primary_key=True, related_name='crawl_state'
+    )
+    last_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    http_status = models.IntegerField(null=True, blank=True, help_text="HTTP status of the last attempt")
+    payload_digest = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the last stored payloads")
+    duration_ms = models.IntegerField(null=True, blank=True, help_text="Duration of the last attempt")
+    error = models.TextField(blank=True, help_text="Error of the last attempt, empty if it succeeded")
+    crawled_annotation_count = models.IntegerField(
+        null=True, blank=True, help_text="Snapshot annotation_count at the last successful crawl"
+    )
+    crawled_annotation_group_count = models.IntegerField(
+        null=True, blank=True, help_text="Snapshot annotation_group_count at the last successful crawl"
+    )
+    lease_owner = models.CharField(max_length=100, blank=True, help_text="Crawler process working on this exploration")
+    lease_expires_at = models.DateTimeField(
+        null=True, blank=True, help_text="When the lease may be claimed by another crawler unless renewed"
+    )
+    
+    def __str__(self):
+        return f"Crawl state of {self.exploration_id}"
+    
+    class Meta:
+        verbose_name = "Crawl State"
+        verbose_name_plural = "Crawl States"
@@ -2,6 +2,7 @@ from django.db import models
 from .subject import Subject
 from .image import Image
 from .institution import Institution
+from .payload_blob import PayloadBlob
 
 
 class Exploration(models.Model):
@@ -19,9 +20,25 @@ class Exploration(models.Model):
     deleted_at = models.DateTimeField(null=True, blank=True)
     type = models.CharField(max_length=20, default='exploration')
     
-    # Raw API responses for annotations
-    annotations_raw = models.JSONField(null=True, blank=True, help_text="Raw API response from /annotation/annotation endpoint")
-    annotation_groups_raw = models.JSONField(null=True, blank=True, help_text="Raw API response from /annotation/annotation-group endpoint")
+    # Raw API responses for annotations, stored compressed and deduplicated outside this table
+    annotations_payload = models.ForeignKey(
+        PayloadBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='annotation_explorations',
+        help_text="Raw API response from /annotation/annotation endpoint",
+    )
+    annotation_groups_payload = models.ForeignKey(
+        PayloadBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='annotation_group_explorations',
+        help_text="Raw API response from /annotation/annotation-group endpoint",
+    )
+    
+    @property
+    def annotations_raw(self):
+        """Decoded annotations payload, loaded from its blob on access"""
+        return self.annotations_payload.load() if self.annotations_payload_id else None
+    
+    @property
+    def annotation_groups_raw(self):
+        """Decoded annotation groups payload, loaded from its blob on access"""
+        return self.annotation_groups_payload.load() if self.annotation_groups_payload_id else None
     
     @property
     def mymi_link(self):
@@ -0,0 +1,25 @@
+from django.db import models
+
+
+class HttpCacheEntry(models.Model):
+    url = models.CharField(max_length=500, unique=True)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True, help_text="Last-Modified header as sent by the server")
+    body_digest = models.CharField(max_length=64, help_text="SHA-256 of the last stored response body")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return self.url
+    
+    def conditional_headers(self):
+        """Request headers that let the server answer 304 if the body is unchanged"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+    
+    class Meta:
+        verbose_name = "HTTP Cache Entry"
+        verbose_name_plural = "HTTP Cache Entries"
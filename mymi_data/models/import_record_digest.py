@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class ImportRecordDigest(models.Model):
+    section = models.CharField(max_length=30, help_text="Snapshot section, e.g. images or explorations")
+    record_id = models.CharField(max_length=100)
+    digest = models.CharField(max_length=64, help_text="SHA-256 of the record's canonical JSON")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.section}/{self.record_id}"
+    
+    class Meta:
+        verbose_name = "Import Record Digest"
+        verbose_name_plural = "Import Record Digests"
+        unique_together = ['section', 'record_id']
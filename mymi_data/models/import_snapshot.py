@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class ImportSnapshot(models.Model):
+    hash = models.CharField(max_length=64, help_text="Top-level hash field of the imported JSON snapshot")
+    source = models.CharField(max_length=500, blank=True)
+    imported_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.hash} ({self.imported_at:%Y-%m-%d %H:%M})"
+    
+    class Meta:
+        verbose_name = "Import Snapshot"
+        verbose_name_plural = "Import Snapshots"
+        get_latest_by = 'imported_at'
@@ -0,0 +1,62 @@
+import io
+import json
+import zstandard
+from django.db import models
+
+
+ZSTD_LEVEL = 9
+
+
+class PayloadBlob(models.Model):
+    digest = models.CharField(max_length=64, primary_key=True, help_text="SHA-256 of the uncompressed payload")
+    size = models.BigIntegerField(help_text="Uncompressed size in bytes")
+    data = models.BinaryField(help_text="zstd-compressed payload")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.digest
+    
+    @classmethod
+    def store(cls, fp, digest):
+        """
+        Compress and store the payload in the binary file `fp` unless a blob with its `digest` exists.
+
+        Must run inside the transaction that points an exploration at the
+        blob: the row stays locked until it commits, so a concurrent
+        delete_unreferenced() cannot remove it in between.
+        """
+        if not cls.objects.select_for_update().filter(digest=digest).values_list('digest', flat=True):
+            data = io.BytesIO()
+            size, _ = zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(fp, data)
+            # Upserting locks a row inserted by someone else in the meantime as well
+            cls.objects.bulk_create(
+                [cls(digest=digest, size=size, data=data.getvalue())],
+                update_conflicts=True,
+                unique_fields=['digest'],
+                update_fields=['size'],
+            )
+        return digest
+    
+    @classmethod
+    def delete_unreferenced(cls, digests):
+        """
+        Delete those of the blobs `digests` that no exploration refers to anymore.
+
+        Blobs locked by a concurrent store() are skipped; they are about to be referenced again.
+        """
+        unreferenced = cls.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+            digest__in=digests, annotation_explorations=None, annotation_group_explorations=None
+        ).values_list('digest', flat=True)
+        return cls.objects.filter(digest__in=list(unreferenced)).delete()[0]
+    
+    def open(self):
+        """Binary file object with the decompressed payload"""
+        return zstandard.ZstdDecompressor().stream_reader(self.data)
+    
+    def load(self):
+        with self.open() as f:
+            return json.load(f)
+    
+    class Meta:
+        verbose_name = "Payload Blob"
+        verbose_name_plural = "Payload Blobs"
@@ -1,4 +1,5 @@
 from django.db import models
+from mymi_data.storage import ShardedStorage
 from .subject import Subject
 from .image import Image
 from .institution import Institution
@@ -7,7 +8,8 @@ from .institution import Institution
 def structure_search_solution_upload_path(instance, filename):
     """
     Upload path for structure search solution images.
-    Files will be saved to media/structure_searches_solutions/<filename>
+    Files will be saved to media/structure_searches_solutions/<aa>/<bb>/<sha256>.<ext>,
+    see ShardedStorage
     """
     return f'structure_searches_solutions/{filename}'
 
@@ -27,6 +29,8 @@ class StructureSearch(models.Model):
     type = models.CharField(max_length=20, default='structure-search')
     solution_image = models.ImageField(
         upload_to=structure_search_solution_upload_path,
+        storage=ShardedStorage(),
+        max_length=255,
         null=True,
         blank=True,
         help_text="Upload solution image for this structure search"
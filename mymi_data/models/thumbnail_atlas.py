@@ -0,0 +1,23 @@
+from django.db import models
+from mymi_data.storage import thumbnail_storage
+
+
+class ThumbnailAtlas(models.Model):
+    key = models.CharField(max_length=100, unique=True, help_text="Group of images packed into the atlas, e.g. page:3 or organ-system:12")
+    kind = models.CharField(max_length=20, help_text="page or organ-system")
+    stored_name = models.CharField(max_length=255, help_text="Path of the atlas image below media/thumbnails/, named after its SHA-256")
+    width = models.IntegerField()
+    height = models.IntegerField()
+    source_digest = models.CharField(max_length=64, help_text="SHA-256 over the images and thumbnails packed into the atlas")
+    built_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def url(self):
+        return thumbnail_storage().url(self.stored_name)
+    
+    def __str__(self):
+        return self.key
+    
+    class Meta:
+        verbose_name = "Thumbnail Atlas"
+        verbose_name_plural = "Thumbnail Atlases"
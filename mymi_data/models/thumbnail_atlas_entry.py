@@ -0,0 +1,20 @@
+from django.db import models
+from .image import Image
+from .thumbnail_atlas import ThumbnailAtlas
+
+
+class ThumbnailAtlasEntry(models.Model):
+    atlas = models.ForeignKey(ThumbnailAtlas, on_delete=models.CASCADE, related_name='entries')
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, related_name='atlas_entries')
+    x = models.IntegerField(help_text="Offset of the small thumbnail from the left edge of the atlas")
+    y = models.IntegerField(help_text="Offset of the small thumbnail from the top edge of the atlas")
+    width = models.IntegerField()
+    height = models.IntegerField()
+    
+    def __str__(self):
+        return f"{self.image_id} in {self.atlas_id}"
+    
+    class Meta:
+        verbose_name = "Thumbnail Atlas Entry"
+        verbose_name_plural = "Thumbnail Atlas Entries"
+        unique_together = ['atlas', 'image']
@@ -0,0 +1,48 @@
+import os
+from django.db import models
+
+
+class ThumbnailFile(models.Model):
+    filename = models.CharField(max_length=100, unique=True, help_text="File name in media/thumbnails/ and on MyMi")
+    is_local = models.BooleanField(default=False, help_text="The file is stored in media/thumbnails/")
+    stored_name = models.CharField(max_length=100, blank=True, help_text="Path of the stored file below media/thumbnails/, named after its SHA-256")
+    derived_from = models.CharField(max_length=100, blank=True, help_text="Large thumbnail this file was generated from; empty if it was downloaded")
+    source_digest = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the large thumbnail this file was generated from")
+    size = models.BigIntegerField(null=True, blank=True, help_text="Size of the stored file in bytes")
+    digest = models.CharField(max_length=64, blank=True, help_text="SHA-256 of the stored file")
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True, help_text="Last-Modified header as sent by the server")
+    fetched_at = models.DateTimeField(null=True, blank=True, help_text="Last download or revalidation attempt")
+    http_status = models.IntegerField(null=True, blank=True, help_text="HTTP status of the last attempt")
+    error = models.TextField(blank=True, help_text="Error of the last attempt, empty if it succeeded")
+    
+    def __str__(self):
+        return self.filename
+    
+    @classmethod
+    def delete_unreferenced_files(cls, directory, stored_names):
+        """Delete those of the files `stored_names` in `directory` that no stored thumbnail refers to anymore"""
+        referenced = set(
+            cls.objects.filter(stored_name__in=stored_names, is_local=True).values_list('stored_name', flat=True)
+        )
+        deleted = 0
+        for stored_name in set(stored_names) - referenced:
+            try:
+                os.unlink(os.path.join(directory, stored_name))
+            except FileNotFoundError:
+                continue
+            deleted += 1
+        return deleted
+    
+    def conditional_headers(self):
+        """Request headers that let the server answer 304 if the stored file is current"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+    
+    class Meta:
+        verbose_name = "Thumbnail File"
+        verbose_name_plural = "Thumbnail Files"
@@ -0,0 +1,194 @@
+import asyncio
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import aiohttp
+
+
+DEFAULT_RATE = 4.0
+DEFAULT_MAX_RATE = 50.0
+MIN_RATE = 0.5
+RETRY_STATUSES = frozenset({429, 503})
+
+
+def is_success(status):
+    """Whether a response status shows that the host served the request: 2xx or 304 Not Modified"""
+    return 200 <= status < 300 or status == 304
+
+
+def parse_retry_after(value):
+    """Return the delay in seconds requested by a Retry-After header, or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second, holding at most `burst` tokens"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        # Grow quickly until the host first pushes back
+        self.slow_start = True
+        # May lie in the future while the host asked us to pause
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def acquire(self, now):
+        """Take a token and return 0, or return the seconds until one may be available"""
+        self.refill(now)
+        if now >= self.updated and self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return max(0.0, self.updated - now) + (1 - self.tokens) / self.rate
+
+    def pause(self, now, seconds):
+        """Hand out no tokens for the next `seconds`"""
+        self.refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        self.updated = max(self.updated, now + seconds)
+
+
+class RateLimiter:
+    """
+    Adaptive per-host request pacing for the MyMi HTTP clients.
+
+    Each host gets a token bucket. Its rate grows by `increase` per
+    2xx or 304 response until the host first pushes back, afterwards by
+    about `increase` requests per second every second, up to `max_rate`.
+    It is cut by `decrease` on 429/503, when the host is also
+    paused for the Retry-After delay or an exponential backoff. Throughput
+    therefore settles just below what the server accepts. Thread-safe, so
+    several event loops may share one limiter.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, max_rate=DEFAULT_MAX_RATE, increase=1.0, decrease=0.7,
+                 max_retries=5, backoff=1.0, max_backoff=60.0):
+        self.initial_rate = rate
+        self.max_rate = max(rate, max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.base_backoff = backoff
+        self.max_backoff = max_backoff
+        self.buckets = {}
+        self.last_slowdown = {}
+        self.throttled_count = 0
+        self.retry_count = 0
+        self.lock = threading.Lock()
+
+    def bucket(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.initial_rate, burst=max(1.0, self.initial_rate))
+        return host, self.buckets[host]
+
+    def rates(self):
+        """Return the current requests per second of every host"""
+        with self.lock:
+            return {host: bucket.rate for host, bucket in self.buckets.items()}
+
+    def acquire(self, url):
+        with self.lock:
+            return self.bucket(url)[1].acquire(time.monotonic())
+
+    # Waiters try again after sleeping instead of reserving a slot up front,
+    # so pauses and rate changes also apply to requests already waiting
+    async def wait_async(self, url):
+        """Wait until a request to `url` is allowed"""
+        while delay := self.acquire(url):
+            await asyncio.sleep(delay)
+
+    def backoff(self, attempt):
+        """Exponential backoff with jitter for the given retry attempt"""
+        delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def succeeded(self, url):
+        """The host served a request with a 2xx or 304 response: increase its rate"""
+        with self.lock:
+            bucket = self.bucket(url)[1]
+            bucket.refill(time.monotonic())
+            step = self.increase if bucket.slow_start else self.increase / bucket.rate
+            bucket.rate = min(self.max_rate, bucket.rate + step)
+            bucket.burst = max(1.0, bucket.rate)
+
+    def retrying(self):
+        """Count a request that is sent again"""
+        with self.lock:
+            self.retry_count += 1
+
+    def throttled(self, url, attempt, retry_after=None):
+        """The host rejected a request with 429/503: lower its rate and pause it"""
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = self.backoff(attempt)
+        delay = min(delay, self.max_backoff)
+        now = time.monotonic()
+        with self.lock:
+            self.throttled_count += 1
+            host, bucket = self.bucket(url)
+            bucket.refill(now)
+            bucket.slow_start = False
+            # Concurrent rejections of one burst count as a single slowdown
+            if now - self.last_slowdown.get(host, 0.0) > 1.0:
+                bucket.rate = max(MIN_RATE, bucket.rate * self.decrease)
+                bucket.burst = max(1.0, bucket.rate)
+                self.last_slowdown[host] = now
+            bucket.pause(now, delay)
+        return delay
+
+    @asynccontextmanager
+    async def get_async(self, session, url, **kwargs):
+        """
+        GET `url` with an aiohttp session, honouring the limits, and yield the response.
+
+        Throttled responses and connection errors are retried up to
+        `max_retries` times; the last response is yielded.
+        """
+        attempt = 0
+        while True:
+            await self.wait_async(url)
+            try:
+                response = await session.get(url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+                self.retrying()
+                continue
+            if response.status not in RETRY_STATUSES:
+                # Errors such as 404 or 500 are returned without raising the rate
+                if is_success(response.status):
+                    self.succeeded(url)
+                break
+            self.throttled(url, attempt, response.headers.get('Retry-After'))
+            if attempt >= self.max_retries:
+                break
+            response.release()
+            attempt += 1
+            self.retrying()
+        try:
+            yield response
+        finally:
+            response.release()
@@ -0,0 +1,66 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from mymi_data.models import Annotation, AnnotationGroup
+
+
+# Recrawl reasons, most urgent first
+NEVER_CRAWLED = 'never crawled'
+COUNTS_CHANGED = 'snapshot counts changed'
+COUNT_MISMATCH = 'stored rows differ from snapshot'
+REASONS = (NEVER_CRAWLED, COUNTS_CHANGED, COUNT_MISMATCH)
+
+
+def stored_rows(model):
+    """Subquery counting the rows of `model` that belong to the outer exploration"""
+    rows = (
+        model.objects.filter(exploration=OuterRef('pk'))
+        .order_by()
+        .values('exploration')
+        .annotate(rows=Count('pk'))
+        .values('rows')
+    )
+    return Coalesce(Subquery(rows), 0)
+
+
+def recrawl_queue(explorations, mismatch_before=None):
+    """
+    Return the explorations that need new annotation data, as (exploration, reason) pairs.
+
+    An exploration is queued when it was never crawled successfully, when
+    its snapshot annotation/group counts changed since its last successful
+    crawl, or when the stored rows do not match the snapshot counts. The
+    last reason only applies to explorations crawled before
+    `mismatch_before`, if given, so that explorations whose API payload
+    permanently disagrees with the snapshot are not recrawled every time.
+    Crawls recorded before the snapshot counts were tracked are only
+    checked against the stored rows.
+    The queue is ordered by reason, then by the size of the difference.
+    """
+    explorations = explorations.annotate(
+        last_success_at=F('crawl_state__last_success_at'),
+        crawled_annotations=F('crawl_state__crawled_annotation_count'),
+        crawled_groups=F('crawl_state__crawled_annotation_group_count'),
+        stored_annotations=stored_rows(Annotation),
+        stored_groups=stored_rows(AnnotationGroup),
+    )
+    queue = []
+    for exploration in explorations:
+        expected = (exploration.annotation_count, exploration.annotation_group_count)
+        if exploration.last_success_at is None:
+            reason, difference = NEVER_CRAWLED, sum(expected)
+        elif exploration.crawled_annotations is not None and (
+            (exploration.crawled_annotations, exploration.crawled_groups) != expected
+        ):
+            crawled = (exploration.crawled_annotations, exploration.crawled_groups or 0)
+            reason, difference = COUNTS_CHANGED, sum(abs(a - b) for a, b in zip(crawled, expected))
+        elif (exploration.stored_annotations, exploration.stored_groups) != expected and (
+            mismatch_before is None or exploration.last_success_at < mismatch_before
+        ):
+            stored = (exploration.stored_annotations, exploration.stored_groups)
+            reason, difference = COUNT_MISMATCH, sum(abs(a - b) for a, b in zip(stored, expected))
+        else:
+            continue
+        queue.append((REASONS.index(reason), -difference, exploration.id, exploration, reason))
+
+    queue.sort(key=lambda entry: entry[:3])
+    return [(exploration, reason) for *_, exploration, reason in queue]
@@ -0,0 +1,198 @@
+from django.db import connection
+
+
+STAGING_SUFFIX = '__staging'
+# Key of the session-level advisory lock held by the import that owns the staging tables
+STAGING_LOCK_ID = 0x6d796d69
+
+
+class StagingArea:
+    """
+    Shadow tables for loading a snapshot without touching the live tables.
+
+    Every model gets an unlogged `<table>__staging` copy with the same
+    columns and unique indexes. Rows are upserted there while the import
+    runs, checked for referential integrity, and finally merged into the
+    live tables with `publish()` in one short transaction. Readers of the
+    live tables keep seeing the old rows until that transaction commits.
+
+    Requires PostgreSQL.
+    """
+
+    def __init__(self, models, m2m_fields=()):
+        # `models` must be in dependency order; `m2m_fields` are (model, field name) pairs
+        self.models = list(models)
+        self.m2m_fields = list(m2m_fields)
+        self.merge_specs = {}
+        self.staged_m2m = set()
+
+    @staticmethod
+    def quote(name):
+        return connection.ops.quote_name(name)
+
+    def staging_table(self, model):
+        return self.quote(model._meta.db_table + STAGING_SUFFIX)
+
+    def live_table(self, model):
+        return self.quote(model._meta.db_table)
+
+    def through_models(self):
+        return [model._meta.get_field(name).remote_field.through for model, name in self.m2m_fields]
+
+    def lock(self):
+        """Take the advisory lock of the staging tables; returns False if another import holds it"""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [STAGING_LOCK_ID])
+            return cursor.fetchone()[0]
+
+    def unlock(self):
+        """Release the lock taken by lock()"""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [STAGING_LOCK_ID])
+
+    def prepare(self):
+        """
+        Create empty staging tables for all models and many-to-many relations.
+
+        The tables are dropped and recreated on every run, so they always
+        match the live tables after a migration. Call lock() first.
+        """
+        with connection.cursor() as cursor:
+            for model in self.models + self.through_models():
+                cursor.execute(f'DROP TABLE IF EXISTS {self.staging_table(model)}')
+                cursor.execute(
+                    f'CREATE UNLOGGED TABLE {self.staging_table(model)} '
+                    f'(LIKE {self.live_table(model)} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING INDEXES)'
+                )
+
+    @staticmethod
+    def insert_fields(model):
+        """Concrete fields written by an import; auto-generated primary keys are left to the live table"""
+        return [
+            field for field in model._meta.concrete_fields
+            if not (field.primary_key and field.get_internal_type() in ('AutoField', 'BigAutoField'))
+        ]
+
+    def insert(self, cursor, model, columns, rows, conflict_sql):
+        if not rows:
+            return
+        placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        cursor.execute(
+            f'INSERT INTO {self.staging_table(model)} ({", ".join(columns)}) '
+            f'VALUES {", ".join([placeholders] * len(rows))} {conflict_sql}',
+            [value for row in rows for value in row],
+        )
+
+    def pks(self, model, pks=None):
+        """Return the staged primary keys of `model`, optionally limited to `pks`"""
+        pk = self.quote(model._meta.pk.column)
+        with connection.cursor() as cursor:
+            if pks is None:
+                cursor.execute(f'SELECT {pk} FROM {self.staging_table(model)}')
+            else:
+                cursor.execute(f'SELECT {pk} FROM {self.staging_table(model)} WHERE {pk} = ANY(%s)', [list(pks)])
+            return {row[0] for row in cursor.fetchall()}
+
+    def upsert(self, model, objs, update_fields, unique_fields):
+        """Stage `objs`, replacing earlier staged rows with the same unique key"""
+        fields = self.insert_fields(model)
+        columns = [self.quote(field.column) for field in fields]
+        conflict = [self.quote(model._meta.get_field(name).column) for name in unique_fields]
+        update = [self.quote(model._meta.get_field(name).column) for name in update_fields]
+        self.merge_specs[model] = (columns, conflict, update)
+
+        rows = [
+            [field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields]
+            for obj in objs
+        ]
+        refresh = ', '.join(f'{column} = EXCLUDED.{column}' for column in columns if column not in conflict)
+        with connection.cursor() as cursor:
+            self.insert(cursor, model, columns, rows, f'ON CONFLICT ({", ".join(conflict)}) DO UPDATE SET {refresh}')
+
+    def m2m_columns(self, model, field_name):
+        field = model._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = self.quote(through._meta.get_field(field.m2m_field_name()).column)
+        target = self.quote(through._meta.get_field(field.m2m_reverse_field_name()).column)
+        return through, source, target
+
+    def stage_m2m(self, model, field_name, desired):
+        """Stage the complete set of related rows of the owners in `desired`"""
+        through, source, target = self.m2m_columns(model, field_name)
+        self.staged_m2m.add((model, field_name))
+        rows = [(owner, related) for owner, related_pks in desired.items() for related in related_pks]
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.staging_table(through)} WHERE {source} = ANY(%s)', [list(desired)])
+            self.insert(cursor, through, [source, target], rows, 'ON CONFLICT DO NOTHING')
+
+    def validate(self):
+        """Return a list of foreign keys in the staging tables that reference no row"""
+        problems = []
+        staged = set(self.models + self.through_models())
+        with connection.cursor() as cursor:
+            for model in self.models + self.through_models():
+                for field in model._meta.concrete_fields:
+                    if not field.many_to_one:
+                        continue
+                    target = field.related_model
+                    column = self.quote(field.column)
+                    target_pk = self.quote(target._meta.pk.column)
+                    sql = (
+                        f'SELECT COUNT(*) FROM {self.staging_table(model)} s WHERE s.{column} IS NOT NULL '
+                        f'AND NOT EXISTS (SELECT 1 FROM {self.live_table(target)} t WHERE t.{target_pk} = s.{column})'
+                    )
+                    if target in staged:
+                        sql += f' AND NOT EXISTS (SELECT 1 FROM {self.staging_table(target)} t WHERE t.{target_pk} = s.{column})'
+                    cursor.execute(sql)
+                    missing = cursor.fetchone()[0]
+                    if missing:
+                        problems.append(
+                            f'{missing} staged {model._meta.db_table} row(s) reference a missing {target._meta.db_table}'
+                        )
+        return problems
+
+    def publish(self):
+        """
+        Merge the staging tables into the live tables and empty them.
+
+        Must run inside a transaction. Only rows whose values differ are
+        updated. Returns a dict of live table name to affected row count.
+        """
+        counts = {}
+        with connection.cursor() as cursor:
+            for model in self.models:
+                if model not in self.merge_specs:
+                    continue
+                columns, conflict, update = self.merge_specs[model]
+                live = self.live_table(model)
+                cursor.execute(
+                    f'INSERT INTO {live} AS live ({", ".join(columns)}) '
+                    f'SELECT {", ".join(columns)} FROM {self.staging_table(model)} '
+                    f'ON CONFLICT ({", ".join(conflict)}) DO UPDATE SET '
+                    + ', '.join(f'{column} = EXCLUDED.{column}' for column in update)
+                    + f' WHERE ({", ".join(f"live.{column}" for column in update)}) IS DISTINCT FROM '
+                    f'({", ".join(f"EXCLUDED.{column}" for column in update)})'
+                )
+                counts[model._meta.db_table] = cursor.rowcount
+
+            for model, field_name in self.m2m_fields:
+                if (model, field_name) not in self.staged_m2m:
+                    continue
+                through, source, target = self.m2m_columns(model, field_name)
+                live, staging = self.live_table(through), self.staging_table(through)
+                owner_pk = self.quote(model._meta.pk.column)
+                cursor.execute(
+                    f'DELETE FROM {live} t USING {self.staging_table(model)} o '
+                    f'WHERE t.{source} = o.{owner_pk} AND NOT EXISTS '
+                    f'(SELECT 1 FROM {staging} s WHERE s.{source} = t.{source} AND s.{target} = t.{target})'
+                )
+                deleted = cursor.rowcount
+                cursor.execute(
+                    f'INSERT INTO {live} ({source}, {target}) SELECT {source}, {target} FROM {staging} '
+                    f'ON CONFLICT ({source}, {target}) DO NOTHING'
+                )
+                counts[through._meta.db_table] = deleted + cursor.rowcount
+
+            for model in self.models + self.through_models():
+                cursor.execute(f'TRUNCATE {self.staging_table(model)}')
+        return counts
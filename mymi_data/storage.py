@@ -0,0 +1,98 @@
+import hashlib
+import os
+import posixpath
+import re
+import shutil
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+# Directory levels and hex digits per level of the hash-prefix shards
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+CHUNK_SIZE = 64 * 1024
+# Mode of placed files, as Django's default FILE_UPLOAD_PERMISSIONS; temporary files are created private
+FILE_PERMISSIONS = 0o644
+
+_digest_name = re.compile(r'^[0-9a-f]{64}(\.[A-Za-z0-9]+)?$')
+
+
+def sharded_name(digest, extension='', directory=''):
+    """Content-addressed name of a file: <directory>/<aa>/<bb>/<digest><extension>"""
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+    return posixpath.join(directory, *shards, digest + extension.lower())
+
+
+def is_sharded_name(name):
+    """Whether `name` already follows the content-addressed layout"""
+    parts = name.split('/')
+    if len(parts) < SHARD_DEPTH + 1 or not _digest_name.match(parts[-1]):
+        return False
+    return sharded_name(parts[-1][:64], os.path.splitext(parts[-1])[1], '/'.join(parts[:-SHARD_DEPTH - 1])) == name
+
+
+def place_file(root, path, digest, extension='', directory=''):
+    """
+    Move the complete file at `path` to its content-addressed place under `root`; returns its name.
+
+    If a file with the same content is already stored, `path` is removed
+    instead, so identical files are kept only once.
+    """
+    name = sharded_name(digest, extension, directory)
+    target = os.path.join(root, *name.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        os.unlink(path)
+    else:
+        os.chmod(path, FILE_PERMISSIONS)
+        os.replace(path, target)
+    return name
+
+
+def link_file(root, path, digest, extension='', directory=''):
+    """Like place_file(), but keep `path` and give the file a second name, copying where hard links fail"""
+    name = sharded_name(digest, extension, directory)
+    target = os.path.join(root, *name.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(path, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copyfile(path, target)
+    return name
+
+
+class ShardedStorage(FileSystemStorage):
+    """
+    File system storage that names files after the SHA-256 of their content.
+
+    A file saved as `dir/photo.png` is stored as `dir/ab/cd/<sha256>.png`,
+    so no directory grows beyond 256 entries per level and saving the same
+    content twice stores it once. Names saved in the flat layout before
+    keep working; the relocate_media command moves them over.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        name = sharded_name(digest.hexdigest(), os.path.splitext(filename)[1], directory)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+def thumbnail_storage(location=None):
+    """ShardedStorage of the thumbnails crawled from MyMi, in media/thumbnails/ unless `location` is given"""
+    return ShardedStorage(
+        location=location or os.path.join(settings.MEDIA_ROOT, 'thumbnails'),
+        base_url=f'{settings.MEDIA_URL}thumbnails/',
+    )
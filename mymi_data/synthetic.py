@@ -0,0 +1,310 @@
+"""
+Synthetic MyMi catalogs for benchmarking.
+
+Snapshots use the same keys and value shapes as the real export in
+data/import_data.json; annotation payloads mirror the responses of the
+/api/exploration/<id>/annotation/* endpoints. Everything is derived from a
+seed, so the same arguments always produce the same data, and payloads can
+be regenerated per exploration without keeping the whole catalog around.
+"""
+import json
+import math
+import os
+import random
+
+
+ID_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+
+# Section sizes of the reference snapshot (data/import_data.json), i.e. scale 1
+BASE_COUNTS = {
+    'organsystems': 18,
+    'species': 24,
+    'stainings': 89,
+    'subjects': 3,
+    'institutions': 9,
+    'tileservers': 6,
+    'images': 544,
+    'explorations': 544,
+    'diagnoses': 84,
+    'structureSearches': 220,
+    'locales': 20,
+}
+
+# Dimension tables that do not grow with the number of images
+FIXED_SECTIONS = ('organsystems', 'species', 'stainings', 'subjects', 'institutions', 'tileservers', 'locales')
+
+ID_WIDTHS = {
+    'organsystems': 2,
+    'species': 2,
+    'stainings': 2,
+    'subjects': 2,
+    'institutions': 2,
+    'tileservers': 2,
+    'images': 4,
+    'explorations': 8,
+    'diagnoses': 8,
+    'structureSearches': 8,
+}
+
+TISSUES = [
+    'Leber', 'Niere', 'Milz', 'Lunge', 'Magen', 'Duodenum', 'Kolon', 'Haut', 'Kleinhirn',
+    'Grosshirn', 'Rueckenmark', 'Herz', 'Aorta', 'Schilddruese', 'Nebenniere', 'Pankreas',
+    'Hoden', 'Ovar', 'Uterus', 'Zunge', 'Knochen', 'Knorpel', 'Lymphknoten', 'Thymus',
+]
+STAININGS = ['HE', 'Azan', 'PAS', 'Elastika', 'Kluever-Barrera', 'Goldner', 'Silber', 'Eisen']
+STRUCTURES = [
+    'Epithel', 'Lamina propria', 'Tunica muscularis', 'Gefaess', 'Nerv', 'Druese', 'Zellkern',
+    'Basalmembran', 'Kapsel', 'Septum', 'Follikel', 'Sinusoid', 'Glomerulum', 'Tubulus',
+]
+COLORS = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4', '#46f0f0', '#f032e6']
+
+
+def make_id(index, width):
+    """Return a MyMi-style id for `index`; distinct indexes give distinct ids"""
+    space = len(ID_ALPHABET) ** width
+    # Multiplying by an odd constant is a bijection modulo a power of two and scatters the ids
+    value = (index * 0x9E3779B1 + 0x7F4A7C15) % space
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, len(ID_ALPHABET))
+        chars.append(ID_ALPHABET[digit])
+    return ''.join(chars)
+
+
+def section_id(section, index):
+    return make_id(index, ID_WIDTHS[section])
+
+
+def random_token(rng, length=16):
+    return ''.join(rng.choice(ID_ALPHABET[:62]) for _ in range(length))
+
+
+def scaled_counts(scale):
+    """Return the number of records per section for a catalog `scale` times the reference"""
+    return {
+        key: count if key in FIXED_SECTIONS else max(1, round(count * scale))
+        for key, count in BASE_COUNTS.items()
+    }
+
+
+def exploration_rng(seed, exploration_id):
+    return random.Random(f'{seed}-{exploration_id}')
+
+
+def draw_counts(rng, mean_annotations):
+    count = rng.randint(0, 2 * mean_annotations) if mean_annotations else 0
+    groups = max(1, count // 4) if count else 0
+    return count, groups
+
+
+def annotation_counts(seed, exploration_id, mean_annotations):
+    """Return the (annotation count, annotation group count) of a synthetic exploration"""
+    return draw_counts(exploration_rng(seed, exploration_id), mean_annotations)
+
+
+def annotation_payloads(seed, exploration_id, mean_annotations, mean_points=40):
+    """Return the (annotations, annotation groups) API payloads of a synthetic exploration"""
+    rng = exploration_rng(seed, exploration_id)
+    count, group_count = draw_counts(rng, mean_annotations)
+    base_id = rng.randrange(1, 10 ** 6) * 1000
+
+    groups = []
+    for g in range(group_count):
+        name = rng.choice(STRUCTURES)
+        groups.append({
+            'id': base_id + g,
+            'tagid': base_id + g,
+            'tagname': name.lower().replace(' ', '_'),
+            'revision': str(rng.randint(1, 5)),
+            'taggroup': rng.choice(['structure', 'cell', 'tissue']),
+            'taglabel': name,
+            'tagdescription': f'{name} ({exploration_id})',
+            'creator_id': rng.randint(1, 50),
+            'displaystyle': {'color': rng.choice(COLORS), 'lineWidth': rng.randint(1, 4)},
+        })
+
+    annotations = []
+    for a in range(count):
+        points = max(3, int(rng.gauss(mean_points, mean_points / 3)))
+        cx, cy = rng.randint(5000, 95000), rng.randint(5000, 95000)
+        radius = rng.randint(200, 4000)
+        geometry = []
+        for p in range(points):
+            angle = 2 * math.pi * p / points
+            r = radius * rng.uniform(0.7, 1.3)
+            geometry.append([int(cx + r * math.cos(angle)), int(cy + r * math.sin(angle))])
+        xs = [x for x, _ in geometry]
+        ys = [y for _, y in geometry]
+        tag_ids = [groups[rng.randrange(group_count)]['tagid']] if groups else []
+        annotations.append({
+            'id': base_id + 500 + a,
+            'annotationid': base_id + 500 + a,
+            'annotationname': f'{rng.choice(STRUCTURES)} {a + 1}',
+            'annotationdescription': rng.choice(['', 'Typische Struktur', 'Pruefungsrelevant']),
+            'show': rng.random() > 0.05,
+            'version': str(rng.randint(1, 3)),
+            'revision': str(rng.randint(1, 9)),
+            'type': rng.choice([3, 3, 3, 100, 101]),
+            'xmin': min(xs), 'xmax': max(xs),
+            'ymin': min(ys), 'ymax': max(ys),
+            'zmin': 0, 'zmax': 0,
+            'tmin': 0, 'tmax': 0,
+            'geometry': geometry,
+            'rotation': rng.choice([0, 0, 0, round(rng.uniform(0, 360), 2)]),
+            'displaystyle': {'color': rng.choice(COLORS), 'fill': rng.random() > 0.5},
+            'tag_ids': tag_ids,
+            'channels': [],
+            'scope_id': rng.choice(['', rng.randint(1, 20)]),
+            'creator_id': rng.randint(1, 50),
+            'mousebinded': False,
+            'tagdescription': '',
+            'typespecificflags': '',
+        })
+    return annotations, groups
+
+
+def write_section(fp, key, items, first=False):
+    """Write one `"key": [...]` member, one item at a time"""
+    fp.write(('' if first else ',\n') + json.dumps(key) + ': [')
+    for i, item in enumerate(items):
+        fp.write(('\n' if i == 0 else ',\n') + json.dumps(item, ensure_ascii=False))
+    fp.write('\n]')
+
+
+def write_snapshot(fp, scale=1.0, seed=0, mean_annotations=20, snapshot_hash=None):
+    """Write a synthetic snapshot to the text stream `fp` without holding it in memory"""
+    counts = scaled_counts(scale)
+    rng = random.Random(seed)
+    ids = {key: [section_id(key, i) for i in range(counts[key])] for key in FIXED_SECTIONS if key != 'locales'}
+    n_images = counts['images']
+
+    def titled(key, prefix):
+        return ({'id': pk, 'title': f'{prefix} {i + 1}'} for i, pk in enumerate(ids[key]))
+
+    def institutions():
+        for i, pk in enumerate(ids['institutions']):
+            yield {
+                'id': pk,
+                'title': f'Institut fuer Anatomie {i + 1}',
+                'shortTitle': f'Anatomie {i + 1}',
+                'acronym': f'ANA{i + 1}',
+                'introduction': '',
+                'logoUrl': '',
+                'smallLogoUrl': '',
+            }
+
+    def tileservers():
+        for i, pk in enumerate(ids['tileservers']):
+            yield {
+                'id': pk,
+                'title': f'mymi.tl.{i + 1}',
+                'institutionId': ids['institutions'][i % len(ids['institutions'])],
+                'publicUrls': [f'https://tl-{i + 1}.example.org'],
+            }
+
+    def images():
+        for i in range(n_images):
+            tissue = rng.choice(TISSUES)
+            yield {
+                'id': section_id('images', i),
+                'title': f'{tissue}, Mensch ({rng.choice(STAININGS)}), N{i:05d}',
+                'checksum': '%032x' % rng.getrandbits(128),
+                'size': str(rng.randint(10 ** 8, 10 ** 10)),
+                'filePath': f'Synthetic/{tissue}_{i:05d}.sis',
+                'thumbnailSmall': random_token(rng) + '.jpg',
+                'thumbnailMedium': random_token(rng) + '.jpg',
+                'thumbnailLarge': random_token(rng) + '.jpg',
+                'state': 'active',
+                'imagingDiagnostic': rng.choice(['histology', 'histology', 'pathology']),
+                'stainingId': rng.choice(ids['stainings']),
+                'specieId': rng.choice(ids['species']),
+                'organsystemIds': rng.sample(ids['organsystems'], rng.randint(1, 3)),
+                'tileserverId': rng.choice(ids['tileservers']),
+                'tags': [],
+                'deletedAt': None,
+            }
+
+    def explorations():
+        for i in range(counts['explorations']):
+            pk = section_id('explorations', i)
+            annotation_count, group_count = annotation_counts(seed, pk, mean_annotations)
+            yield {
+                'id': pk,
+                'title': f'{rng.choice(TISSUES)} - {rng.choice(STRUCTURES)}',
+                'isActive': rng.random() > 0.1,
+                'imageId': section_id('images', rng.randrange(n_images)),
+                'institutionId': rng.choice(ids['institutions']),
+                'annotationGroupCount': group_count,
+                'annotationCount': annotation_count,
+                'isExam': rng.random() < 0.1,
+                'eduId': str(rng.randint(1, 999)),
+                'tags': [],
+                'subjectIds': rng.sample(ids['subjects'], rng.randint(0, 1)),
+                'deletedAt': None,
+                'type': 'exploration',
+            }
+
+    def diagnoses():
+        for i in range(counts['diagnoses']):
+            yield {
+                'id': section_id('diagnoses', i),
+                'isActive': True,
+                'imageId': section_id('images', rng.randrange(n_images)),
+                'institutionId': rng.choice(ids['institutions']),
+                'isExam': rng.random() < 0.2,
+                'deletedAt': None,
+                'type': 'diagnosis',
+            }
+
+    def structure_searches():
+        for i in range(counts['structureSearches']):
+            count = rng.randint(1, 4)
+            yield {
+                'id': section_id('structureSearches', i),
+                'title': rng.choice(STRUCTURES),
+                'isActive': True,
+                'imageId': section_id('images', rng.randrange(n_images)),
+                'institutionId': rng.choice(ids['institutions']),
+                'isExam': rng.random() < 0.2,
+                'annotationGroupCount': count,
+                'annotationCount': count,
+                'tags': [],
+                'subjectIds': [],
+                'deletedAt': None,
+                'type': 'structure-search',
+            }
+
+    fp.write('{\n')
+    write_section(fp, 'organsystems', titled('organsystems', 'Organsystem'), first=True)
+    write_section(fp, 'species', titled('species', 'Spezies'))
+    write_section(fp, 'stainings', titled('stainings', 'Faerbung'))
+    write_section(fp, 'subjects', titled('subjects', 'Fach'))
+    fp.write(',\n"locales": ' + json.dumps({f'synthetic.key{i}': f'Text {i}' for i in range(counts['locales'])}))
+    write_section(fp, 'tileservers', tileservers())
+    write_section(fp, 'institutions', institutions())
+    write_section(fp, 'images', images())
+    write_section(fp, 'explorations', explorations())
+    write_section(fp, 'diagnoses', diagnoses())
+    write_section(fp, 'structureSearches', structure_searches())
+    fp.write(',\n"hash": ' + json.dumps(snapshot_hash or f'synthetic-{seed}-{scale}') + '\n}\n')
+
+
+def write_payloads(payload_dir, scale=1.0, seed=0, mean_annotations=20, mean_points=40):
+    """
+    Write the annotation payloads of every synthetic exploration.
+
+    Layout: <payload_dir>/<exploration id>/annotation.json and
+    annotation-group.json, mirroring the API paths. Returns the number of
+    explorations written.
+    """
+    counts = scaled_counts(scale)
+    for i in range(counts['explorations']):
+        pk = section_id('explorations', i)
+        annotations, groups = annotation_payloads(seed, pk, mean_annotations, mean_points)
+        directory = os.path.join(payload_dir, pk)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'annotation.json'), 'w', encoding='utf-8') as f:
+            json.dump(annotations, f)
+        with open(os.path.join(directory, 'annotation-group.json'), 'w', encoding='utf-8') as f:
+            json.dump(groups, f)
+    return counts['explorations']
@@ -1,3 +1,293 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+from datetime import timedelta
+from email.utils import format_datetime
+from django.core.management.color import no_style
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from mymi_data.importer import SnapshotImporter
+from mymi_data.jsonstream import iter_object, load_lazy
+from mymi_data.materialize import sync_annotations
+from mymi_data.models import CrawlState, Exploration, Image, ImportRecordDigest, Institution
+from mymi_data.ratelimit import RateLimiter, TokenBucket, parse_retry_after
+from mymi_data.recrawl import COUNT_MISMATCH, COUNTS_CHANGED, NEVER_CRAWLED, recrawl_queue
 
-# Create your tests here.
+
+class JsonStreamTests(SimpleTestCase):
+    document = (
+        ' { "hash": "abc", "count": 12.5, "images": [ 1 , 2.5e3 , -0.25E+2, 10, '
+        '{"id": "x", "size": 1024, "tags": ["a", "b"]}, true, null, "s" ] , "total": -17 } '
+    )
+
+    def test_load_lazy_with_single_byte_chunks(self):
+        text = json.dumps(json.loads(self.document)['images'], indent=1)
+        for chunk_size in (1, 2, 3, 7):
+            with self.subTest(chunk_size=chunk_size):
+                items = load_lazy(io.BytesIO(text.encode('utf-8')), chunk_size=chunk_size)
+                self.assertEqual(list(items), json.loads(text))
+
+    def test_iter_object_with_single_character_chunks(self):
+        for chunk_size in (1, 2, 3, 7):
+            with self.subTest(chunk_size=chunk_size):
+                members = {
+                    key: list(value) if key == 'images' else value
+                    for key, value in iter_object(io.StringIO(self.document), ('images',), chunk_size)
+                }
+                self.assertEqual(members, json.loads(self.document))
+
+
+class MaterializeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        institution = Institution.objects.create(id='inst', title='Institution')
+        image = Image.objects.create(
+            id='img', title='Image', checksum='0' * 32, size=1, file_path='img.svs', imaging_diagnostic='none'
+        )
+        cls.exploration = Exploration.objects.create(id='expl', title='Exploration', image=image, institution=institution)
+
+    def annotation(self, external_id, **data):
+        return {'id': external_id, 'annotationid': external_id, 'annotationname': f'A{external_id}', 'type': 3, **data}
+
+    def test_invalid_annotation_ids_skip_only_their_items(self):
+        messages = []
+        items = [
+            self.annotation(1),
+            {'id': 99, 'annotationid': 'x1'},
+            {'annotationname': 'no id'},
+            'not an object',
+            self.annotation(2),
+        ]
+        sync = sync_annotations(self.exploration, items, messages)
+        self.assertEqual(
+            sorted(self.exploration.annotations.values_list('annotationid', flat=True)), [1, 2]
+        )
+        self.assertEqual(sync.created, 2)
+        self.assertEqual(len(messages), 3)
+
+    def test_row_sync_counts_and_keeps_primary_keys(self):
+        sync = sync_annotations(self.exploration, [self.annotation(1), self.annotation(2), self.annotation(3)])
+        self.assertEqual((sync.created, sync.updated, sync.unchanged, sync.deleted), (3, 0, 0, 0))
+        pks = dict(self.exploration.annotations.values_list('external_id', 'pk'))
+
+        sync = sync_annotations(self.exploration, [self.annotation(1), self.annotation(2), self.annotation(3)])
+        self.assertEqual((sync.created, sync.updated, sync.unchanged, sync.deleted), (0, 0, 3, 0))
+
+        items = [self.annotation(1), self.annotation(2, annotationname='renamed'), self.annotation(4)]
+        sync = sync_annotations(self.exploration, items)
+        self.assertEqual((sync.created, sync.updated, sync.unchanged, sync.deleted), (1, 1, 1, 1))
+        rows = {row.external_id: row for row in self.exploration.annotations.all()}
+        self.assertEqual(sorted(rows), [1, 2, 4])
+        self.assertEqual((rows[1].pk, rows[2].pk), (pks[1], pks[2]))
+        self.assertEqual(rows[2].annotationname, 'renamed')
+
+    def test_row_sync_across_batches(self):
+        items = [self.annotation(external_id) for external_id in range(1, 8)]
+        sync = sync_annotations(self.exploration, iter(items), batch_size=3)
+        self.assertEqual(sync.created, 7)
+        sync = sync_annotations(self.exploration, iter(items[2:]), batch_size=3)
+        self.assertEqual((sync.created, sync.unchanged, sync.deleted), (0, 5, 2))
+
+    def test_row_sync_stores_a_duplicate_external_id_once(self):
+        items = [self.annotation(1), self.annotation(1, annotationname='duplicate'), self.annotation(2)]
+        sync = sync_annotations(self.exploration, items, batch_size=2)
+        self.assertEqual(sync.created, 2)
+        self.assertEqual(self.exploration.annotations.get(external_id=1).annotationname, 'A1')
+
+    def test_row_sync_replaces_unkeyed_rows(self):
+        unkeyed = {'annotationid': 7, 'annotationname': 'no external id', 'type': 3}
+        sync = sync_annotations(self.exploration, [self.annotation(1), unkeyed])
+        self.assertEqual(sync.created, 2)
+        old_pk = self.exploration.annotations.get(external_id=None).pk
+
+        sync = sync_annotations(self.exploration, [self.annotation(1), unkeyed])
+        self.assertEqual((sync.created, sync.unchanged, sync.deleted), (1, 1, 1))
+        self.assertNotEqual(self.exploration.annotations.get(external_id=None).pk, old_pk)
+
+    def test_recrawl_queue_order(self):
+        now = timezone.now()
+        specs = {
+            # id: (snapshot annotation count, crawled annotation count, stored annotations, last success)
+            'never-small': (1, None, 0, None),
+            'never-large': (5, None, 0, None),
+            'changed': (4, 2, 2, now),
+            'mismatch': (3, 3, 0, now - timedelta(days=2)),
+            'fresh-mismatch': (3, 3, 0, now),
+            'current': (2, 2, 2, now),
+        }
+        for exploration_id, (count, crawled, stored, last_success_at) in specs.items():
+            exploration = Exploration.objects.create(
+                id=exploration_id, title=exploration_id, image=self.exploration.image,
+                institution=self.exploration.institution, annotation_count=count,
+            )
+            CrawlState.objects.create(
+                exploration=exploration, last_success_at=last_success_at,
+                crawled_annotation_count=crawled, crawled_annotation_group_count=0 if crawled is not None else None,
+            )
+            sync_annotations(exploration, [self.annotation(i) for i in range(1, stored + 1)])
+
+        queue = recrawl_queue(Exploration.objects.filter(id__in=specs), mismatch_before=now - timedelta(days=1))
+        self.assertEqual(
+            [(exploration.id, reason) for exploration, reason in queue],
+            [
+                ('never-large', NEVER_CRAWLED),
+                ('never-small', NEVER_CRAWLED),
+                ('changed', COUNTS_CHANGED),
+                ('mismatch', COUNT_MISMATCH),
+            ],
+        )
+
+
+class SnapshotImporterTests(TestCase):
+    def importer(self):
+        self.output = io.StringIO()
+        return SnapshotImporter(self.output, no_style())
+
+    def test_is_current(self):
+        importer = self.importer()
+        self.assertFalse(importer.is_current('abc'))
+        importer.record_snapshot('abc')
+        self.assertTrue(importer.is_current('abc'))
+        self.assertFalse(importer.is_current('def'))
+        self.assertFalse(importer.is_current(None))
+        importer.record_snapshot('def')
+        self.assertFalse(importer.is_current('abc'))
+
+    def test_unchanged_records_are_skipped(self):
+        data = {
+            'stainings': [{'id': 'he', 'title': 'HE'}, {'id': 'pas', 'title': 'PAS'}],
+        }
+        self.importer().run(data)
+        self.assertEqual(ImportRecordDigest.objects.filter(section='stainings').count(), 2)
+
+        self.importer().run(data)
+        self.assertIn('Skipping 2 unchanged stainings', self.output.getvalue())
+
+        data['stainings'][1]['title'] = 'Periodic acid-Schiff'
+        self.importer().run(data)
+        self.assertIn('Skipping 1 unchanged stainings', self.output.getvalue())
+        self.assertIn('Imported 1 stainings', self.output.getvalue())
+
+    def test_records_with_missing_references_are_imported_again(self):
+        image = {
+            'id': 'img', 'title': 'Image', 'checksum': '0' * 32, 'size': 1, 'filePath': 'img.svs',
+            'imagingDiagnostic': 'none', 'stainingId': 'he',
+        }
+        self.importer().run({'images': [image]})
+        self.assertIsNone(Image.objects.get(id='img').staining_id)
+        self.assertFalse(ImportRecordDigest.objects.filter(section='images').exists())
+
+        self.importer().run({'stainings': [{'id': 'he', 'title': 'HE'}], 'images': [image]})
+        self.assertEqual(Image.objects.get(id='img').staining_id, 'he')
+
+        Image.objects.all().delete()
+        self.importer().run({'images': [image]})
+        self.assertTrue(Image.objects.filter(id='img').exists())
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2.0, burst=2.0)
+        now = bucket.updated
+        self.assertEqual(bucket.acquire(now), 0.0)
+        self.assertEqual(bucket.acquire(now), 0.0)
+        self.assertAlmostEqual(bucket.acquire(now), 0.5)
+        self.assertEqual(bucket.acquire(now + 0.5), 0.0)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=10.0, burst=10.0)
+        now = bucket.updated
+        bucket.pause(now, 3.0)
+        self.assertAlmostEqual(bucket.acquire(now), 3.1)
+        self.assertAlmostEqual(bucket.acquire(now + 3.0), 0.1)
+        self.assertEqual(bucket.acquire(now + 3.1), 0.0)
+
+
+class FakeResponse:
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+
+    def release(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    async def get(self, url, **kwargs):
+        self.requests += 1
+        return self.responses.pop(0)
+
+
+class RateLimiterTests(SimpleTestCase):
+    url = 'https://mymi.example/api'
+
+    def fetch(self, limiter, session):
+        async def get():
+            async with limiter.get_async(session, self.url) as response:
+                return response.status
+        return asyncio.run(get())
+
+    def rate(self, limiter):
+        return limiter.rates()['mymi.example']
+
+    def test_only_2xx_and_304_raise_the_rate(self):
+        limiter = RateLimiter(rate=4.0, max_rate=50.0, increase=1.0)
+        for status in (404, 500, 301):
+            self.assertEqual(self.fetch(limiter, FakeSession(FakeResponse(status))), status)
+        self.assertEqual(self.rate(limiter), 4.0)
+        for status in (200, 204, 304):
+            self.fetch(limiter, FakeSession(FakeResponse(status)))
+        self.assertEqual(self.rate(limiter), 7.0)
+
+    def test_rate_is_capped(self):
+        limiter = RateLimiter(rate=4.0, max_rate=5.0, increase=1.0)
+        for _ in range(3):
+            limiter.succeeded(self.url)
+        self.assertEqual(self.rate(limiter), 5.0)
+
+    def test_throttling_cuts_the_rate_once_per_burst_and_ends_slow_start(self):
+        limiter = RateLimiter(rate=10.0, decrease=0.5, increase=1.0)
+        limiter.throttled(self.url, 0, '0')
+        limiter.throttled(self.url, 0, '0')
+        self.assertEqual(self.rate(limiter), 5.0)
+        self.assertEqual(limiter.throttled_count, 2)
+        limiter.succeeded(self.url)
+        self.assertAlmostEqual(self.rate(limiter), 5.2)
+
+    def test_retry_after_pauses_the_host(self):
+        limiter = RateLimiter(rate=10.0, max_backoff=60.0)
+        self.assertEqual(limiter.throttled(self.url, 0, '7'), 7.0)
+        self.assertGreaterEqual(limiter.acquire(self.url), 6.9)
+        self.assertEqual(limiter.throttled(self.url, 0, '600'), 60.0)
+
+    def test_backoff_without_retry_after(self):
+        limiter = RateLimiter(backoff=1.0, max_backoff=60.0)
+        for attempt, ceiling in ((0, 1.0), (3, 8.0), (10, 60.0)):
+            delay = limiter.throttled(self.url, attempt)
+            self.assertGreaterEqual(delay, ceiling / 2)
+            self.assertLessEqual(delay, ceiling)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('12'), 12.0)
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+        when = format_datetime(timezone.now() + timedelta(seconds=30), usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(when), 30, delta=2)
+
+    def test_throttled_requests_are_retried(self):
+        limiter = RateLimiter(rate=100.0, max_retries=2)
+        session = FakeSession(
+            FakeResponse(503, {'Retry-After': '0'}), FakeResponse(429, {'Retry-After': '0'}), FakeResponse(200)
+        )
+        self.assertEqual(self.fetch(limiter, session), 200)
+        self.assertEqual((session.requests, limiter.retry_count, limiter.throttled_count), (3, 2, 2))
+
+    def test_last_throttled_response_is_returned_after_max_retries(self):
+        limiter = RateLimiter(rate=100.0, max_retries=1)
+        session = FakeSession(FakeResponse(503, {'Retry-After': '0'}), FakeResponse(503, {'Retry-After': '0'}))
+        self.assertEqual(self.fetch(limiter, session), 503)
+        self.assertEqual((session.requests, limiter.retry_count), (2, 1))
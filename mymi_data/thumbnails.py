@@ -0,0 +1,195 @@
+import hashlib
+import io
+import math
+import os
+import tempfile
+import time
+from collections import namedtuple
+from PIL import Image, features
+from mymi_data.crawler import STREAM_CHUNK_SIZE, FetchError
+from mymi_data.storage import place_file
+
+
+PARTIAL_SUFFIX = '.part'
+# Partial files older than this are left over from killed runs
+PARTIAL_MAX_AGE = 3600
+
+# Bounding boxes of the sizes derived from the large thumbnail; the admin shows them at up to 300x200 and 80x50
+DERIVED_SIZES = {
+    'medium': (320, 240),
+    'small': (160, 120),
+}
+# Cell size of the small thumbnails packed into atlases, as large as the changelist preview
+ATLAS_TILE = (80, 50)
+# Pillow format, file extension and encoder options of the formats derived thumbnails can be written in
+THUMBNAIL_FORMATS = {
+    'jpeg': ('JPEG', '.jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', '.webp', {'quality': 80, 'method': 6}),
+    'avif': ('AVIF', '.avif', {'quality': 60, 'speed': 6}),
+}
+
+# Outcome of a download; name, size and digest are None if the server answered 304 Not Modified
+Download = namedtuple('Download', ['status', 'name', 'size', 'digest', 'etag', 'last_modified'])
+
+
+async def download_file(session, limiter, url, directory, headers=None):
+    """
+    Stream the image at `url` into `directory` through `limiter`; returns a Download.
+
+    The body is written in chunks to a temporary file and moved to its
+    content-addressed name (see mymi_data.storage) once complete, so no
+    stored file is ever left truncated. Its name relative to `directory`
+    is returned. With conditional `headers` a 304 response stores nothing.
+    Raises FetchError for responses that are not images.
+    """
+    async with limiter.get_async(session, url, headers=headers or {}) as response:
+        etag, last_modified = response.headers.get('ETag', ''), response.headers.get('Last-Modified', '')
+        if response.status == 304 and headers:
+            return Download(304, None, None, None, etag, last_modified)
+        if response.status != 200:
+            raise FetchError(f'HTTP {response.status}', response.status)
+        content_type = response.headers.get('Content-Type', '')
+        # If we get HTML instead of image, it's probably a login/error page
+        if 'text/html' in content_type:
+            raise FetchError('Got HTML response - check authentication', response.status)
+        if 'image' not in content_type and not url.endswith(('.jpg', '.jpeg', '.png')):
+            raise FetchError(f'Invalid content type: {content_type}', response.status)
+
+        filename = url.rsplit('/', 1)[-1]
+        fd, partial_path = tempfile.mkstemp(dir=directory, prefix=f'.{filename}.', suffix=PARTIAL_SUFFIX)
+        try:
+            size = 0
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            name = place_file(directory, partial_path, digest.hexdigest(), os.path.splitext(filename)[1])
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.unlink(partial_path)
+            raise
+    return Download(200, name, size, digest.hexdigest(), etag, last_modified)
+
+
+def file_digest(path):
+    """SHA-256 of the file at `path`"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(STREAM_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_directory(directory):
+    """Map the names of the files in and below `directory` to (size, modification time), in a single tree walk"""
+    files = {}
+    for root, _, filenames in os.walk(directory):
+        prefix = os.path.relpath(root, directory).replace(os.sep, '/')
+        for filename in filenames:
+            if not filename.endswith(PARTIAL_SUFFIX):
+                stat = os.stat(os.path.join(root, filename))
+                files[filename if prefix == '.' else f'{prefix}/{filename}'] = (stat.st_size, stat.st_mtime)
+    return files
+
+
+def check_format(image_format):
+    """Raise ImportError if thumbnails cannot be written in `image_format` with the installed Pillow"""
+    if image_format == 'avif':
+        try:
+            import pillow_avif  # noqa: F401 - registers the AVIF plugin
+        except ImportError:
+            raise ImportError('Writing AVIF thumbnails requires the pillow-avif-plugin package')
+    elif image_format == 'webp' and not features.check('webp'):
+        raise ImportError('Writing WebP thumbnails requires Pillow built with libwebp')
+
+
+def render_derivatives(source_path, boxes, image_format, directory):
+    """
+    Scale the image at `source_path` down to each of the bounding `boxes`, storing the results in `directory`.
+
+    Meant to run in a worker process. JPEG sources are decoded at the
+    smallest scale still covering the largest box, and every result is
+    stored atomically under its content-addressed name like a download.
+    Returns (name, size, SHA-256) per box.
+    """
+    if image_format == 'avif':
+        import pillow_avif  # noqa: F401 - registers the AVIF plugin in this process
+    format_name, extension, options = THUMBNAIL_FORMATS[image_format]
+    results = []
+    with Image.open(source_path) as source:
+        source.draft('RGB', tuple(max(box[i] for box in boxes) for i in (0, 1)))
+        source.load()
+        if source.mode not in ('RGB', 'L'):
+            source = source.convert('RGB')
+        for box in boxes:
+            image = source.copy()
+            image.thumbnail(box, Image.Resampling.LANCZOS, reducing_gap=3.0)
+            output = io.BytesIO()
+            image.save(output, format_name, **options)
+            results.append(store_bytes(directory, output.getvalue(), extension))
+    return results
+
+
+def render_atlas(sources, tile, columns, image_format, directory):
+    """
+    Pack the images at the paths `sources` into one atlas image stored in `directory`.
+
+    Meant to run in a worker process. Each image is scaled to fit a cell of
+    size `tile`, filling `columns` cells per row. Returns (name, width,
+    height, offsets) with the (x, y, width, height) of every source in the
+    atlas, or None for sources that could not be read.
+    """
+    if image_format == 'avif':
+        import pillow_avif  # noqa: F401 - registers the AVIF plugin in this process
+    format_name, extension, options = THUMBNAIL_FORMATS[image_format]
+    columns = max(1, min(columns, len(sources)))
+    atlas = Image.new('RGB', (columns * tile[0], math.ceil(len(sources) / columns) * tile[1]), 'white')
+    offsets = []
+    for i, path in enumerate(sources):
+        try:
+            with Image.open(path) as image:
+                image.draft('RGB', tile)
+                image = image.convert('RGB')
+        except (OSError, ValueError):
+            offsets.append(None)
+            continue
+        image.thumbnail(tile, Image.Resampling.LANCZOS)
+        x, y = i % columns * tile[0], i // columns * tile[1]
+        atlas.paste(image, (x, y))
+        offsets.append((x, y, image.width, image.height))
+    output = io.BytesIO()
+    atlas.save(output, format_name, **options)
+    name, _, _ = store_bytes(directory, output.getvalue(), extension, 'atlases')
+    return name, atlas.width, atlas.height, offsets
+
+
+def store_bytes(directory, body, extension, subdirectory=''):
+    """Store `body` atomically under its content-addressed name in `directory`; returns (name, size, SHA-256)"""
+    digest = hashlib.sha256(body).hexdigest()
+    fd, partial_path = tempfile.mkstemp(dir=directory, prefix='.rendered.', suffix=PARTIAL_SUFFIX)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        name = place_file(directory, partial_path, digest, extension, subdirectory)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        raise
+    return name, len(body), digest
+
+
+def remove_partial_files(directory, max_age=PARTIAL_MAX_AGE):
+    """Delete temporary files of downloads that were killed; returns their number"""
+    removed = 0
+    cutoff = time.time() - max_age
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') and entry.name.endswith(PARTIAL_SUFFIX) and entry.stat().st_mtime < cutoff:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+    return removed
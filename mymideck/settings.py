@@ -93,6 +93,9 @@ DATABASES = {
     }
 }
 
+# Name of a separate database on the same server for the benchmark_mymi command, which empties it on every run
+MYMI_BENCHMARK_DB = config('MYMI_BENCHMARK_DB', default='')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators